@@ -0,0 +1,143 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, timedelta
+from itertools import islice
+from file_manifest import MANIFEST_DDL, MANIFEST_TABLE_NAME, complete_filename
+from metadata_schema import connect_database, connect_read_only
+from benchmark_metadata_layout import GOES_PRODUCTS
+
+TYPED_LENGTHS = [1, 4, 8, 12, 16, 24, 40]     #lengths of the typed text the lookups are timed at
+
+def synthetic_files(files, stations, products):
+
+    """Function generates FILES rows shaped like the manifest of both buckets, in the folder order a scrape writes
+    them: NEXRAD volume scans every 5 minutes per station and GOES scans every 5 minutes per product, alternating day
+    by day from 2000 on, until the given number of files.
+    -----
+    Input parameters:
+    files : int
+        number of files to generate
+    stations : int
+        number of NEXRAD stations
+    products : int
+        number of GOES products
+    -----
+    Returns:
+    A generator of (dataset, bucket, prefix, filename) tuples
+    """
+
+    station_codes = ['K' + chr(65 + number // 676) + chr(65 + number // 26 % 26) + chr(65 + number % 26) for number in range(stations)]
+    generated, day_number = 0, 0
+    while True:
+        scan_date = date(2000, 1, 1) + timedelta(days=day_number)
+        year, month, day_of_month, day = scan_date.year, scan_date.month, scan_date.day, scan_date.timetuple().tm_yday
+        for station in station_codes:
+            prefix = format(year, '04d') + '/' + format(month, '02d') + '/' + format(day_of_month, '02d') + '/' + station + '/'
+            for minute in range(0, 1440, 5):
+                yield ('NEXRAD', 'noaa-nexrad-level2', prefix, station + format(year, '04d') + format(month, '02d') + format(day_of_month, '02d') + '_' +
+                       format(minute // 60, '02d') + format(minute % 60, '02d') + '00_V06')
+                generated += 1
+                if generated == files:
+                    return
+        for product in GOES_PRODUCTS[:products]:
+            for hour in range(24):
+                prefix = product + '/' + format(year, '04d') + '/' + format(day, '03d') + '/' + format(hour, '02d') + '/'
+                for minute in range(0, 60, 5):
+                    start = format(year, '04d') + format(day, '03d') + format(hour, '02d') + format(minute, '02d') + '172'
+                    yield ('GOES', 'noaa-goes18', prefix, 'OR_' + product + '-M6C01_G18_s' + start + '_e' + start + '_c' + start + '4.nc')
+                    generated += 1
+                    if generated == files:
+                        return
+        day_number += 1
+
+def build_manifest(database_file_path, files, stations, products):
+
+    """Function builds a database holding only a FILES table of synthetic rows, with the manifest's indexes created
+    after the load.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the database file to create
+    files : int
+        number of files
+    stations : int
+        number of NEXRAD stations
+    products : int
+        number of GOES products
+    -----
+    Returns:
+    The size of the database file in bytes
+    """
+
+    if os.path.exists(database_file_path):
+        os.remove(database_file_path)
+    db_conn = connect_database(database_file_path, 'write')
+    db_conn.execute(MANIFEST_DDL.split(';')[0])    #the table alone, the indexes are built once the rows are in
+    rows = synthetic_files(files, stations, products)
+    while True:
+        batch = list(islice(rows, 100000))
+        if not batch:
+            break
+        with db_conn:
+            db_conn.executemany("INSERT INTO " + MANIFEST_TABLE_NAME + " (dataset, bucket, prefix, filename) VALUES (?, ?, ?, ?)", batch)
+    db_conn.executescript(MANIFEST_DDL)
+    db_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db_conn.close()
+    return os.path.getsize(database_file_path)
+
+def sample_names(database_file_path, count, seed):
+
+    """Function picks file names of the manifest at random, to type the beginnings of.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the manifest database
+    count : int
+        number of names
+    seed : int
+        seed of the random picks
+    -----
+    Returns:
+    A list of (dataset, filename) tuples
+    """
+
+    db_conn = connect_read_only(database_file_path)
+    highest_id = db_conn.execute("SELECT MAX(id) FROM " + MANIFEST_TABLE_NAME).fetchone()[0]
+    picker = random.Random(seed)
+    names = [db_conn.execute("SELECT dataset, filename FROM " + MANIFEST_TABLE_NAME + " WHERE id = ?", (picker.randint(1, highest_id),)).fetchone()
+             for _ in range(count)]
+    db_conn.close()
+    return names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the filename completion of the file manifest")
+    parser.add_argument('--files', type=int, default=20000000, help="number of files in the synthetic manifest")
+    parser.add_argument('--stations', type=int, default=160, help="number of NEXRAD stations")
+    parser.add_argument('--products', type=int, default=len(GOES_PRODUCTS), help="number of GOES products")
+    parser.add_argument('--lookups', type=int, default=2000, help="number of timed lookups per typed length")
+    parser.add_argument('--directory', help="directory for the benchmark database, a temporary one when not given")
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp()
+    os.makedirs(directory, exist_ok=True)
+    database_file_path = os.path.join(directory, 'manifest.db')
+    start_time = time.perf_counter()
+    size = build_manifest(database_file_path, args.files, args.stations, args.products)
+    print("files: " + str(args.files) + ", " + format(size / 1e6, '.0f') + " MB, built in " + format(time.perf_counter() - start_time, '.0f') + " s")
+
+    names = sample_names(database_file_path, args.lookups, 0)
+    db_conn = connect_read_only(database_file_path)
+    print("typed".ljust(8) + "p50".rjust(10) + "p99".rjust(10) + "max".rjust(10) + "  (ms)")
+    for length in TYPED_LENGTHS:
+        latencies = []
+        for dataset, filename in names:
+            start_time = time.perf_counter()
+            complete_filename(db_conn, dataset, filename[:length])
+            latencies.append((time.perf_counter() - start_time) * 1e3)
+        latencies.sort()
+        print(str(length).ljust(8) + "".join(format(latency, '.3f').rjust(10)
+                                             for latency in (latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100], latencies[-1])))
+    db_conn.close()
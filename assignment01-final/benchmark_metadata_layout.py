@@ -0,0 +1,150 @@
+import os
+import time
+import argparse
+import tempfile
+from metadata_schema import connect_database, split_ddl, read_ddl_script
+
+#the layouts the metadata tables have had: all-text tables as pandas created them, typed wide tables with a folder
+#index, and the normalized tables and views of the DDL scripts
+WIDE_LAYOUTS = {
+    'text': ("CREATE TABLE NEXRAD_METADATA(id number, year text, month text, day text, ground_station text);"
+             "CREATE TABLE GOES_METADATA(id number, product text, year text, day text, hour text);"),
+    'wide': ("CREATE TABLE NEXRAD_METADATA(id INTEGER PRIMARY KEY, year INTEGER NOT NULL, month INTEGER NOT NULL, day INTEGER NOT NULL, ground_station TEXT NOT NULL);"
+             "CREATE INDEX NEXRAD_METADATA_FOLDER ON NEXRAD_METADATA(year, month, day, ground_station);"
+             "CREATE TABLE GOES_METADATA(id INTEGER PRIMARY KEY, product TEXT NOT NULL, year INTEGER NOT NULL, day INTEGER NOT NULL, hour INTEGER NOT NULL);"
+             "CREATE INDEX GOES_METADATA_FOLDER ON GOES_METADATA(product, year, day, hour);")
+}
+GOES_PRODUCTS = ['ABI-L1b-RadC', 'ABI-L1b-RadF', 'ABI-L1b-RadM', 'ABI-L2-ACHAC', 'ABI-L2-ACHAF', 'ABI-L2-ACHAM', 'ABI-L2-ACMC',
+                 'ABI-L2-ACMF', 'ABI-L2-ACMM', 'ABI-L2-CMIPC', 'ABI-L2-CMIPF', 'ABI-L2-CMIPM', 'ABI-L2-MCMIPC', 'ABI-L2-MCMIPF',
+                 'ABI-L2-MCMIPM', 'ABI-L2-RRQPEF', 'ABI-L2-SSTF', 'GLM-L2-LCFA', 'SUVI-L1b-Fe093', 'SEIS-L1b-SGPS']
+
+#the queries behind the dropdowns of the app, as query_metadata_database runs them
+DROPDOWN_QUERIES = [
+    ('goes products', "SELECT DISTINCT product FROM GOES_METADATA", ()),
+    ('goes years', "SELECT DISTINCT printf('%04d', year) AS year FROM GOES_METADATA WHERE product = ?", ('ABI-L2-CMIPF',)),
+    ('goes days', "SELECT DISTINCT printf('%03d', day) AS day FROM GOES_METADATA WHERE year = ? AND product = ?", ('2023', 'ABI-L2-CMIPF')),
+    ('goes hours', "SELECT DISTINCT printf('%02d', hour) AS hour FROM GOES_METADATA WHERE day = ? AND year = ? AND product = ?", ('150', '2023', 'ABI-L2-CMIPF')),
+    ('nexrad years', "SELECT DISTINCT printf('%04d', year) AS year FROM NEXRAD_METADATA", ()),
+    ('nexrad months', "SELECT DISTINCT printf('%02d', month) AS month FROM NEXRAD_METADATA WHERE year = ?", ('2010',)),
+    ('nexrad days', "SELECT DISTINCT printf('%02d', day) AS day FROM NEXRAD_METADATA WHERE month = ? AND year = ?", ('06', '2010')),
+    ('nexrad stations', "SELECT DISTINCT ground_station FROM NEXRAD_METADATA WHERE day = ? AND month = ? AND year = ?", ('15', '06', '2010')),
+]
+
+def synthetic_rows(first_year, last_year, stations, products):
+
+    """Function generates folder rows shaped like a full scrape of both buckets: every station for the first 28 days
+    of every month of the NEXRAD years, and every hour of every day of the last two years for the GOES products.
+    -----
+    Input parameters:
+    first_year : int
+        first NEXRAD year
+    last_year : int
+        last NEXRAD and GOES year
+    stations : int
+        number of NEXRAD stations per day
+    products : int
+        number of GOES products
+    -----
+    Returns:
+    nexrad_rows : list
+        (id, year, month, day, ground_station) tuples with the folder names as strings
+    goes_rows : list
+        (id, product, year, day, hour) tuples with the folder names as strings
+    """
+
+    station_codes = ['K' + chr(65 + number // 676) + chr(65 + number // 26 % 26) + chr(65 + number % 26) for number in range(stations)]
+    nexrad_rows = [(0, format(year, '04d'), format(month, '02d'), format(day, '02d'), station)
+                   for year in range(first_year, last_year + 1) for month in range(1, 13) for day in range(1, 29) for station in station_codes]
+    goes_rows = [(0, product, format(year, '04d'), format(day, '03d'), format(hour, '02d'))
+                 for product in GOES_PRODUCTS[:products] for year in range(last_year - 1, last_year + 1) for day in range(1, 366) for hour in range(24)]
+    return ([(number + 1,) + row[1:] for number, row in enumerate(nexrad_rows)],
+            [(number + 1,) + row[1:] for number, row in enumerate(goes_rows)])
+
+def build_database(database_file_path, layout, nexrad_rows, goes_rows):
+
+    """Function builds a metadata database with one of the layouts and loads the rows into it.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the database file to create
+    layout : str
+        'text', 'wide' or 'normalized'
+    nexrad_rows : list
+        NEXRAD rows from synthetic_rows
+    goes_rows : list
+        GOES rows from synthetic_rows
+    -----
+    Returns:
+    The size of the database file in bytes, after a VACUUM
+    """
+
+    if os.path.exists(database_file_path):
+        os.remove(database_file_path)
+    db_conn = connect_database(database_file_path, 'write')
+    if layout == 'normalized':
+        scripts = [read_ddl_script('sql_script_nexrad.sql'), read_ddl_script('sql_script_goes18.sql')]
+    else:
+        scripts = [WIDE_LAYOUTS[layout]]
+    statements = [statement for script in scripts for statement in sum(split_ddl(script), [])]
+    for statement in statements:
+        db_conn.execute(statement)
+    with db_conn:
+        db_conn.executemany("INSERT INTO NEXRAD_METADATA (id, year, month, day, ground_station) VALUES (?, ?, ?, ?, ?)", nexrad_rows)
+        db_conn.executemany("INSERT INTO GOES_METADATA (id, product, year, day, hour) VALUES (?, ?, ?, ?, ?)", goes_rows)
+    db_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db_conn.execute("VACUUM")
+    db_conn.close()
+    return os.path.getsize(database_file_path)
+
+def time_query(db_conn, query, parameters, repeat):
+
+    """Function times a query over several runs.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        read connection to the database
+    query : str
+        query to run
+    parameters : tuple
+        parameters of the query
+    repeat : int
+        number of runs
+    -----
+    Returns:
+    The best run time in milliseconds
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        db_conn.execute(query, parameters).fetchall()
+        best = min(best, time.perf_counter() - start_time)
+    return best * 1e3
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the size and dropdown query latency of the metadata table layouts")
+    parser.add_argument('--first-year', type=int, default=1991, help="first NEXRAD year of the synthetic archive")
+    parser.add_argument('--last-year', type=int, default=2023, help="last NEXRAD and GOES year of the synthetic archive")
+    parser.add_argument('--stations', type=int, default=160, help="NEXRAD stations per day")
+    parser.add_argument('--products', type=int, default=len(GOES_PRODUCTS), help="number of GOES products")
+    parser.add_argument('--repeat', type=int, default=5, help="number of timed runs per query, the best one is reported")
+    parser.add_argument('--directory', help="directory for the benchmark databases, a temporary one when not given")
+    args = parser.parse_args()
+
+    nexrad_rows, goes_rows = synthetic_rows(args.first_year, args.last_year, args.stations, args.products)
+    print("rows: NEXRAD " + str(len(nexrad_rows)) + ", GOES " + str(len(goes_rows)))
+    directory = args.directory or tempfile.mkdtemp()
+    os.makedirs(directory, exist_ok=True)
+    latencies = {}
+    for layout in ('text', 'wide', 'normalized'):
+        database_file_path = os.path.join(directory, 'metadata_' + layout + '.db')
+        start_time = time.perf_counter()
+        size = build_database(database_file_path, layout, nexrad_rows, goes_rows)
+        print(layout.ljust(10) + ": " + format(size / 1e6, '.1f') + " MB, loaded in " + format(time.perf_counter() - start_time, '.1f') + " s")
+        db_conn = connect_database(database_file_path, 'read')
+        latencies[layout] = [time_query(db_conn, query, parameters, args.repeat) for _, query, parameters in DROPDOWN_QUERIES]
+        db_conn.close()
+
+    print("query".ljust(16) + "".join(layout.rjust(12) for layout in latencies) + "  (ms)")
+    for number, (name, _, _) in enumerate(DROPDOWN_QUERIES):
+        print(name.ljust(16) + "".join(format(latencies[layout][number], '.2f').rjust(12) for layout in latencies))
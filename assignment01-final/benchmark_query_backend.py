@@ -0,0 +1,70 @@
+import os
+import time
+import argparse
+import tempfile
+from metadata_parquet import write_parquet_snapshot
+from query_backend import SQLiteBackend, DuckDBBackend
+from benchmark_metadata_layout import synthetic_rows, build_database, DROPDOWN_QUERIES, GOES_PRODUCTS
+
+#the app's dropdown queries, plus the range and aggregate queries of the analytics over the metadata
+QUERY_MIX = DROPDOWN_QUERIES + [
+    ('nexrad decade', "SELECT ground_station, COUNT(*) AS folders FROM NEXRAD_METADATA WHERE year BETWEEN ? AND ? GROUP BY ground_station", (2000, 2009)),
+    ('nexrad per year', "SELECT year, COUNT(DISTINCT ground_station) AS stations FROM NEXRAD_METADATA GROUP BY year ORDER BY year", ()),
+    ('goes per product', "SELECT product, year, COUNT(*) AS folders FROM GOES_METADATA GROUP BY product, year ORDER BY product, year", ()),
+]
+
+def time_backend_query(backend, query, parameters, repeat):
+
+    """Function times a query on a backend over several runs.
+    -----
+    Input parameters:
+    backend : SQLiteBackend or DuckDBBackend
+        backend to run the query on
+    query : str
+        query to run
+    parameters : tuple
+        parameters of the query
+    repeat : int
+        number of runs
+    -----
+    Returns:
+    The best run time in milliseconds
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        backend.read_query(query, parameters)
+        best = min(best, time.perf_counter() - start_time)
+    return best * 1e3
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite and DuckDB query backends on the app's query mix")
+    parser.add_argument('--first-year', type=int, default=1991, help="first NEXRAD year of the synthetic archive")
+    parser.add_argument('--last-year', type=int, default=2023, help="last NEXRAD and GOES year of the synthetic archive")
+    parser.add_argument('--stations', type=int, default=160, help="NEXRAD stations per day")
+    parser.add_argument('--products', type=int, default=len(GOES_PRODUCTS), help="number of GOES products")
+    parser.add_argument('--repeat', type=int, default=5, help="number of timed runs per query, the best one is reported")
+    parser.add_argument('--directory', help="directory for the benchmark database and snapshot, a temporary one when not given")
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp()
+    os.makedirs(directory, exist_ok=True)
+    database_file_path = os.path.join(directory, 'metadata_normalized.db')
+    nexrad_rows, goes_rows = synthetic_rows(args.first_year, args.last_year, args.stations, args.products)
+    build_database(database_file_path, 'normalized', nexrad_rows, goes_rows)
+    parquet_directory = os.path.join(directory, 'parquet')
+    for table_name in ('GOES_METADATA', 'NEXRAD_METADATA'):
+        write_parquet_snapshot(database_file_path, table_name, parquet_directory)
+    print("rows: NEXRAD " + str(len(nexrad_rows)) + ", GOES " + str(len(goes_rows)))
+
+    backends = {'sqlite': SQLiteBackend(database_file_path), 'duckdb parquet': DuckDBBackend(database_file_path, parquet_directory)}
+    try:
+        backends['duckdb sqlite'] = DuckDBBackend(database_file_path, source='sqlite')
+    except RuntimeError as error:   #the sqlite extension is downloaded by DuckDB on first use
+        print("duckdb sqlite skipped: " + str(error))
+
+    latencies = {name: [time_backend_query(backend, query, parameters, args.repeat) for _, query, parameters in QUERY_MIX] for name, backend in backends.items()}
+    print("query".ljust(18) + "".join(name.rjust(16) for name in latencies) + "  (ms)")
+    for number, (name, _, _) in enumerate(QUERY_MIX):
+        print(name.ljust(18) + "".join(format(latencies[backend][number], '.2f').rjust(16) for backend in latencies))
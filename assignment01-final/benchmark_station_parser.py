@@ -0,0 +1,106 @@
+import re
+import time
+import argparse
+from http_cache import fetch_cached
+from scraper_mapdata import parse_homr_stations, select_stations
+
+STATIONS_URL = "https://www.ncei.noaa.gov/access/homr/file/nexrad-stations.txt"
+
+def legacy_parse(text):
+
+    """Function parses nexrad-stations.txt the way scrape_nexrad_locations used to: tokenising every line, keeping the
+    US NEXRAD lines and matching state/county and latitude/longitude/elevation with regular expressions in two passes.
+    Kept here only as the benchmark baseline.
+    -----
+    Input parameters:
+    text : str
+        content of nexrad-stations.txt
+    -----
+    Returns:
+    A dict of column lists
+    """
+
+    nexrad = []
+    satellite_metadata = {'id': [], 'ground_station': [], 'state': [], 'county': [], 'latitude': [], 'longitude': [], 'elevation': []}
+    for line in text.split('\n'):
+        line = line.strip()
+        if line.split(" ")[-1].upper() == 'NEXRAD':
+            nexrad.append(line)
+    nexrad = [i for i in nexrad if 'UNITED STATES' in i]
+
+    id = 0
+    for satellite in nexrad:
+        id += 1
+        satellite = [i.strip() for i in satellite.split("  ") if i != ""]
+        satellite_metadata['id'].append(id)
+        satellite_metadata['ground_station'].append(satellite[0].split(" ")[1])
+        for i in range(len(satellite)):
+            if re.match(r'\b[A-Z][A-Z]\b', satellite[i].strip()):
+                satellite_metadata['state'].append(satellite[i][:2])
+                satellite_metadata['county'].append(satellite[i][2:])
+
+    for satellite in nexrad:
+        satellite = [i.strip() for i in satellite.split(" ") if i != ""]
+        for i in range(len(satellite)):
+            if re.match(r'^-?[0-9]\d(\.\d+)?$', satellite[i]):
+                satellite_metadata['latitude'].append(satellite[i])
+                satellite_metadata['longitude'].append(satellite[i + 1])
+                satellite_metadata['elevation'].append(int(satellite[i + 2]))
+                break
+    return satellite_metadata
+
+def fixed_width_parse(text):
+
+    """Function parses nexrad-stations.txt with the single-pass fixed-width parser, keeping the US NEXRAD stations.
+    -----
+    Input parameters:
+    text : str
+        content of nexrad-stations.txt
+    -----
+    Returns:
+    A DataFrame of the selected stations
+    """
+
+    return select_stations(parse_homr_stations(text))
+
+def time_parser(parser, text, repeat):
+
+    """Function times a parser over several runs.
+    -----
+    Input parameters:
+    parser : function
+        parser taking the file content
+    text : str
+        content of nexrad-stations.txt
+    repeat : int
+        number of runs
+    -----
+    Returns:
+    The best run time in milliseconds
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        parser(text)
+        best = min(best, time.perf_counter() - start_time)
+    return best * 1e3
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the fixed-width station parser against the legacy regex parser")
+    parser.add_argument('--file', help="local copy of nexrad-stations.txt, fetched through the HTTP cache when not given")
+    parser.add_argument('--copies', type=int, default=1, help="repeat the station lines this many times to benchmark a larger input")
+    parser.add_argument('--repeat', type=int, default=20, help="number of timed runs per parser, the best one is reported")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'r') as stations_file:
+            text = stations_file.read()
+    else:
+        text = fetch_cached(STATIONS_URL)[0]
+    header, stations = text.split('\n', 2)[:2], text.split('\n', 2)[2]
+    text = '\n'.join(header) + '\n' + stations * args.copies
+
+    print("stations kept: legacy " + str(len(legacy_parse(text)['id'])) + ", fixed-width " + str(len(fixed_width_parse(text))))
+    for name, parse in (('legacy regex', legacy_parse), ('fixed-width', fixed_width_parse)):
+        print(name.ljust(14) + ": " + format(time_parser(parse, text, args.repeat), '.2f') + " ms")
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+CHECKPOINT_TABLE_NAME = 'SCRAPE_CHECKPOINT'     #table holding the progress of scrapes that have not finished yet
+CHECKPOINT_TABLE_DDL = ("CREATE TABLE IF NOT EXISTS " + CHECKPOINT_TABLE_NAME +
+                        " (dataset TEXT PRIMARY KEY, last_key TEXT, rows_written INTEGER, started_at TEXT, updated_at TEXT)")
+
+def write_checkpoint(db_conn, dataset, last_key, rows_written, started_at):
+
+    """Function records how far a running scrape has got: the last folder whose row has been written. It is meant to
+    be written inside the same transaction as the batch of rows it describes, so the checkpoint never runs ahead of
+    the stored rows. The caller commits.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the metadata database
+    dataset : str
+        name of the scraped dataset, e.g. GOES_METADATA or NEXRAD_METADATA
+    last_key : tuple
+        folder names of the last row written; rows come in sorted order, so every folder before it is finished
+    rows_written : int
+        number of rows written so far by the scrape
+    started_at : str
+        ISO timestamp of the start of the scrape
+    -----
+    Returns:
+    Nothing
+    """
+
+    db_conn.execute(CHECKPOINT_TABLE_DDL)
+    db_conn.execute("INSERT OR REPLACE INTO " + CHECKPOINT_TABLE_NAME + " (dataset, last_key, rows_written, started_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (dataset, '/'.join(last_key), rows_written, started_at, datetime.now(timezone.utc).isoformat(timespec='seconds')))
+
+def read_checkpoint(db_conn, dataset):
+
+    """Function reads the checkpoint left behind by a scrape of a dataset that did not finish.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the metadata database
+    dataset : str
+        name of the scraped dataset, e.g. GOES_METADATA or NEXRAD_METADATA
+    -----
+    Returns:
+    A dict with the last key (tuple), rows written and start time of the interrupted scrape, or None if there is none
+    """
+
+    db_conn.execute(CHECKPOINT_TABLE_DDL)
+    row = db_conn.execute("SELECT last_key, rows_written, started_at FROM " + CHECKPOINT_TABLE_NAME + " WHERE dataset = ?", (dataset,)).fetchone()
+    if row is None or not row[0]:
+        return None
+    return {'last_key': tuple(row[0].split('/')), 'rows_written': row[1], 'started_at': row[2]}
+
+def clear_checkpoint(db_conn, dataset):
+
+    """Function removes the checkpoint of a dataset once its scrape has finished. The caller commits.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the metadata database
+    dataset : str
+        name of the scraped dataset
+    -----
+    Returns:
+    Nothing
+    """
+
+    db_conn.execute(CHECKPOINT_TABLE_DDL)
+    db_conn.execute("DELETE FROM " + CHECKPOINT_TABLE_NAME + " WHERE dataset = ?", (dataset,))
@@ -2,6 +2,10 @@ import os
 import boto3
 import time
 from dotenv import load_dotenv
+from file_manifest import list_files_from_manifest
+from s3_crawler import list_objects_under
+from s3_concurrency import governed, NO_RETRIES_CONFIG
+from query_metadata_database import database_file_path
 
 #load env variables
 load_dotenv()
@@ -9,7 +13,8 @@ load_dotenv()
 def list_files_in_goes18_bucket(user_product, user_year, user_day, user_hour):
 
     """Function traverses through the specified GOES-18 S3 folder based on the inputs given. The file names are appended 
-    to a list. Initially, the function sets up 2 boto3 clients (to connect to AWS): 1 for accessing s3 buckets
+    to a list. Folders covered by the scraped file manifest (FILES table) are answered from the database without calling S3.
+    Otherwise, the function sets up 2 boto3 clients (to connect to AWS): 1 for accessing s3 buckets
     and the other for accessing AWS CloudWatch to perform logging to a log group and log stream. Both these clients have their
     own AWS access & secret key generated from AWS with necessary permissions that should be stored in your .env file.
     -----
@@ -27,12 +32,18 @@ def list_files_in_goes18_bucket(user_product, user_year, user_day, user_hour):
     A list containing all file names 
     """
 
+    #answer from the file manifest when it covers the selected folder
+    files = list_files_from_manifest(database_file_path, 'GOES', os.environ.get('GOES18_BUCKET_NAME'), (user_product, user_year, user_day, user_hour))
+    if files is not None:
+        return files
+
     #authenticate S3 client with your user credentials that are stored in your .env config file
-    s3resource = boto3.resource('s3',
+    s3client = governed(boto3.client('s3',
                         region_name='us-east-1',
                         aws_access_key_id = os.environ.get('AWS_ACCESS_KEY'),
-                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY')
-                        )
+                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY'),
+                        config = NO_RETRIES_CONFIG
+                        ))  #listing and copy requests go through the shared concurrency governor
 
     #authenticate S3 client for logging with your user credentials that are stored in your .env config file
     clientLogs = boto3.client('logs',
@@ -43,7 +54,6 @@ def list_files_in_goes18_bucket(user_product, user_year, user_day, user_hour):
 
     files = []  #list to store all file names within folder
     prefix = user_product+'/'+user_year+'/'+user_day+'/'+user_hour+'/'
-    goes18_bucket = s3resource.Bucket(os.environ.get('GOES18_BUCKET_NAME'))
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "s3-bucket-logs",
@@ -54,8 +64,8 @@ def list_files_in_goes18_bucket(user_product, user_year, user_day, user_hour):
             }
         ]
     )
-    for objects in goes18_bucket.objects.filter(Prefix=prefix):
-        file_path = objects.key
+    for objects in list_objects_under(s3client, os.environ.get('GOES18_BUCKET_NAME'), prefix):
+        file_path = objects['Key']
         file_path = file_path.split('/')
         files.append(file_path[-1])
 
@@ -64,7 +74,8 @@ def list_files_in_goes18_bucket(user_product, user_year, user_day, user_hour):
 def list_files_in_nexrad_bucket(user_year, user_month, user_day, user_ground_station):
 
     """Function traverses through the specified NEXRAD S3 folder based on the inputs given. The file names are appended 
-    to a list. Initially, the function sets up 2 boto3 clients (to connect to AWS): 1 for accessing s3 buckets
+    to a list. Folders covered by the scraped file manifest (FILES table) are answered from the database without calling S3.
+    Otherwise, the function sets up 2 boto3 clients (to connect to AWS): 1 for accessing s3 buckets
     and the other for accessing AWS CloudWatch to perform logging to a log group and log stream. Both these clients have their
     own AWS access & secret key generated from AWS with necessary permissions that should be stored in your .env file.
     -----
@@ -82,12 +93,18 @@ def list_files_in_nexrad_bucket(user_year, user_month, user_day, user_ground_sta
     A list containing all file names 
     """
 
+    #answer from the file manifest when it covers the selected folder
+    files = list_files_from_manifest(database_file_path, 'NEXRAD', os.environ.get('NEXRAD_BUCKET_NAME'), (user_year, user_month, user_day, user_ground_station))
+    if files is not None:
+        return files
+
     #authenticate S3 client with your user credentials that are stored in your .env config file
-    s3resource = boto3.resource('s3',
+    s3client = governed(boto3.client('s3',
                         region_name='us-east-1',
                         aws_access_key_id = os.environ.get('AWS_ACCESS_KEY'),
-                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY')
-                        )
+                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY'),
+                        config = NO_RETRIES_CONFIG
+                        ))  #listing and copy requests go through the shared concurrency governor
 
     #authenticate S3 client for logging with your user credentials that are stored in your .env config file
     clientLogs = boto3.client('logs',
@@ -98,7 +115,6 @@ def list_files_in_nexrad_bucket(user_year, user_month, user_day, user_ground_sta
 
     files = []
     prefix = user_year+'/'+user_month+'/'+user_day+'/'+user_ground_station+'/'
-    nexrad_bucket = s3resource.Bucket(os.environ.get('NEXRAD_BUCKET_NAME'))
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "s3-bucket-logs",
@@ -109,8 +125,8 @@ def list_files_in_nexrad_bucket(user_year, user_month, user_day, user_ground_sta
             }
         ]
     )
-    for objects in nexrad_bucket.objects.filter(Prefix=prefix):
-        file_path = objects.key
+    for objects in list_objects_under(s3client, os.environ.get('NEXRAD_BUCKET_NAME'), prefix):
+        file_path = objects['Key']
         file_path = file_path.split('/')
         files.append(file_path[-1])
 
@@ -142,11 +158,12 @@ def copy_goes_file_to_user_bucket(selected_file_name, user_product, user_year, u
     """
 
     #authenticate S3 client with your user credentials that are stored in your .env config file
-    s3resource = boto3.resource('s3',
+    s3client = governed(boto3.client('s3',
                         region_name='us-east-1',
                         aws_access_key_id = os.environ.get('AWS_ACCESS_KEY'),
-                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY')
-                        )
+                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY'),
+                        config = NO_RETRIES_CONFIG
+                        ))  #listing and copy requests go through the shared concurrency governor
 
     #authenticate S3 client for logging with your user credentials that are stored in your .env config file
     clientLogs = boto3.client('logs',
@@ -155,7 +172,7 @@ def copy_goes_file_to_user_bucket(selected_file_name, user_product, user_year, u
                         aws_secret_access_key = os.environ.get('AWS_LOG_SECRET_KEY')
                         )
 
-    destination_bucket = s3resource.Bucket(os.environ.get('USER_BUCKET_NAME'))  #define the destination bucket as the user bucket
+    destination_bucket = os.environ.get('USER_BUCKET_NAME')  #define the destination bucket as the user bucket
     all_selections_string = user_product+'/'+user_year+'/'+user_day+'/'+user_hour+'/'+selected_file_name
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
@@ -186,8 +203,8 @@ def copy_goes_file_to_user_bucket(selected_file_name, user_product, user_year, u
         'Key': all_selections_string
         }
     
-    for file in destination_bucket.objects.all():
-        if(file.key == destination_key):    #if selected file already exists at destination bucket
+    for file in list_objects_under(s3client, destination_bucket, destination_key):     #only keys starting with the destination key
+        if(file['Key'] == destination_key):    #if selected file already exists at destination bucket
             clientLogs.put_log_events(      #logging to AWS CloudWatch logs
                 logGroupName = "assignment01-logs",
                 logStreamName = "s3-bucket-logs",
@@ -210,7 +227,7 @@ def copy_goes_file_to_user_bucket(selected_file_name, user_product, user_year, u
             )
             return url_to_mys3
 
-    destination_bucket.copy(copy_source, destination_key)   #copy file to destination bucket
+    s3client.copy_object(CopySource=copy_source, Bucket=destination_bucket, Key=destination_key)   #copy file to destination bucket, a single governed request
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "s3-bucket-logs",
@@ -260,11 +277,12 @@ def copy_nexrad_file_to_user_bucket(selected_file_name, user_year, user_month, u
     """
 
     #authenticate S3 client with your user credentials that are stored in your .env config file
-    s3resource = boto3.resource('s3',
+    s3client = governed(boto3.client('s3',
                         region_name='us-east-1',
                         aws_access_key_id = os.environ.get('AWS_ACCESS_KEY'),
-                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY')
-                        )
+                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY'),
+                        config = NO_RETRIES_CONFIG
+                        ))  #listing and copy requests go through the shared concurrency governor
 
     #authenticate S3 client for logging with your user credentials that are stored in your .env config file
     clientLogs = boto3.client('logs',
@@ -273,7 +291,7 @@ def copy_nexrad_file_to_user_bucket(selected_file_name, user_year, user_month, u
                         aws_secret_access_key = os.environ.get('AWS_LOG_SECRET_KEY')
                         )
 
-    destination_bucket = s3resource.Bucket(os.environ.get('USER_BUCKET_NAME'))  #define the destination bucket as the user bucket
+    destination_bucket = os.environ.get('USER_BUCKET_NAME')  #define the destination bucket as the user bucket
     all_selections_string = user_year+'/'+user_month+'/'+user_day+'/'+user_ground_station+'/'+selected_file_name
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
@@ -303,8 +321,8 @@ def copy_nexrad_file_to_user_bucket(selected_file_name, user_year, user_month, u
         'Key': all_selections_string
         }
     
-    for file in destination_bucket.objects.all():
-        if(file.key == destination_key):    #if selected file already exists at destination bucket
+    for file in list_objects_under(s3client, destination_bucket, destination_key):     #only keys starting with the destination key
+        if(file['Key'] == destination_key):    #if selected file already exists at destination bucket
             clientLogs.put_log_events(      #logging to AWS CloudWatch logs
                 logGroupName = "assignment01-logs",
                 logStreamName = "s3-bucket-logs",
@@ -327,7 +345,7 @@ def copy_nexrad_file_to_user_bucket(selected_file_name, user_year, user_month, u
             )
             return url_to_mys3
 
-    destination_bucket.copy(copy_source, destination_key)   #copy file to destination bucket
+    s3client.copy_object(CopySource=copy_source, Bucket=destination_bucket, Key=destination_key)   #copy file to destination bucket, a single governed request
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "s3-bucket-logs",
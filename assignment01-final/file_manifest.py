@@ -0,0 +1,241 @@
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from s3_crawler import list_objects_under, iter_in_order, DEFAULT_MAX_WORKERS
+from incremental_scrape import read_high_water_mark, write_high_water_mark
+from metadata_schema import folder_columns_sql
+
+MANIFEST_TABLE_NAME = 'FILES'
+MANIFEST_BATCH_SIZE = 5000  #file rows written per transaction
+MANIFEST_DDL = """
+CREATE TABLE IF NOT EXISTS FILES (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER,
+    etag TEXT,
+    last_modified TEXT,
+    station TEXT,
+    product_code TEXT,
+    scan_start TEXT,
+    scan_end TEXT,
+    version TEXT,
+    UNIQUE (bucket, prefix, filename)
+);
+CREATE INDEX IF NOT EXISTS FILES_DATASET_SCAN_INDEX ON FILES (dataset, scan_start);
+CREATE INDEX IF NOT EXISTS FILES_DATASET_FILENAME_INDEX ON FILES (dataset, filename);
+"""
+COMPLETION_LIMIT = 20   #completions offered for a typed file name
+MANIFEST_COLUMNS = ['dataset', 'bucket', 'prefix', 'filename', 'size', 'etag', 'last_modified', 'station', 'product_code', 'scan_start', 'scan_end', 'version']
+
+#metadata table and folder columns (from the top of the bucket down) the manifest of each dataset is built from
+MANIFEST_SOURCES = {
+    'GOES': ('GOES_METADATA', ['product', 'year', 'day', 'hour']),
+    'NEXRAD': ('NEXRAD_METADATA', ['year', 'month', 'day', 'ground_station'])
+}
+
+def parse_goes_filename(file_name):
+
+    """Function parses the fields of a GOES ABI file name, e.g.
+    OR_ABI-L1b-RadC-M6C01_G18_s20230020101172_e20230020103548_c20230020103594.nc
+    -----
+    Input parameters:
+    file_name : str
+        name of the file (without its folder path)
+    -----
+    Returns:
+    A dict with the product code (product, mode and channel), the scan start and scan end as ISO timestamps and the
+    satellite as version; all None if the name does not follow the GOES format
+    """
+
+    fields = {'station': None, 'product_code': None, 'scan_start': None, 'scan_end': None, 'version': None}
+    match = re.match(r'OR_([A-Za-z0-9-]+)_(G\d\d)_s(\d{13})\d_e(\d{13})\d_c\d{14}', file_name)
+    if match:
+        fields['product_code'] = match.group(1)
+        fields['version'] = match.group(2)
+        fields['scan_start'] = datetime.strptime(match.group(3), '%Y%j%H%M%S').isoformat()
+        fields['scan_end'] = datetime.strptime(match.group(4), '%Y%j%H%M%S').isoformat()
+    return fields
+
+def parse_nexrad_filename(file_name):
+
+    """Function parses the fields of a NEXRAD Level 2 file name, e.g. KBGM20111010_000301_V03.gz
+    -----
+    Input parameters:
+    file_name : str
+        name of the file (without its folder path)
+    -----
+    Returns:
+    A dict with the ground station, the scan start as ISO timestamp and the archive version (None for files from
+    before versions were added to the name); all None if the name does not follow the NEXRAD format
+    """
+
+    fields = {'station': None, 'product_code': None, 'scan_start': None, 'scan_end': None, 'version': None}
+    match = re.match(r'([A-Z0-9]{4})(\d{8}_\d{6})(?:_(V\d+))?', file_name)
+    if match:
+        fields['station'] = match.group(1)
+        fields['scan_start'] = datetime.strptime(match.group(2), '%Y%m%d_%H%M%S').isoformat()
+        fields['version'] = match.group(3)
+    return fields
+
+def manifest_rows(dataset, bucket_name, objects):
+
+    """Function turns the objects listed under one folder into FILES rows, parsing the fields of every file name.
+    -----
+    Input parameters:
+    dataset : str
+        GOES or NEXRAD
+    bucket_name : str
+        name of the bucket the objects were listed from
+    objects : list
+        Contents entries returned by the S3 list API
+    -----
+    Returns:
+    A list of row tuples in MANIFEST_COLUMNS order
+    """
+
+    parse_filename = parse_goes_filename if dataset == 'GOES' else parse_nexrad_filename
+    rows = []
+    for s3_object in objects:
+        prefix, _, file_name = s3_object['Key'].rpartition('/')
+        fields = parse_filename(file_name)
+        last_modified = s3_object.get('LastModified')
+        rows.append((dataset, bucket_name, prefix + '/', file_name, s3_object.get('Size'), s3_object.get('ETag', '').strip('"'),
+                     last_modified.isoformat() if last_modified is not None else None,
+                     fields['station'], fields['product_code'], fields['scan_start'], fields['scan_end'], fields['version']))
+    return rows
+
+def scrape_file_manifest(database_file_path, dataset, s3client, bucket_name, max_workers=DEFAULT_MAX_WORKERS):
+
+    """Function records every object under the folders scraped into a dataset's metadata table into the FILES table.
+    Only folders at or after the manifest's high-water mark are listed (the last folder is listed again since files
+    may still have been arriving), so running it after every scrape keeps the manifest up to date cheaply. Folders are
+    listed concurrently and rows are upserted in committed batches.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    dataset : str
+        GOES or NEXRAD
+    s3client : boto3 S3 client
+        client used to call the S3 list API
+    bucket_name : str
+        name of the bucket the dataset was scraped from
+    max_workers : int
+        maximum number of concurrent list requests
+    -----
+    Returns:
+    The number of file rows written
+    """
+
+    table_name, folder_columns = MANIFEST_SOURCES[dataset]
+    db_conn = sqlite3.connect(database_file_path)
+    db_conn.executescript(MANIFEST_DDL)
+    state_key = MANIFEST_TABLE_NAME + '_' + dataset
+    manifest_mark = read_high_water_mark(db_conn, state_key)
+
+    query = "SELECT " + folder_columns_sql(table_name, folder_columns) + " FROM " + table_name
+    conditions, parameters = [], []
+    table_columns = [column[1] for column in db_conn.execute("PRAGMA table_info(" + table_name + ")")]
+    if 'bucket' in table_columns:   #GOES tables can hold the folders of several buckets
+        conditions.append("bucket = ?")
+        parameters.append(bucket_name)
+    if manifest_mark is not None:
+        conditions.append("(" + ", ".join(folder_columns) + ") >= (" + ", ".join("?" * len(folder_columns)) + ")")
+        parameters.extend(manifest_mark)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    folders = db_conn.execute(query + " ORDER BY " + ", ".join(folder_columns), parameters).fetchall()
+
+    insert = ("INSERT INTO " + MANIFEST_TABLE_NAME + " (" + ", ".join(MANIFEST_COLUMNS) + ") VALUES (" + ", ".join("?" * len(MANIFEST_COLUMNS)) + ")"
+              " ON CONFLICT (bucket, prefix, filename) DO UPDATE SET size = excluded.size, etag = excluded.etag, last_modified = excluded.last_modified")
+    rows_written = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list_folder = lambda folder: list_objects_under(s3client, bucket_name, '/'.join(folder) + '/')
+        listed = iter_in_order(executor, list_folder, folders, 2 * max_workers)
+        while True:
+            batch = list(islice(listed, max(1, MANIFEST_BATCH_SIZE // 100)))   #a folder holds up to a few hundred files
+            if not batch:
+                break
+            for folder, objects in batch:
+                rows = manifest_rows(dataset, bucket_name, objects)
+                db_conn.executemany(insert, rows)
+                rows_written += len(rows)
+            write_high_water_mark(db_conn, state_key, batch[-1][0])    #commit the mark together with the rows
+            db_conn.commit()
+    db_conn.close()
+    return rows_written
+
+def list_files_from_manifest(database_file_path, dataset, bucket_name, folder):
+
+    """Function answers a file listing from the FILES table instead of S3. A folder is only answered from the manifest
+    if it is older than the newest folder the manifest has recorded, since the newest one may still be receiving files
+    and anything after it has not been scraped yet, and if the manifest holds files of it: S3 has no empty folders,
+    so a folder without files was never listed into the manifest (e.g. one added behind the mark by a backfill,
+    --rebuild-year or --resume).
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    dataset : str
+        GOES or NEXRAD
+    bucket_name : str
+        name of the bucket the folder is in
+    folder : tuple
+        folder names from the top of the bucket down, e.g. ('ABI-L1b-RadC', '2023', '002', '01')
+    -----
+    Returns:
+    A list containing all file names in the folder, or None if the manifest does not cover the folder
+    """
+
+    if not Path(database_file_path).is_file():
+        return None
+    db_conn = sqlite3.connect(database_file_path)
+    try:
+        manifest_mark = read_high_water_mark(db_conn, MANIFEST_TABLE_NAME + '_' + dataset)
+        if manifest_mark is None or tuple(folder) >= manifest_mark:   #folder newer than the last scrape, ask S3
+            return None
+        query = "SELECT filename FROM " + MANIFEST_TABLE_NAME + " WHERE bucket = ? AND prefix = ? ORDER BY filename"
+        files = [row[0] for row in db_conn.execute(query, (bucket_name, '/'.join(folder) + '/'))]
+        return files or None    #folder not listed into the manifest, ask S3
+    except sqlite3.Error:   #manifest tables not created yet or database busy, ask S3
+        return None
+    finally:
+        db_conn.close()
+
+def complete_filename(db_conn, dataset, typed_name, limit=COMPLETION_LIMIT):
+
+    """Function completes a partly typed file name from the FILES table. The names starting with the typed text are a
+    range of the (dataset, filename) index, so the lookup reads only the completions it returns, however many files
+    the manifest holds. Completions come in file name order, which is station or product first and then scan time;
+    surrounding spaces are ignored and the text is matched as typed (file names are case sensitive in S3).
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the metadata database
+    dataset : str
+        GOES or NEXRAD
+    typed_name : str
+        beginning of the file name
+    limit : int
+        maximum number of completions
+    -----
+    Returns:
+    A list of up to limit file names, an empty list when nothing matches or the manifest was not created yet
+    """
+
+    typed_name = typed_name.strip()
+    query = "SELECT DISTINCT filename FROM " + MANIFEST_TABLE_NAME + " WHERE dataset = ? AND filename >= ?"
+    parameters = [dataset, typed_name]
+    if typed_name:  #the names after the last one starting with the text start with its last character incremented
+        query += " AND filename < ?"
+        parameters.append(typed_name[:-1] + chr(ord(typed_name[-1]) + 1))
+    try:
+        return [row[0] for row in db_conn.execute(query + " ORDER BY filename LIMIT ?", parameters + [limit])]
+    except sqlite3.OperationalError:    #no FILES table yet
+        return []
@@ -0,0 +1,222 @@
+import os
+import json
+import mmap
+import struct
+import threading
+import numpy as np
+from metadata_schema import connect_database, table_exists, read_generation, scope_filter, COLUMN_FORMATS
+
+INDEX_MAGIC = b'MDHIDX01'
+INDEX_DTYPE = np.dtype('<i4')
+
+#the cascades of the app's dropdowns, from the first dropdown down; text levels are stored as codes into a sorted
+#label list, the other levels as their integer values
+HIERARCHY_LEVELS = {
+    'GOES_METADATA': ['product', 'year', 'day', 'hour'],
+    'NEXRAD_METADATA': ['year', 'month', 'day', 'ground_station']
+}
+LABEL_LEVELS = {'product', 'ground_station'}
+
+def hierarchy_index_path(database_file_path):
+
+    """Function gives the path of the hierarchy index of a database, next to the database file.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    -----
+    Returns:
+    The path of the .hierarchy file (str)
+    """
+
+    return os.path.splitext(database_file_path)[0] + '.hierarchy'
+
+def build_tree(rows, levels):
+
+    """Function builds the CSR arrays of one cascade from its sorted, distinct folder rows. Level k holds one value per
+    distinct prefix of k + 1 folder names, in sorted order; the children of node i of level k are the nodes
+    offsets[i] to offsets[i + 1] of level k + 1.
+    -----
+    Input parameters:
+    rows : list
+        sorted distinct tuples of folder names, one element per level
+    levels : list
+        names of the levels, e.g. ['product', 'year', 'day', 'hour']
+    -----
+    Returns:
+    labels : dict
+        sorted label list of every text level
+    values : list
+        int32 array of node values per level
+    offsets : list
+        int32 array of child offsets per level, except the last one
+    """
+
+    labels = {level: sorted({row[number] for row in rows}) for number, level in enumerate(levels) if level in LABEL_LEVELS}
+    codes = {level: {label: code for code, label in enumerate(level_labels)} for level, level_labels in labels.items()}
+    keys = np.array([[codes[level][value] if level in codes else value for level, value in zip(levels, row)] for row in rows],
+                    dtype=INDEX_DTYPE).reshape(len(rows), len(levels))
+
+    new_node = np.zeros(len(rows), dtype=bool)    #rows starting a new node at the current level
+    starts = []
+    for number in range(len(levels)):
+        new_node = new_node | np.concatenate(([True], keys[1:, number] != keys[:-1, number]))[:len(rows)]
+        starts.append(new_node)
+    values = [keys[start, number] for number, start in enumerate(starts)]
+    offsets = [np.append(np.cumsum(starts[number + 1])[starts[number]] - 1, np.count_nonzero(starts[number + 1])).astype(INDEX_DTYPE)
+               for number in range(len(levels) - 1)]
+    return labels, values, offsets
+
+def build_hierarchy_index(database_file_path, index_path=None):
+
+    """Used to write the hierarchy index of the GOES and NEXRAD cascades: sorted integer arrays with offsets (a CSR
+    tree per cascade) after a JSON header, which the app memory-maps. The file is written next to its final path and
+    renamed over it, so readers see either the old index or the new one; readers that already mapped the old file
+    keep using it until they reload.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    index_path : str
+        path of the index file, next to the database when not given
+    -----
+    Returns:
+    The generations of the tables the index was built from (dict)
+    """
+
+    index_path = index_path or hierarchy_index_path(database_file_path)
+    db_conn = connect_database(database_file_path, 'read')
+    header = {'generations': {}, 'trees': {}}
+    arrays = []
+    position = 0
+    for table_name, levels in HIERARCHY_LEVELS.items():
+        if not table_exists(db_conn, table_name):
+            continue
+        header['generations'][table_name] = read_generation(db_conn, table_name)
+        scope_conditions, scope_parameters = scope_filter(db_conn, table_name, levels)     #e.g. the assignment's GOES bucket
+        rows = db_conn.execute("SELECT DISTINCT " + ", ".join(levels) + " FROM " + table_name +
+                               (" WHERE " + " AND ".join(scope_conditions) if scope_conditions else "") +
+                               " ORDER BY " + ", ".join(levels), scope_parameters).fetchall()
+        labels, values, offsets = build_tree(rows, levels)
+        tree = {'levels': levels, 'labels': labels, 'values': [], 'offsets': []}
+        for kind, kind_arrays in (('values', values), ('offsets', offsets)):
+            for array in kind_arrays:
+                tree[kind].append([position, len(array)])
+                arrays.append(array)
+                position += array.nbytes
+        header['trees'][table_name] = tree
+    db_conn.close()
+
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (-(len(INDEX_MAGIC) + 8 + len(header_bytes)) % INDEX_DTYPE.itemsize)    #align the arrays
+    temporary_path = index_path + '.' + str(os.getpid()) + '.tmp'
+    with open(temporary_path, 'wb') as index_file:
+        index_file.write(INDEX_MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes)
+        for array in arrays:
+            index_file.write(array.astype(INDEX_DTYPE).tobytes())
+        index_file.flush()
+        os.fsync(index_file.fileno())
+    os.replace(temporary_path, index_path)
+    return header['generations']
+
+def refresh_hierarchy_index(database_file_path, index_path=None):
+
+    """Used to rebuild the hierarchy index only when the generation of a metadata table has changed since it was built.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    index_path : str
+        path of the index file, next to the database when not given
+    -----
+    Returns:
+    True if the index was rebuilt, False if it was up to date
+    """
+
+    index_path = index_path or hierarchy_index_path(database_file_path)
+    index = load_hierarchy_index(index_path)
+    db_conn = connect_database(database_file_path, 'read')
+    generations = {table_name: read_generation(db_conn, table_name) for table_name in HIERARCHY_LEVELS if table_exists(db_conn, table_name)}
+    db_conn.close()
+    if index is not None and index.generations == generations:
+        return False
+    build_hierarchy_index(database_file_path, index_path)
+    return True
+
+class HierarchyIndex:
+
+    """Used to answer the app's dropdown cascades from a memory-mapped hierarchy index file. The arrays are numpy views
+    on the mapping, so every process mapping the file shares its pages through the page cache, and a cascade level is
+    a binary search in a slice of one array.
+    """
+
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as index_file:
+            self.mapping = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mapping[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(index_path + " is not a hierarchy index")
+        header_length = struct.unpack_from('<Q', self.mapping, len(INDEX_MAGIC))[0]
+        header = json.loads(self.mapping[len(INDEX_MAGIC) + 8:len(INDEX_MAGIC) + 8 + header_length])
+        start = len(INDEX_MAGIC) + 8 + header_length
+        self.generations = header['generations']
+        self.trees = {}
+        for table_name, tree in header['trees'].items():
+            tree['values'] = [np.frombuffer(self.mapping, INDEX_DTYPE, count, start + position) for position, count in tree['values']]
+            tree['offsets'] = [np.frombuffer(self.mapping, INDEX_DTYPE, count, start + position) for position, count in tree['offsets']]
+            tree['codes'] = {level: {label: code for code, label in enumerate(labels)} for level, labels in tree['labels'].items()}
+            self.trees[table_name] = tree
+
+    def children(self, table_name, path):
+
+        """Function lists the values of the next dropdown of a cascade.
+        -----
+        Input parameters:
+        table_name : str
+            GOES_METADATA or NEXRAD_METADATA
+        path : tuple
+            values selected in the dropdowns above, as the app shows them, e.g. ('ABI-L1b-RadC', '2023')
+        -----
+        Returns:
+        A sorted list of the values (str, zero padded like the folder names), empty if the path does not exist
+        """
+
+        tree = self.trees[table_name]
+        low, high = 0, len(tree['values'][0])
+        for number, value in enumerate(path):
+            level = tree['levels'][number]
+            code = tree['codes'][level].get(value) if level in tree['codes'] else int(value)
+            values = tree['values'][number]
+            position = low + int(np.searchsorted(values[low:high], code)) if code is not None else high
+            if position >= high or values[position] != code:
+                return []
+            low, high = int(tree['offsets'][number][position]), int(tree['offsets'][number][position + 1])
+        level = tree['levels'][len(path)]
+        if level in tree['codes']:
+            return [tree['labels'][level][code] for code in tree['values'][len(path)][low:high].tolist()]
+        value_format = COLUMN_FORMATS[table_name][level]
+        return [value_format % value for value in tree['values'][len(path)][low:high].tolist()]
+
+loaded_indexes = {}     #index file path -> (file identity, HierarchyIndex), so a process maps each file once
+loaded_indexes_lock = threading.Lock()
+
+def load_hierarchy_index(index_path):
+
+    """Function gives the memory-mapped hierarchy index at a path, mapping it again only when the file was replaced.
+    -----
+    Input parameters:
+    index_path : str
+        path of the index file
+    -----
+    Returns:
+    A HierarchyIndex, or None if there is no index file
+    """
+
+    try:
+        status = os.stat(index_path)
+    except FileNotFoundError:
+        return None
+    identity = (status.st_ino, status.st_mtime_ns, status.st_size)
+    with loaded_indexes_lock:
+        if index_path not in loaded_indexes or loaded_indexes[index_path][0] != identity:
+            loaded_indexes[index_path] = (identity, HierarchyIndex(index_path))
+        return loaded_indexes[index_path][1]
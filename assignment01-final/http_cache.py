@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+import requests
+
+DEFAULT_TIMEOUT = 30    #seconds to wait for the server to connect and to send data
+HTTP_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'http_cache')   #cached response bodies and their validators
+
+http_session = requests.Session()   #shared session, so repeated fetches reuse the open connection
+
+def cache_file_paths(url, cache_dir):
+
+    """Function names the files a URL's cached body and validators are stored in.
+    -----
+    Input parameters:
+    url : str
+        URL of the cached resource
+    cache_dir : str
+        directory holding the cache
+    -----
+    Returns:
+    body_path : str
+        path of the file holding the response body
+    meta_path : str
+        path of the JSON file holding the ETag, Last-Modified and content hash of the body
+    """
+
+    url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, url_hash + '.body'), os.path.join(cache_dir, url_hash + '.json')
+
+def fetch_cached(url, cache_dir=HTTP_CACHE_DIR, session=http_session, timeout=DEFAULT_TIMEOUT):
+
+    """Function fetches a URL through an on-disk cache. If the URL was fetched before, the request is made conditional
+    with If-None-Match / If-Modified-Since, and a 304 Not Modified answer is served from the cache without downloading
+    the body again. A fresh body replaces the cached one. Errors are raised as requests exceptions.
+    -----
+    Input parameters:
+    url : str
+        URL to fetch
+    cache_dir : str
+        directory holding the cache, created if missing
+    session : requests.Session
+        session used for the request
+    timeout : int
+        seconds to wait for the server to connect and to send data
+    -----
+    Returns:
+    body : str
+        text of the response
+    content_hash : str
+        SHA-256 of the body, which only changes when the content does
+    """
+
+    body_path, meta_path = cache_file_paths(url, cache_dir)
+    cached_meta = None
+    if os.path.isfile(body_path) and os.path.isfile(meta_path):
+        with open(meta_path, 'r') as meta_file:
+            cached_meta = json.load(meta_file)
+
+    headers = {}
+    if cached_meta is not None:     #revalidate the cached copy instead of downloading it again
+        if cached_meta.get('etag'):
+            headers['If-None-Match'] = cached_meta['etag']
+        if cached_meta.get('last_modified'):
+            headers['If-Modified-Since'] = cached_meta['last_modified']
+
+    response = session.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and cached_meta is not None:
+        with open(body_path, 'r', encoding='utf-8') as body_file:
+            return body_file.read(), cached_meta['content_hash']
+    response.raise_for_status()
+
+    body = response.text
+    content_hash = hashlib.sha256(body.encode('utf-8')).hexdigest()
+    meta = {'url': url, 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'), 'content_hash': content_hash}
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.isfile(meta_path):   #drop the old validators first, they must never pair up with the new body
+        os.remove(meta_path)
+    for path, content in ((body_path, body), (meta_path, json.dumps(meta))):
+        with open(path + '.tmp', 'w', encoding='utf-8') as cache_file:     #write aside and rename, so an interrupted run never leaves half a file
+            cache_file.write(content)
+        os.replace(path + '.tmp', path)
+    return body, content_hash
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from crawl_checkpoint import write_checkpoint
+from metadata_schema import folder_columns_sql, scope_filter, insert_rows
+
+DEFAULT_OVERLAP_HOURS = 3    #GOES hours before the high-water mark that are re-listed on an incremental run
+DEFAULT_OVERLAP_DAYS = 1     #NEXRAD days before the high-water mark that are re-listed on an incremental run
+STATE_TABLE_NAME = 'SCRAPE_STATE'   #table holding one high-water mark per scraped dataset
+STATE_TABLE_DDL = "CREATE TABLE IF NOT EXISTS " + STATE_TABLE_NAME + " (dataset TEXT PRIMARY KEY, high_water_mark TEXT, updated_at TEXT)"
+
+def read_high_water_mark(db_conn, dataset):
+
+    """Function reads the persisted high-water mark (the newest folder seen by the last scrape) for a dataset.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the metadata database
+    dataset : str
+        name of the scraped dataset, e.g. GOES_METADATA or NEXRAD_METADATA
+    -----
+    Returns:
+    A tuple of folder names, e.g. ('ABI-L1b-RadC', '2023', '041', '17'), or None if the dataset was never scraped
+    """
+
+    db_conn.execute(STATE_TABLE_DDL)
+    row = db_conn.execute("SELECT high_water_mark FROM " + STATE_TABLE_NAME + " WHERE dataset = ?", (dataset,)).fetchone()
+    if row is None or not row[0]:
+        return None
+    return tuple(row[0].split('/'))
+
+def write_high_water_mark(db_conn, dataset, high_water_mark):
+
+    """Function persists the high-water mark for a dataset, replacing the previous one. The caller commits.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the metadata database
+    dataset : str
+        name of the scraped dataset, e.g. GOES_METADATA or NEXRAD_METADATA
+    high_water_mark : tuple
+        folder names of the newest folder seen
+    -----
+    Returns:
+    Nothing
+    """
+
+    db_conn.execute(STATE_TABLE_DDL)
+    db_conn.execute("INSERT OR REPLACE INTO " + STATE_TABLE_NAME + " (dataset, high_water_mark, updated_at) VALUES (?, ?, ?)",
+                    (dataset, '/'.join(high_water_mark), datetime.now(timezone.utc).isoformat(timespec='seconds')))
+
+def newest_key_in_table(db_conn, table_name, key_columns):
+
+    """Function finds the newest folder stored in a metadata table, used as the high-water mark after a full scrape.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the metadata database
+    table_name : str
+        name of the metadata table
+    key_columns : list
+        columns that identify a folder, from the top of the bucket down
+    -----
+    Returns:
+    A tuple with the largest key in the table, or None if the table is empty
+    """
+
+    scope_conditions, scope_parameters = scope_filter(db_conn, table_name, key_columns)
+    query = ("SELECT " + folder_columns_sql(table_name, key_columns) + " FROM " + table_name + (" WHERE " + " AND ".join(scope_conditions) if scope_conditions else "") +
+             " ORDER BY " + " DESC, ".join(key_columns) + " DESC LIMIT 1")
+    return db_conn.execute(query, scope_parameters).fetchone()
+
+def goes_scrape_start(high_water_mark, overlap_hours=DEFAULT_OVERLAP_HOURS):
+
+    """Function works out where an incremental GOES scrape should start: overlap_hours before the high-water mark, so
+    hour folders that showed up late for the last few hours are picked up too.
+    -----
+    Input parameters:
+    high_water_mark : tuple
+        (product, year, day of year, hour) of the newest folder seen
+    overlap_hours : int
+        number of hours before the high-water mark to re-list
+    -----
+    Returns:
+    A (product, year, day, hour) tuple of zero padded folder names
+    """
+
+    product, year, day, hour = high_water_mark
+    start = datetime(int(year), 1, 1) + timedelta(days=int(day) - 1, hours=int(hour)) - timedelta(hours=overlap_hours)
+    return (product, start.strftime('%Y'), start.strftime('%j'), start.strftime('%H'))
+
+def nexrad_scrape_start(high_water_mark, overlap_days=DEFAULT_OVERLAP_DAYS):
+
+    """Function works out where an incremental NEXRAD scrape should start: overlap_days before the day of the
+    high-water mark, re-listing every station of those days since stations upload independently.
+    -----
+    Input parameters:
+    high_water_mark : tuple
+        (year, month, day, ground station) of the newest folder seen
+    overlap_days : int
+        number of days before the high-water mark to re-list
+    -----
+    Returns:
+    A (year, month, day) tuple of zero padded folder names
+    """
+
+    year, month, day = high_water_mark[:3]
+    start = datetime(int(year), int(month), int(day)) - timedelta(days=overlap_days)
+    return (start.strftime('%Y'), start.strftime('%m'), start.strftime('%d'))
+
+def append_new_rows(scraped_rows, db_conn, table_name, key_columns, start_from, batch_size, checkpoint=None):
+
+    """Function appends the rows of an incremental scrape that are not in the table yet. Only rows at or after
+    start_from can overlap with what is already stored, so just those keys are read back to filter the scrape. New
+    rows get ids continuing after the current largest id and are written in committed batches.
+    -----
+    Input parameters:
+    scraped_rows : iterable
+        iterable of row dicts produced by a scraper
+    db_conn : sqlite3.Connection
+        open connection to the metadata database
+    table_name : str
+        name of the metadata table to append to
+    key_columns : list
+        columns that identify a folder, from the top of the bucket down, e.g. ['year', 'month', 'day', 'ground_station']
+    start_from : tuple
+        position the incremental scrape started from, a prefix of the key columns
+    batch_size : int
+        number of rows written per transaction
+    checkpoint : dict
+        optional rows written so far and start time of the scrape; when given, a checkpoint of the last key processed
+        is committed with every batch
+    -----
+    Returns:
+    rows_added : int
+        number of new rows appended
+    newest_key : tuple
+        largest key seen in the scrape (or None if the scrape returned nothing)
+    """
+
+    start_columns = key_columns[:len(start_from)]
+    scope_conditions, scope_parameters = scope_filter(db_conn, table_name, key_columns)     #e.g. the assignment's GOES bucket
+    query = ("SELECT " + folder_columns_sql(table_name, key_columns) + " FROM " + table_name +
+             " WHERE (" + ", ".join(start_columns) + ") >= (" + ", ".join("?" * len(start_from)) + ")" + "".join(" AND " + condition for condition in scope_conditions))
+    existing_keys = set(db_conn.execute(query, tuple(start_from) + tuple(scope_parameters)).fetchall())     #keys already stored inside the overlap window
+    next_id = (db_conn.execute("SELECT MAX(id) FROM " + table_name).fetchone()[0] or 0) + 1
+
+    rows_added = 0
+    newest_key = None
+    scraped_rows = iter(scraped_rows)
+    while True:
+        chunk = list(islice(scraped_rows, batch_size))
+        if not chunk:
+            break
+        batch = []
+        for row in chunk:
+            key = tuple(row[column] for column in key_columns)
+            newest_key = key if newest_key is None else max(newest_key, key)
+            if key in existing_keys:    #folder already stored by an earlier run
+                continue
+            row['id'] = next_id
+            next_id += 1
+            batch.append(row)
+        if batch:
+            rows_added += insert_rows(db_conn, table_name, batch)
+        if checkpoint is not None:  #rows come in sorted order, so every folder up to the newest key is done
+            write_checkpoint(db_conn, table_name, newest_key, checkpoint['rows_written'] + rows_added, checkpoint['started_at'])
+        db_conn.commit()    #commit every batch so a long scrape is flushed to disk as it goes
+    return rows_added, newest_key
@@ -0,0 +1,171 @@
+import json
+import pandas as pd
+from pathlib import Path
+from urllib.parse import unquote
+from concurrent.futures import ProcessPoolExecutor
+from file_manifest import MANIFEST_DDL, MANIFEST_TABLE_NAME, MANIFEST_COLUMNS, MANIFEST_SOURCES
+from incremental_scrape import write_high_water_mark
+from metadata_schema import connect_database, split_ddl, prepare_shadow_table, swap_in_shadow, read_ddl_script, insert_rows, METADATA_DDL_FILES
+
+DEFAULT_PROCESSES = 4   #number of inventory data files decompressed and parsed at the same time
+
+#Parquet inventories use snake case column names, CSV inventories the names listed in the manifest's fileSchema
+PARQUET_COLUMN_NAMES = {'bucket': 'Bucket', 'key': 'Key', 'size': 'Size', 'last_modified_date': 'LastModifiedDate', 'e_tag': 'ETag'}
+
+def read_inventory_manifest(inventory_path):
+
+    """Function reads the manifest.json of an S3 Inventory report and resolves its data files on the local disk. The
+    report can be given as the manifest.json file or as the directory holding it; data files are looked up under the
+    report's root by their manifest key and, failing that, in a data/ folder next to the manifest.
+    -----
+    Input parameters:
+    inventory_path : str
+        path to manifest.json or to the directory holding it
+    -----
+    Returns:
+    A dict with the source bucket, file format (CSV or Parquet), the list of column names and the local data file paths
+    """
+
+    manifest_path = Path(inventory_path)
+    if manifest_path.is_dir():
+        manifest_path = manifest_path / 'manifest.json'
+    with open(manifest_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    data_files = []
+    for data_file in manifest['files']:
+        candidates = [manifest_path.parent.joinpath(*data_file['key'].split('/')), manifest_path.parent / 'data' / data_file['key'].split('/')[-1]]
+        local_path = next((candidate for candidate in candidates if candidate.is_file()), None)
+        if local_path is None:
+            raise FileNotFoundError("Inventory data file not found locally: " + data_file['key'])
+        data_files.append(str(local_path))
+
+    file_format = manifest.get('fileFormat', 'CSV')
+    return {
+        'source_bucket': manifest.get('sourceBucket'),
+        'file_format': file_format,
+        'columns': [column.strip() for column in manifest['fileSchema'].split(',')] if file_format == 'CSV' else None,
+        'data_files': data_files
+    }
+
+def parse_inventory_file(data_file_path, file_format, columns, dataset):
+
+    """Function decompresses and parses one inventory data file, then splits every key into its folder levels and
+    file name fields with vectorized string operations. Runs in a worker process.
+    -----
+    Input parameters:
+    data_file_path : str
+        path to a .csv.gz or .parquet inventory data file
+    file_format : str
+        CSV or Parquet
+    columns : list
+        column names of the CSV files (from the manifest's fileSchema), None for Parquet
+    dataset : str
+        GOES or NEXRAD
+    -----
+    Returns:
+    folders : DataFrame
+        distinct leaf folders of the file, one column per folder level of the dataset's metadata table
+    files : DataFrame
+        one row per object, in MANIFEST_COLUMNS order without the dataset column
+    """
+
+    if file_format == 'CSV':    #CSV inventories have no header and URL-encode the keys
+        inventory = pd.read_csv(data_file_path, header=None, names=columns, dtype=str, compression='gzip')
+        if inventory['Key'].str.contains('%', regex=False).any():
+            inventory['Key'] = inventory['Key'].map(unquote)
+    else:
+        inventory = pd.read_parquet(data_file_path).rename(columns=PARQUET_COLUMN_NAMES)
+
+    folder_columns = MANIFEST_SOURCES[dataset][1]
+    key_parts = inventory['Key'].str.split('/', n=len(folder_columns), expand=True)
+    key_parts = key_parts.reindex(columns=range(len(folder_columns) + 1))   #keys with fewer levels get missing values
+    key_parts.columns = folder_columns + ['filename']
+    key_parts = key_parts[key_parts.notna().all(axis=1) & (key_parts['filename'] != '')]  #skip top level files and folder placeholders
+    inventory = inventory.loc[key_parts.index]
+
+    files = pd.DataFrame({
+        'bucket': inventory['Bucket'],
+        'prefix': inventory['Key'].str.rpartition('/')[0] + '/',
+        'filename': key_parts['filename'],
+        'size': pd.to_numeric(inventory['Size'], errors='coerce') if 'Size' in inventory else None,
+        'etag': inventory['ETag'].str.strip('"') if 'ETag' in inventory else None,
+        'last_modified': inventory['LastModifiedDate'].astype(str) if 'LastModifiedDate' in inventory else None
+    })
+    if dataset == 'GOES':
+        fields = key_parts['filename'].str.extract(r'^OR_([A-Za-z0-9-]+)_(G\d\d)_s(\d{13})\d_e(\d{13})\d_c\d{14}')
+        files['station'] = None
+        files['product_code'] = fields[0]
+        files['scan_start'] = pd.to_datetime(fields[2], format='%Y%j%H%M%S', errors='coerce').dt.strftime('%Y-%m-%dT%H:%M:%S')
+        files['scan_end'] = pd.to_datetime(fields[3], format='%Y%j%H%M%S', errors='coerce').dt.strftime('%Y-%m-%dT%H:%M:%S')
+        files['version'] = fields[1]
+    else:
+        fields = key_parts['filename'].str.extract(r'^([A-Z0-9]{4})(\d{8}_\d{6})(?:_(V\d+))?')
+        files['station'] = fields[0]
+        files['product_code'] = None
+        files['scan_start'] = pd.to_datetime(fields[1], format='%Y%m%d_%H%M%S', errors='coerce').dt.strftime('%Y-%m-%dT%H:%M:%S')
+        files['scan_end'] = None
+        files['version'] = fields[2]
+
+    folders = key_parts[folder_columns].drop_duplicates()
+    return folders, files
+
+def ingest_inventory(inventory_path, database_file_path, dataset=None, processes=DEFAULT_PROCESSES):
+
+    """Function loads an S3 Inventory report into the metadata database as an alternative to listing the bucket through
+    the API: the distinct leaf folders replace the dataset's metadata table (GOES_METADATA or NEXRAD_METADATA) and
+    every object is upserted into the FILES table. Data files are decompressed and parsed in parallel worker processes
+    and written to the database as they come back; the high-water marks of the metadata table and of the file manifest
+    are set to the newest folder of the report.
+    -----
+    Input parameters:
+    inventory_path : str
+        path to the report's manifest.json or to the directory holding it
+    database_file_path : str
+        path of the metadata database
+    dataset : str
+        GOES or NEXRAD; guessed from the report's source bucket when not given
+    processes : int
+        number of data files parsed at the same time
+    -----
+    Returns:
+    A dict with the number of folders and files loaded
+    """
+
+    inventory = read_inventory_manifest(inventory_path)
+    if dataset is None:
+        dataset = 'NEXRAD' if 'nexrad' in (inventory['source_bucket'] or '').lower() else 'GOES'
+    table_name, folder_columns = MANIFEST_SOURCES[dataset]
+
+    db_conn = connect_database(database_file_path, 'write')
+    db_conn.executescript(MANIFEST_DDL)
+    insert = ("INSERT INTO " + MANIFEST_TABLE_NAME + " (" + ", ".join(MANIFEST_COLUMNS) + ") VALUES (" + ", ".join("?" * len(MANIFEST_COLUMNS)) + ")"
+              " ON CONFLICT (bucket, prefix, filename) DO UPDATE SET size = excluded.size, etag = excluded.etag, last_modified = excluded.last_modified")
+
+    folder_frames = []
+    files_loaded = 0
+    data_files = inventory['data_files']
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        parsed = executor.map(parse_inventory_file, data_files, [inventory['file_format']] * len(data_files),
+                              [inventory['columns']] * len(data_files), [dataset] * len(data_files))
+        for folders, files in parsed:   #write every data file's objects as soon as it has been parsed
+            files.insert(0, 'dataset', dataset)
+            files = files.astype(object).where(files.notna(), None)
+            db_conn.executemany(insert, files[MANIFEST_COLUMNS].itertuples(index=False, name=None))
+            db_conn.commit()
+            files_loaded += len(files)
+            folder_frames.append(folders)
+
+    folders = pd.concat(folder_frames).drop_duplicates().sort_values(folder_columns).reset_index(drop=True)
+    folders.insert(0, 'id', range(1, len(folders) + 1))
+    table_statements, index_statements = split_ddl(read_ddl_script(METADATA_DDL_FILES[table_name]))
+    shadow_name = prepare_shadow_table(db_conn, table_statements, table_name)   #load aside, readers keep the old table until the swap
+    insert_rows(db_conn, shadow_name, folders.to_dict('records'))
+    swap_in_shadow(db_conn, table_name, table_statements, index_statements)
+    if len(folders):
+        newest_folder = tuple(folders.iloc[-1][folder_columns])
+        write_high_water_mark(db_conn, table_name, newest_folder)
+        write_high_water_mark(db_conn, MANIFEST_TABLE_NAME + '_' + dataset, newest_folder)
+    db_conn.commit()
+    db_conn.close()
+    return {'dataset': dataset, 'folders': len(folders), 'files': files_loaded}
@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+#the cache is sized from the environment (or the .env file) when the repository is created, e.g.
+#METADATA_CACHE_SIZE=4096 and METADATA_CACHE_CHECK_SECONDS=1
+SIZE_VARIABLE = 'METADATA_CACHE_SIZE'
+CHECK_VARIABLE = 'METADATA_CACHE_CHECK_SECONDS'
+DEFAULT_CACHE_SIZE = 4096   #a full cascade of both buckets is a few thousand answers
+DEFAULT_CHECK_SECONDS = 1.0     #how long a generation read from the database is trusted before it is read again
+
+class GenerationCache:
+
+    """Used to keep the answers of the metadata lookups in memory between scrapes. Every entry is stored with the
+    generation of its table, as scraper_main bumps it in METADATA_GENERATION; a lookup under a newer generation drops
+    all the entries of the table. The cache holds at most max_entries answers and evicts the least recently used one.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()    #(table, key) -> answer, least recently used first
+        self.generations = {}   #table -> generation its entries were stored under
+        self.lock = threading.Lock()
+        self.hits, self.misses, self.evictions, self.invalidations = 0, 0, 0, 0
+
+    def get(self, table_name, key, generation, compute):
+
+        """Function gives the cached answer of a lookup, computing and storing it on a miss.
+        -----
+        Input parameters:
+        table_name : str
+            table the lookup reads
+        key : tuple
+            arguments of the lookup
+        generation : int
+            current generation of the table
+        compute : function
+            called without arguments to compute the answer on a miss
+        -----
+        Returns:
+        The answer of the lookup
+        """
+
+        with self.lock:
+            if self.generations.get(table_name, generation) != generation:
+                self.drop_table(table_name)
+            self.generations[table_name] = generation
+            if (table_name, key) in self.entries:
+                self.hits += 1
+                self.entries.move_to_end((table_name, key))
+                return self.entries[(table_name, key)]
+            self.misses += 1
+
+        value = compute()   #outside the lock, so slow lookups do not queue up the other sessions
+        with self.lock:
+            if self.generations.get(table_name) == generation:  #not stored if a newer generation landed meanwhile
+                self.entries[(table_name, key)] = value
+                self.entries.move_to_end((table_name, key))
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def drop_table(self, table_name):
+
+        """Function drops the entries of a table, the caller holds the lock.
+        -----
+        Input parameters:
+        table_name : str
+            table whose entries are dropped
+        -----
+        Returns:
+        Nothing
+        """
+
+        for entry_key in [entry_key for entry_key in self.entries if entry_key[0] == table_name]:
+            del self.entries[entry_key]
+            self.invalidations += 1
+
+    def stats(self):
+
+        """Function gives the counters of the cache.
+        -----
+        Returns:
+        A dict with the hits, misses, evictions, invalidations (entries dropped by a new generation) and entries
+        """
+
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations,
+                    'entries': len(self.entries)}
+
+class GenerationReader:
+
+    """Used to read the generation of the metadata tables without a query per lookup: a generation read from the
+    database is trusted for check_seconds, so a new scrape is seen at most that long after it committed.
+    """
+
+    def __init__(self, read, check_seconds=DEFAULT_CHECK_SECONDS):
+        self.read = read    #function reading the generation of a table from the database
+        self.check_seconds = check_seconds
+        self.checked = {}   #table -> (monotonic time read, generation)
+        self.lock = threading.Lock()
+
+    def generation(self, table_name):
+
+        """Function gives the generation of a table, read again once check_seconds have passed.
+        -----
+        Input parameters:
+        table_name : str
+            name of the table
+        -----
+        Returns:
+        The generation (int)
+        """
+
+        now = time.monotonic()
+        with self.lock:
+            checked = self.checked.get(table_name)
+        if checked is not None and now - checked[0] < self.check_seconds:
+            return checked[1]
+        generation = self.read(table_name)
+        with self.lock:
+            self.checked[table_name] = (now, generation)
+        return generation
+
+def cache_settings():
+
+    """Function reads the size cap and generation check interval of the cache from the environment.
+    -----
+    Returns:
+    max_entries : int
+        size cap of the cache
+    check_seconds : float
+        seconds a generation read is trusted
+    """
+
+    return (int(os.environ.get(SIZE_VARIABLE, DEFAULT_CACHE_SIZE)),
+            float(os.environ.get(CHECK_VARIABLE, DEFAULT_CHECK_SECONDS)))
@@ -0,0 +1,249 @@
+import os
+import shutil
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from metadata_schema import connect_database, table_exists, read_generation, bump_generation
+
+PARQUET_DIRECTORY = 'metadata_parquet'  #one dataset=<table> folder per metadata table, next to the database
+ROWS_PER_GROUP = 16384  #small enough that a date range only reads the row groups it overlaps
+
+#order the rows of each table are written in, so the min/max statistics of every row group cover a narrow key range;
+#tables with a year column are also partitioned into year=<year> folders
+SNAPSHOT_ORDER = {
+    'GOES_METADATA': ['year', 'day', 'hour', 'product'],
+    'NEXRAD_METADATA': ['year', 'month', 'day', 'ground_station'],
+    'MAPDATA_NEXRAD': ['ground_station']
+}
+
+def snapshot_path(table_name, parquet_directory=PARQUET_DIRECTORY):
+
+    """Function gives the folder holding the Parquet dataset of a table.
+    -----
+    Input parameters:
+    table_name : str
+        name of the metadata table
+    parquet_directory : str
+        folder of the Parquet snapshot, relative to this script's folder unless absolute
+    -----
+    Returns:
+    The path of the dataset=<table> folder (str)
+    """
+
+    return os.path.join(os.path.dirname(__file__), parquet_directory, 'dataset=' + table_name)
+
+def snapshot_generation(table_name, parquet_directory=PARQUET_DIRECTORY):
+
+    """Function gives the generation of a table its Parquet snapshot was written from, recorded in a file next to the
+    dataset=<table> folder.
+    -----
+    Input parameters:
+    table_name : str
+        name of the metadata table
+    parquet_directory : str
+        folder of the Parquet snapshot, relative to this script's folder unless absolute
+    -----
+    Returns:
+    The generation (int), None if the table has no recorded snapshot
+    """
+
+    try:
+        with open(snapshot_path(table_name, parquet_directory) + '.generation') as generation_file:
+            return int(generation_file.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def record_snapshot_generation(table_name, generation, parquet_directory=PARQUET_DIRECTORY):
+
+    """Function records the generation of a table its Parquet snapshot holds, written aside and renamed over the
+    previous record.
+    -----
+    Input parameters:
+    table_name : str
+        name of the metadata table
+    generation : int
+        generation of the table
+    parquet_directory : str
+        folder of the Parquet snapshot, relative to this script's folder unless absolute
+    -----
+    Returns:
+    Nothing
+    """
+
+    generation_path = snapshot_path(table_name, parquet_directory) + '.generation'
+    with open(generation_path + '.new', 'w') as generation_file:
+        generation_file.write(str(generation))
+    os.replace(generation_path + '.new', generation_path)
+
+def write_parquet_snapshot(database_file_path, table_name, parquet_directory=PARQUET_DIRECTORY, rows_per_group=ROWS_PER_GROUP):
+
+    """Used to write a metadata table (or view) out as a Parquet dataset, partitioned by year when it has a year
+    column. Rows are streamed from SQLite in key order, one row group at a time, into a new folder that then replaces
+    the table's previous snapshot, so a reader never sees a half-written dataset. Every fetch of rows_per_group rows
+    becomes one row group (split where the year changes). The generation of the table the rows were read at is
+    recorded with the snapshot.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    table_name : str
+        name of the table to write out
+    parquet_directory : str
+        folder of the Parquet snapshot, relative to this script's folder unless absolute
+    rows_per_group : int
+        rows per Parquet row group
+    -----
+    Returns:
+    The number of rows written (int)
+    """
+
+    db_conn = connect_database(database_file_path, 'read')
+    if not table_exists(db_conn, table_name):
+        db_conn.close()
+        return 0
+    table_columns = [column[1] for column in db_conn.execute("PRAGMA table_info(" + table_name + ")")]
+    db_conn.execute("BEGIN")    #the generation and the rows are read from the same state of the database
+    generation = read_generation(db_conn, table_name)
+    order_columns = [column for column in SNAPSHOT_ORDER.get(table_name, ['id']) if column in table_columns]
+    cursor = db_conn.execute("SELECT * FROM " + table_name + (" ORDER BY " + ", ".join(order_columns) if order_columns else ""))
+    dataset_path = snapshot_path(table_name, parquet_directory)
+    new_path, old_path = dataset_path + '.new', dataset_path + '.old'
+    for path in (new_path, old_path):   #left behind by a snapshot that did not finish
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(new_path)
+
+    #rows come in year order, so each year=<year> file is written to the end before the next one is opened
+    year_index = table_columns.index('year') if 'year' in table_columns else None
+    schema, writer, writer_year, rows_written = None, None, None, 0
+    rows = cursor.fetchmany(rows_per_group)
+    while rows:
+        for year in sorted({row[year_index] for row in rows}) if year_index is not None else [None]:
+            year_rows = [row for row in rows if row[year_index] == year] if year_index is not None else rows
+            if schema is None:
+                schema = pa.RecordBatch.from_arrays([pa.array(values) for values in zip(*year_rows)], names=table_columns).schema
+                if year_index is not None:
+                    schema = schema.remove(year_index)  #read back from the folder name
+            if writer is None or year != writer_year:
+                if writer is not None:
+                    writer.close()
+                file_folder = new_path if year_index is None else os.path.join(new_path, 'year=' + str(year))
+                os.makedirs(file_folder, exist_ok=True)
+                writer, writer_year = pq.ParquetWriter(os.path.join(file_folder, 'part-0.parquet'), schema), year
+            columns = [values for number, values in enumerate(zip(*year_rows)) if number != year_index]
+            writer.write_batch(pa.RecordBatch.from_arrays([pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema),
+                               row_group_size=rows_per_group)
+            rows_written += len(year_rows)
+        rows = cursor.fetchmany(rows_per_group)
+    if writer is not None:
+        writer.close()
+    db_conn.close()
+    if os.path.exists(dataset_path):
+        os.rename(dataset_path, old_path)
+    os.rename(new_path, dataset_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    record_snapshot_generation(table_name, generation, parquet_directory)
+    return rows_written
+
+def refresh_parquet_snapshot(database_file_path, table_name, parquet_directory=PARQUET_DIRECTORY):
+
+    """Used to write the Parquet snapshot of a table again only when the table changed since the snapshot was written.
+    A new snapshot bumps the generation of the table, so lookups the app cached from the previous snapshot under the
+    current generation are dropped, and is recorded under the bumped generation; an unchanged table keeps its
+    snapshot and its generation.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    table_name : str
+        name of the table to write out
+    parquet_directory : str
+        folder of the Parquet snapshot, relative to this script's folder unless absolute
+    -----
+    Returns:
+    The number of rows written (int), None if the snapshot was up to date
+    """
+
+    db_conn = connect_database(database_file_path, 'read')
+    generation = read_generation(db_conn, table_name) if table_exists(db_conn, table_name) else None
+    db_conn.close()
+    if generation is None:
+        return 0
+    if snapshot_generation(table_name, parquet_directory) == generation:
+        return None
+    rows_written = write_parquet_snapshot(database_file_path, table_name, parquet_directory)
+    source_generation = snapshot_generation(table_name, parquet_directory)
+    db_conn = connect_database(database_file_path, 'write')
+    with db_conn:
+        #a load that changed the table while the snapshot was written leaves the recorded generation behind, so the next
+        #run writes the snapshot again
+        current_generation = read_generation(db_conn, table_name)
+        bumped_generation = bump_generation(db_conn, table_name) if current_generation == source_generation else None
+    db_conn.close()
+    if bumped_generation is not None:
+        record_snapshot_generation(table_name, bumped_generation, parquet_directory)
+    return rows_written
+
+def open_parquet_snapshot(table_name, parquet_directory=PARQUET_DIRECTORY):
+
+    """Function opens the Parquet dataset of a table, with its year=<year> folders read as a year column.
+    -----
+    Input parameters:
+    table_name : str
+        name of the metadata table
+    parquet_directory : str
+        folder of the Parquet snapshot, relative to this script's folder unless absolute
+    -----
+    Returns:
+    A pyarrow.dataset.Dataset
+    """
+
+    return ds.dataset(snapshot_path(table_name, parquet_directory), format='parquet', partitioning='hive')
+
+def read_parquet_snapshot(table_name, filters=None, columns=None, parquet_directory=PARQUET_DIRECTORY):
+
+    """Used to read rows of a metadata table from its Parquet snapshot. The filters are pushed down: year filters
+    skip whole partitions, and filters on the other columns skip the row groups whose statistics cannot match, so a
+    range query only reads the bytes it needs.
+    -----
+    Input parameters:
+    table_name : str
+        name of the metadata table
+    filters : list
+        optional filters in the pyarrow/pandas form, e.g. [('year', '>=', 2010), ('ground_station', '=', 'KABX')],
+        or a list of such lists to OR them; values have the column types, e.g. int for year, month, day and hour
+    columns : list
+        optional columns to read, all columns when not given
+    parquet_directory : str
+        folder of the Parquet snapshot, relative to this script's folder unless absolute
+    -----
+    Returns:
+    A DataFrame of the matching rows
+    """
+
+    dataset = open_parquet_snapshot(table_name, parquet_directory)
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+def snapshot_row_groups(table_name, filters=None, parquet_directory=PARQUET_DIRECTORY):
+
+    """Function counts the files and row groups a filtered read of a Parquet snapshot has to open, to check how much
+    of the dataset the filters prune.
+    -----
+    Input parameters:
+    table_name : str
+        name of the metadata table
+    filters : list
+        optional filters, as for read_parquet_snapshot
+    parquet_directory : str
+        folder of the Parquet snapshot, relative to this script's folder unless absolute
+    -----
+    Returns:
+    A dict with the number of files and row groups read and the total number of row groups
+    """
+
+    dataset = open_parquet_snapshot(table_name, parquet_directory)
+    expression = pq.filters_to_expression(filters) if filters else ds.scalar(True)
+    fragments = list(dataset.get_fragments(filter=expression))
+    return {'files': len(fragments),
+            'row_groups': sum(len(fragment.split_by_row_group(expression, schema=dataset.schema)) for fragment in fragments),
+            'total_row_groups': sum(fragment.num_row_groups for fragment in dataset.get_fragments())}
@@ -0,0 +1,303 @@
+import threading
+from query_backend import get_backend
+from metadata_schema import read_generation, folder_columns_sql, scope_filter
+from metadata_cache import GenerationCache, GenerationReader, cache_settings
+from file_manifest import complete_filename, COMPLETION_LIMIT
+from station_locator import StationLocator
+from hierarchy_index import load_hierarchy_index, hierarchy_index_path, HIERARCHY_LEVELS
+
+MAPDATA_QUERY = "SELECT * FROM MAPDATA_NEXRAD ORDER BY id"
+
+def cascade_query(table_name, levels, depth, scope_conditions=()):
+
+    """Function gives the query of the folders below a selection of the app's dropdowns, with the selected values and
+    the scope of the table bound as ? parameters, so every run reuses the prepared statement.
+    -----
+    Input parameters:
+    table_name : str
+        GOES_METADATA or NEXRAD_METADATA
+    levels : list
+        levels to select, in dropdown order
+    depth : int
+        number of dropdowns selected above them
+    scope_conditions : list
+        conditions limiting the table to the assignment's bucket, from scope_filter
+    -----
+    Returns:
+    The query (str)
+    """
+
+    conditions = [level + " = ?" for level in HIERARCHY_LEVELS[table_name][:depth]] + list(scope_conditions)
+    return ("SELECT DISTINCT " + folder_columns_sql(table_name, levels) + " FROM " + table_name +
+            (" WHERE " + " AND ".join(conditions) if conditions else "") +
+            " ORDER BY " + ", ".join(str(number + 1) for number in range(len(levels))))
+
+class MetadataRepository:
+
+    """Used to answer the app's metadata lookups for one database. The dropdown cascades are read from the memory-mapped
+    hierarchy index when there is one, otherwise from the query backend, whose SQLite connections are pooled read-only
+    connections shared by every session of the app. Lookups return plain lists, and their answers are cached until
+    scraper_main bumps the generation of the table.
+    """
+
+    def __init__(self, database_file_path, max_entries=None, check_seconds=None):
+        self.database_file_path = database_file_path
+        default_entries, default_seconds = cache_settings()
+        self.cache = GenerationCache(default_entries if max_entries is None else max_entries)
+        self.generations = GenerationReader(self.read_generation, default_seconds if check_seconds is None else check_seconds)
+
+    def read_generation(self, table_name):
+
+        """Function reads the generation of a table on a pooled read-only connection, whatever backend runs the queries.
+        -----
+        Input parameters:
+        table_name : str
+            name of the table
+        -----
+        Returns:
+        The generation (int)
+        """
+
+        with get_backend(self.database_file_path, 'sqlite').connection() as db_conn:
+            return read_generation(db_conn, table_name)
+
+    def children(self, table_name, path):
+
+        """Function lists the values of the next dropdown of a cascade, from the cache when the table has not changed.
+        -----
+        Input parameters:
+        table_name : str
+            GOES_METADATA or NEXRAD_METADATA
+        path : tuple
+            values selected in the dropdowns above, as the app shows them, e.g. ('ABI-L1b-RadC', '2023')
+        -----
+        Returns:
+        A sorted list of the values (str)
+        """
+
+        path = tuple(path)
+        generation = self.generations.generation(table_name)
+        values = self.cache.get(table_name, path, generation, lambda: self.read_children(table_name, path, generation))
+        return list(values)     #a copy, the caller may change it
+
+    def current_index(self, table_name, generation):
+
+        """Function gives the hierarchy index if it was built from the given generation of a table. Between a load and
+        the rebuild of the index the file still holds the previous generation, which must not be cached under the
+        new one.
+        -----
+        Input parameters:
+        table_name : str
+            GOES_METADATA or NEXRAD_METADATA
+        generation : int
+            generation the answer is cached under
+        -----
+        Returns:
+        A HierarchyIndex, or None if there is no index of that generation
+        """
+
+        index = load_hierarchy_index(hierarchy_index_path(self.database_file_path))
+        if index is None or table_name not in index.trees or index.generations.get(table_name) != generation:
+            return None
+        return index
+
+    def scope(self, table_name):
+
+        """Function gives the conditions limiting a cascade to the assignment's bucket (see DEFAULT_SCOPES), as the
+        hierarchy index is limited when it is built.
+        -----
+        Input parameters:
+        table_name : str
+            GOES_METADATA or NEXRAD_METADATA
+        -----
+        Returns:
+        conditions : list
+            SQL conditions with ? parameters
+        parameters : list
+            values of the parameters
+        """
+
+        with get_backend(self.database_file_path, 'sqlite').connection() as db_conn:
+            return scope_filter(db_conn, table_name, HIERARCHY_LEVELS[table_name])
+
+    def read_children(self, table_name, path, generation=None):
+
+        """Function reads the values of the next dropdown of a cascade from the hierarchy index or the database.
+        -----
+        Input parameters:
+        table_name : str
+            GOES_METADATA or NEXRAD_METADATA
+        path : tuple
+            values selected in the dropdowns above, as the app shows them, e.g. ('ABI-L1b-RadC', '2023')
+        generation : int
+            generation of the table the answer is for, read from the database when not given
+        -----
+        Returns:
+        A sorted list of the values (str)
+        """
+
+        index = self.current_index(table_name, self.read_generation(table_name) if generation is None else generation)
+        if index is not None:
+            return index.children(table_name, path)
+        backend = get_backend(self.database_file_path)    #SQLite or DuckDB, as configured
+        scope_conditions, scope_parameters = self.scope(table_name)
+        level = HIERARCHY_LEVELS[table_name][len(path)]
+        rows = backend.read_rows(cascade_query(table_name, [level], len(path), scope_conditions), tuple(path) + tuple(scope_parameters))
+        return [row[0] for row in rows]
+
+    def subtree(self, table_name, path):
+
+        """Function gives the whole cascade below a selection, e.g. every year, day and hour of a GOES product, so the
+        app can fill the dropdowns below it without another lookup. Cached like the single levels.
+        -----
+        Input parameters:
+        table_name : str
+            GOES_METADATA or NEXRAD_METADATA
+        path : tuple
+            values selected in the dropdowns above, e.g. ('ABI-L1b-RadC',) for a GOES product or ('2023',) for a
+            NEXRAD year
+        -----
+        Returns:
+        A dict nesting the values of each level under the value above it, in sorted order, with a sorted list for
+        the last level, e.g. {'2023': {'001': ['00', '01']}}
+        """
+
+        path = tuple(path)
+        generation = self.generations.generation(table_name)
+        #the cached tree itself is returned, the caller only reads it
+        return self.cache.get(table_name, ('subtree', path), generation, lambda: self.read_subtree(table_name, path, generation))
+
+    def read_subtree(self, table_name, path, generation=None):
+
+        """Function reads the cascade below a selection from the hierarchy index, or in a single query on the database.
+        -----
+        Input parameters:
+        table_name : str
+            GOES_METADATA or NEXRAD_METADATA
+        path : tuple
+            values selected in the dropdowns above
+        generation : int
+            generation of the table the answer is for, read from the database when not given
+        -----
+        Returns:
+        The nested dict, as subtree gives it
+        """
+
+        levels = HIERARCHY_LEVELS[table_name]
+        index = self.current_index(table_name, self.read_generation(table_name) if generation is None else generation)
+        if index is not None:
+            def walk(node_path):
+                values = index.children(table_name, node_path)
+                if len(node_path) == len(levels) - 1:
+                    return values
+                return {value: walk(node_path + (value,)) for value in values}
+            return walk(path)
+
+        below = levels[len(path):]
+        scope_conditions, scope_parameters = self.scope(table_name)
+        query = cascade_query(table_name, below, len(path), scope_conditions)
+        tree = {} if len(below) > 1 else []
+        for row in get_backend(self.database_file_path).read_rows(query, tuple(path) + tuple(scope_parameters)):
+            node = tree
+            for value in row[:-2]:
+                node = node.setdefault(value, {})
+            if len(below) > 1:
+                node = node.setdefault(row[-2], [])
+            node.append(row[-1])
+        return tree
+
+    def cache_stats(self):
+
+        """Function gives the hit, miss, eviction and invalidation counters of the lookup cache.
+        -----
+        Returns:
+        A dict of the counters
+        """
+
+        return self.cache.stats()
+
+    def goes_products(self):
+        return self.children('GOES_METADATA', ())
+
+    def goes_years(self, product):
+        return self.children('GOES_METADATA', (product,))
+
+    def goes_days(self, product, year):
+        return self.children('GOES_METADATA', (product, year))
+
+    def goes_hours(self, product, year, day):
+        return self.children('GOES_METADATA', (product, year, day))
+
+    def nexrad_years(self):
+        return self.children('NEXRAD_METADATA', ())
+
+    def nexrad_months(self, year):
+        return self.children('NEXRAD_METADATA', (year,))
+
+    def nexrad_days(self, year, month):
+        return self.children('NEXRAD_METADATA', (year, month))
+
+    def nexrad_stations(self, year, month, day):
+        return self.children('NEXRAD_METADATA', (year, month, day))
+
+    def filename_completions(self, dataset, typed_name, limit=COMPLETION_LIMIT):
+
+        """Function completes a partly typed file name from the file manifest, on a pooled read-only connection. Not
+        cached, every keystroke is a new lookup and the index answers it directly.
+        -----
+        Input parameters:
+        dataset : str
+            GOES or NEXRAD
+        typed_name : str
+            beginning of the file name
+        limit : int
+            maximum number of completions
+        -----
+        Returns:
+        A list of file names
+        """
+
+        with get_backend(self.database_file_path, 'sqlite').connection() as db_conn:
+            return complete_filename(db_conn, dataset, typed_name, limit)
+
+    def station_locator(self):
+
+        """Function gives the spatial index of the NEXRAD station locations, built once per generation of the
+        MAPDATA_NEXRAD table.
+        -----
+        Returns:
+        A StationLocator
+        """
+
+        return self.cache.get('MAPDATA_NEXRAD', ('locator',), self.generations.generation('MAPDATA_NEXRAD'),
+                              lambda: StationLocator(self.nexrad_mapdata()))
+
+    def nexrad_mapdata(self):
+
+        """Function reads the locations of the NEXRAD stations.
+        -----
+        Returns:
+        A DataFrame of the MAPDATA_NEXRAD table
+        """
+
+        return get_backend(self.database_file_path).read_query(MAPDATA_QUERY)
+
+repositories = {}   #repository per database file, shared by every session of the app
+repositories_lock = threading.Lock()
+
+def get_repository(database_file_path):
+
+    """Function gives the metadata repository of a database, created once per process.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    -----
+    Returns:
+    A MetadataRepository
+    """
+
+    with repositories_lock:
+        if database_file_path not in repositories:
+            repositories[database_file_path] = MetadataRepository(database_file_path)
+        return repositories[database_file_path]
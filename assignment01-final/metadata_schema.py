@@ -0,0 +1,432 @@
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from urllib.request import pathname2url
+
+#PRAGMAs applied to every new connection, per use: bulk writes want a large cache and WAL with NORMAL sync (safe in
+#WAL mode, only the last commits can be lost on power failure), readers want the file mapped and nothing written
+PRAGMA_PROFILES = {
+    'write': [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('cache_size', -64000), ('temp_store', 'MEMORY'), ('mmap_size', 268435456)],
+    'read': [('cache_size', -16000), ('temp_store', 'MEMORY'), ('mmap_size', 268435456), ('query_only', 'ON')]
+}
+
+#DDL script of every metadata table
+METADATA_DDL_FILES = {'GOES_METADATA': 'sql_script_goes18.sql', 'NEXRAD_METADATA': 'sql_script_nexrad.sql', 'MAPDATA_NEXRAD': 'sql_script_mapdata.sql'}
+
+SHADOW_SUFFIX = '_SHADOW'   #a replacing load fills <table>_SHADOW, which is then swapped in for the table
+DIMENSION_TABLES = {'GOES_PRODUCT', 'NEXRAD_STATION'}   #shared by a table and its shadow, rows are only ever added
+#a full-archive crawl stores the folders of every GOES bucket, keyed by bucket in GOES_PRODUCT; rows scraped without a
+#bucket belong to the assignment's bucket (the insert trigger defaults them), and loads of those rows only read and
+#delete the stored folders of that bucket
+DEFAULT_SCOPES = {'GOES_METADATA': {'bucket': 'noaa-goes18'}}
+CREATE_PATTERN = re.compile(r'CREATE\s+(?:UNIQUE\s+)?(TABLE|VIEW|TRIGGER|INDEX)\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+GENERATION_TABLE_NAME = 'METADATA_GENERATION'   #one counter per table, bumped on every swap, append or merge that changed it
+GENERATION_TABLE_DDL = ("CREATE TABLE IF NOT EXISTS " + GENERATION_TABLE_NAME +
+                        " (table_name TEXT PRIMARY KEY, generation INTEGER NOT NULL, swapped_at TEXT)")
+
+#folder names are stored as integers, these formats give back the zero padded names the bucket uses
+COLUMN_FORMATS = {
+    'GOES_METADATA': {'year': '%04d', 'day': '%03d', 'hour': '%02d'},
+    'NEXRAD_METADATA': {'year': '%04d', 'month': '%02d', 'day': '%02d'}
+}
+
+def connect_database(database_file_path, profile='write'):
+
+    """Function opens a connection to the metadata database with one of the PRAGMA profiles applied.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the SQLite database file
+    profile : str
+        name of the profile in PRAGMA_PROFILES, 'write' for loaders and 'read' for the query functions
+    -----
+    Returns:
+    An open sqlite3.Connection
+    """
+
+    db_conn = sqlite3.connect(database_file_path)
+    apply_pragma_profile(db_conn, profile)
+    return db_conn
+
+def connect_read_only(database_file_path):
+
+    """Function opens a read-only connection (mode=ro) to the metadata database with the read PRAGMA profile. The
+    connection can be handed between threads, so it can be kept in a pool; it never creates a missing database.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the SQLite database file
+    -----
+    Returns:
+    An open sqlite3.Connection
+    """
+
+    db_conn = sqlite3.connect('file:' + pathname2url(os.path.abspath(database_file_path)) + '?mode=ro', uri=True, check_same_thread=False)
+    apply_pragma_profile(db_conn, 'read')
+    return db_conn
+
+def apply_pragma_profile(db_conn, profile):
+
+    """Function applies the PRAGMAs of a profile to an open connection. It has to run before the first transaction,
+    journal_mode cannot be changed inside one.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    profile : str
+        name of the profile in PRAGMA_PROFILES
+    -----
+    Returns:
+    A dict of the values SQLite reports for each PRAGMA after setting it
+    """
+
+    applied = {}
+    for pragma, value in PRAGMA_PROFILES[profile]:
+        db_conn.execute("PRAGMA " + pragma + " = " + str(value))
+        applied[pragma] = db_conn.execute("PRAGMA " + pragma).fetchone()[0]
+    return applied
+
+def split_ddl(sql_script):
+
+    """Function splits a DDL script into its statements, keeping the statements inside a trigger body together, and
+    separates the CREATE INDEX statements, so a bulk load can create the tables first and build the indexes once the
+    rows are in.
+    -----
+    Input parameters:
+    sql_script : str
+        content of one of the sql_script_*.sql files
+    -----
+    Returns:
+    table_statements : list
+        CREATE TABLE, VIEW and TRIGGER statements, in script order
+    index_statements : list
+        CREATE INDEX statements
+    """
+
+    statements = []
+    statement = ''
+    for piece in sql_script.split(';'):
+        statement += piece + ';'
+        if sqlite3.complete_statement(statement):   #not complete while inside a BEGIN ... END trigger body
+            if statement.strip(' \n;'):
+                statements.append(statement.strip()[:-1])
+            statement = ''
+    index_statements = [statement for statement in statements if declared_objects([statement])[0][0] == 'INDEX']
+    return [statement for statement in statements if statement not in index_statements], index_statements
+
+def declared_objects(statements):
+
+    """Function lists the objects a list of CREATE statements declares.
+    -----
+    Input parameters:
+    statements : list
+        CREATE TABLE, VIEW, TRIGGER or INDEX statements
+    -----
+    Returns:
+    A list of (kind, name) tuples, kind in upper case, e.g. ('VIEW', 'GOES_METADATA')
+    """
+
+    return [(match.group(1).upper(), match.group(2)) for match in map(CREATE_PATTERN.match, statements) if match]
+
+def drop_object(db_conn, name):
+
+    """Function drops a table or view (with its indexes and triggers) whatever kind it is, if it exists.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    name : str
+        name of the table or view
+    -----
+    Returns:
+    Nothing
+    """
+
+    row = db_conn.execute("SELECT type FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')", (name,)).fetchone()
+    if row is not None:
+        db_conn.execute("DROP " + row[0].upper() + " " + name)
+
+def declared_columns(db_conn, table_name):
+
+    """Function reads the columns a table was declared with.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the table
+    -----
+    Returns:
+    A list of (name, declared type, primary key position) tuples, empty if the table does not exist
+    """
+
+    return [(column[1], column[2].upper(), column[5]) for column in db_conn.execute("PRAGMA table_info(" + table_name + ")")]
+
+def table_exists(db_conn, table_name):
+
+    """Function tells whether a table, or a view standing for one, exists in the database.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the table or view
+    -----
+    Returns:
+    True if it exists, else False
+    """
+
+    return db_conn.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table_name,)).fetchone() is not None
+
+def prepare_table(db_conn, sql_script, table_name):
+
+    """Used to make sure a table has the schema of its DDL script before rows are added to it. A missing table is
+    created and a table left behind with another schema (e.g. the all-text tables pandas used to create, or a wide
+    table that the script now declares as a view over dimension and folder tables) is rebuilt with the declared
+    schema, keeping its rows; values are converted by the column types (or the view's insert trigger) on the way.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    sql_script : str
+        DDL script creating the table and its indexes
+    table_name : str
+        name of the table (or view) the script creates
+    -----
+    Returns:
+    Nothing
+    """
+
+    table_statements, index_statements = split_ddl(sql_script)
+    stored_columns = declared_columns(db_conn, table_name)
+    expected_db = sqlite3.connect(':memory:')   #the schema the script declares, to compare against the stored one
+    for statement in table_statements:
+        expected_db.execute(statement)
+    expected_columns = declared_columns(expected_db, table_name)
+    expected_db.close()
+    if stored_columns and stored_columns != expected_columns:
+        db_conn.commit()
+        with db_conn:   #rebuild in one transaction, DDL does not open one by itself
+            db_conn.execute("BEGIN IMMEDIATE")
+            db_conn.execute("ALTER TABLE " + table_name + " RENAME TO " + table_name + "_OLD")     #only a table can be rebuilt
+            for statement in table_statements:
+                db_conn.execute(statement)
+            copied_columns = ", ".join(column[0] for column in expected_columns if column[0] in {stored[0] for stored in stored_columns})
+            db_conn.execute("INSERT INTO " + table_name + " (" + copied_columns + ") SELECT " + copied_columns + " FROM " + table_name + "_OLD")
+            db_conn.execute("DROP TABLE " + table_name + "_OLD")
+    for statement in table_statements + index_statements:     #every statement of the scripts is IF NOT EXISTS
+        db_conn.execute(statement)
+
+def shadow_table_name(table_name):
+
+    """Function names the shadow table a replacing load of a table is written to.
+    -----
+    Input parameters:
+    table_name : str
+        name of the table being replaced
+    -----
+    Returns:
+    The name of the shadow table (str)
+    """
+
+    return table_name + SHADOW_SUFFIX
+
+def prepare_shadow_table(db_conn, table_statements, table_name):
+
+    """Used to create an empty shadow table for a replacing load, from the CREATE statements of the table. Every
+    table, view and trigger they declare gets a shadow copy, except the dimension tables, which are shared: rows
+    inserted into the shadow view of a normalized table land in the shadow folder table. A shadow left behind by an
+    earlier load is dropped first. Readers keep using the table itself until the shadow is swapped in with
+    swap_in_shadow.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_statements : list
+        CREATE TABLE, VIEW and TRIGGER statements of the table, e.g. the first list returned by split_ddl
+    table_name : str
+        name of the table being replaced
+    -----
+    Returns:
+    The name of the shadow table (or view) to load the rows into (str)
+    """
+
+    shadowed = [name for kind, name in declared_objects(table_statements) if kind in ('TABLE', 'VIEW') and name not in DIMENSION_TABLES]
+    for name in shadowed:
+        drop_object(db_conn, shadow_table_name(name))
+    for statement in table_statements:
+        for name in shadowed + [name for kind, name in declared_objects(table_statements) if kind == 'TRIGGER']:
+            statement = re.sub(r'\b' + name + r'\b', shadow_table_name(name), statement)
+        db_conn.execute(statement)
+    db_conn.commit()
+    return shadow_table_name(table_name)
+
+def swap_in_shadow(db_conn, table_name, table_statements, index_statements=()):
+
+    """Used to replace a table with its loaded shadow in a single transaction: the tables and views of the table are
+    dropped, the shadow tables renamed to them, the views, triggers and indexes created again and the generation
+    bumped. In WAL mode readers are never blocked by this and see either the old rows or the new ones, never a
+    half-loaded table.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the table being replaced
+    table_statements : list
+        CREATE TABLE, VIEW and TRIGGER statements the shadow was prepared with, all IF NOT EXISTS
+    index_statements : list
+        CREATE INDEX statements of the table, e.g. the second list returned by split_ddl
+    -----
+    Returns:
+    The new generation of the table (int)
+    """
+
+    swapped = [(kind, name) for kind, name in declared_objects(table_statements) if kind in ('TABLE', 'VIEW') and name not in DIMENSION_TABLES]
+    db_conn.commit()
+    db_conn.execute("PRAGMA legacy_alter_table = ON")   #do not check views on the table while it is briefly missing
+    try:
+        with db_conn:   #DDL does not open a transaction by itself
+            db_conn.execute("BEGIN IMMEDIATE")
+            for kind, name in swapped:
+                drop_object(db_conn, name)
+                if kind == 'VIEW':
+                    drop_object(db_conn, shadow_table_name(name))   #with its triggers, the view itself is created again
+            for kind, name in swapped:
+                if kind == 'TABLE':
+                    db_conn.execute("ALTER TABLE " + shadow_table_name(name) + " RENAME TO " + name)
+            for statement in list(table_statements) + list(index_statements):
+                db_conn.execute(statement)
+            generation = bump_generation(db_conn, table_name)
+    finally:
+        db_conn.execute("PRAGMA legacy_alter_table = OFF")
+    db_conn.execute("PRAGMA optimize")
+    return generation
+
+def bump_generation(db_conn, table_name):
+
+    """Function increments the generation counter of a table. The caller commits, in the transaction that changed the
+    table.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the changed table
+    -----
+    Returns:
+    The new generation of the table (int)
+    """
+
+    db_conn.execute(GENERATION_TABLE_DDL)
+    db_conn.execute("INSERT INTO " + GENERATION_TABLE_NAME + " (table_name, generation, swapped_at) VALUES (?, 1, ?)"
+                    " ON CONFLICT (table_name) DO UPDATE SET generation = generation + 1, swapped_at = excluded.swapped_at",
+                    (table_name, datetime.now(timezone.utc).isoformat(timespec='seconds')))
+    return db_conn.execute("SELECT generation FROM " + GENERATION_TABLE_NAME + " WHERE table_name = ?", (table_name,)).fetchone()[0]
+
+def read_generation(db_conn, table_name):
+
+    """Function reads the generation counter of a table.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the table
+    -----
+    Returns:
+    The generation (int), 0 if the table was never swapped in
+    """
+
+    try:
+        row = db_conn.execute("SELECT generation FROM " + GENERATION_TABLE_NAME + " WHERE table_name = ?", (table_name,)).fetchone()
+    except sqlite3.OperationalError:    #no table has been swapped in yet
+        return 0
+    return row[0] if row else 0
+
+def read_ddl_script(ddl_file_name):
+
+    """Function reads one of the sql_script_*.sql files next to this module.
+    -----
+    Input parameters:
+    ddl_file_name : str
+        name of the sql script with .sql extension
+    -----
+    Returns:
+    The content of the script (str)
+    """
+
+    with open(os.path.join(os.path.dirname(__file__), ddl_file_name), 'r') as sql_file:
+        return sql_file.read()
+
+def scope_filter(db_conn, table_name, key_columns):
+
+    """Function gives the conditions limiting a load of rows scraped without a bucket to the stored rows of the
+    assignment's bucket (see DEFAULT_SCOPES). Tables without the scope columns, and keys that include them, are not
+    limited.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the metadata table (or its shadow)
+    key_columns : list
+        columns that identify a row of the load
+    -----
+    Returns:
+    conditions : list
+        SQL conditions with ? parameters, to be joined with AND
+    parameters : list
+        values of the parameters
+    """
+
+    table_columns = {column[0] for column in declared_columns(db_conn, table_name)}
+    scope = DEFAULT_SCOPES.get(table_name[:-len(SHADOW_SUFFIX)] if table_name.endswith(SHADOW_SUFFIX) else table_name, {})
+    scoped = [column for column in scope if column in table_columns and column not in key_columns]
+    return [column + " = ?" for column in scoped], [scope[column] for column in scoped]
+
+def folder_columns_sql(table_name, columns):
+
+    """Function gives the SELECT list for folder columns of a metadata table, formatting the integer columns back
+    into the zero padded folder names (e.g. day 7 of GOES as '007'), so keys read from the table compare and join
+    like the keys a scraper produces. Columns already stored as text give the same names.
+    -----
+    Input parameters:
+    table_name : str
+        name of the metadata table
+    columns : list
+        columns to select
+    -----
+    Returns:
+    A comma separated SELECT list (str)
+    """
+
+    if table_name.endswith(SHADOW_SUFFIX):
+        table_name = table_name[:-len(SHADOW_SUFFIX)]
+    formats = COLUMN_FORMATS.get(table_name, {})
+    return ", ".join("printf('" + formats[column] + "', " + column + ")" if column in formats else column for column in columns)
+
+def insert_rows(db_conn, table_name, rows):
+
+    """Function inserts rows into a metadata table with an explicit INSERT INTO table (columns) VALUES (?, ...), so
+    the rows also go through the INSTEAD OF triggers of a metadata view (DataFrame.to_sql only appends to tables).
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the table or view to insert into
+    rows : list
+        dicts (one per row, keyed by column name), all with the columns of the first one
+    -----
+    Returns:
+    The number of rows inserted
+    """
+
+    if not rows:
+        return 0
+    columns = list(rows[0])
+    db_conn.executemany("INSERT INTO " + table_name + " (" + ", ".join(columns) + ") VALUES (" + ", ".join("?" * len(columns)) + ")",
+                        (tuple(row[column] for column in columns) for row in rows))
+    return len(rows)
@@ -0,0 +1,150 @@
+import time
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from s3_crawler import iter_in_order, DEFAULT_MAX_WORKERS
+
+def iter_dates(start_date, end_date):
+
+    """Function yields every calendar date between two dates, both included.
+    -----
+    Input parameters:
+    start_date : datetime.date
+        first date of the range
+    end_date : datetime.date
+        last date of the range
+    -----
+    Returns:
+    A generator of datetime.date values
+    """
+
+    for offset in range((end_date - start_date).days + 1):
+        yield start_date + timedelta(days=offset)
+
+def goes_hour_prefixes(product_prefix, start_date, end_date):
+
+    """Function generates the GOES hour folders (product/YYYY/DDD/HH/) for every hour of a date range, without any
+    round trip to S3, since the year, day of year and hour levels are fully predictable from the calendar.
+    -----
+    Input parameters:
+    product_prefix : str
+        product folder ending with /, e.g. ABI-L1b-RadC/
+    start_date : datetime.date
+        first date of the range
+    end_date : datetime.date
+        last date of the range (included)
+    -----
+    Returns:
+    A list of candidate hour prefixes in time order
+    """
+
+    return [product_prefix + date.strftime('%Y/%j/') + str(hour).zfill(2) + '/'
+            for date in iter_dates(start_date, end_date) for hour in range(24)]
+
+def nexrad_day_prefixes(start_date, end_date):
+
+    """Function generates the NEXRAD day folders (YYYY/MM/DD/) for every day of a date range.
+    -----
+    Input parameters:
+    start_date : datetime.date
+        first date of the range
+    end_date : datetime.date
+        last date of the range (included)
+    -----
+    Returns:
+    A list of day prefixes in time order
+    """
+
+    return [date.strftime('%Y/%m/%d/') for date in iter_dates(start_date, end_date)]
+
+def nexrad_station_prefixes(start_date, end_date, stations):
+
+    """Function generates the NEXRAD ground station folders (YYYY/MM/DD/STATION/) for every day of a date range and
+    every given station.
+    -----
+    Input parameters:
+    start_date : datetime.date
+        first date of the range
+    end_date : datetime.date
+        last date of the range (included)
+    stations : list
+        ground station IDs, e.g. the ones scraped into MAPDATA_NEXRAD
+    -----
+    Returns:
+    A list of candidate station prefixes, in the same order a bucket listing would give
+    """
+
+    stations = sorted(set(stations))   #S3 lists folders in sorted order
+    return [day_prefix + station + '/' for day_prefix in nexrad_day_prefixes(start_date, end_date) for station in stations]
+
+def prefix_exists(s3client, bucket_name, prefix):
+
+    """Function checks if a prefix holds at least one object, asking S3 for a single key only.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client used to call the S3 list API
+    bucket_name : str
+        name of the S3 bucket
+    prefix : str
+        folder path (ending with /) to probe
+    -----
+    Returns:
+    True if at least one object exists below the prefix, else False
+    """
+
+    result = s3client.list_objects_v2(Bucket=bucket_name, Prefix=prefix, MaxKeys=1)
+    return result.get('KeyCount', 0) > 0
+
+def probe_prefixes(s3client, bucket_name, candidate_prefixes, max_workers=DEFAULT_MAX_WORKERS, stats=None):
+
+    """Function probes a list of candidate prefixes concurrently on a bounded thread pool and yields the ones that
+    exist, in the same order as the candidates. Probes are submitted through a bounded window, so a long date range
+    is not queued on the pool all at once.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client used to call the S3 list API (boto3 clients are thread safe)
+    bucket_name : str
+        name of the S3 bucket
+    candidate_prefixes : list
+        prefixes (ending with /) to probe
+    max_workers : int
+        maximum number of probe requests in flight at any time
+    stats : dict
+        optional dict that is filled with the number of prefixes probed, number found, elapsed seconds and throughput
+        in prefixes per second once the generator is exhausted
+    -----
+    Returns:
+    A generator of the candidate prefixes that exist in the bucket
+    """
+
+    start_time = time.time()
+    prefixes_found = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        found = iter_in_order(executor, lambda prefix: prefix_exists(s3client, bucket_name, prefix), candidate_prefixes, 2 * max_workers)
+        for prefix, exists in found:
+            if exists:
+                prefixes_found += 1
+                yield prefix
+
+    if stats is not None:
+        elapsed = time.time() - start_time
+        stats['prefixes_listed'] = len(candidate_prefixes)
+        stats['leaf_prefixes'] = prefixes_found
+        stats['elapsed_seconds'] = elapsed
+        stats['prefixes_per_second'] = len(candidate_prefixes) / elapsed if elapsed > 0 else 0.0
+
+def last_days(number_of_days):
+
+    """Function gives the date range covering the last number_of_days days, today included.
+    -----
+    Input parameters:
+    number_of_days : int
+        number of days in the range
+    -----
+    Returns:
+    A (start_date, end_date) tuple of datetime.date values
+    """
+
+    end_date = datetime.now(timezone.utc).date()    #bucket folders are named in UTC
+    return (end_date - timedelta(days=number_of_days - 1), end_date)
@@ -0,0 +1,196 @@
+import os
+import queue
+import threading
+import pandas as pd
+from contextlib import contextmanager
+from metadata_schema import connect_read_only
+from metadata_parquet import snapshot_path, PARQUET_DIRECTORY
+
+QUERY_BACKENDS = ['sqlite', 'duckdb']
+DUCKDB_SOURCES = ['parquet', 'sqlite']  #DuckDB reads the Parquet snapshot written by scraper_main, or the SQLite file itself
+METADATA_TABLES = ['GOES_METADATA', 'NEXRAD_METADATA', 'MAPDATA_NEXRAD']
+DEFAULT_POOL_SIZE = 8    #idle read-only connections kept per database, more are opened while every one is busy
+
+#the backend is picked from the environment (or the .env file) when the first query runs, e.g.
+#METADATA_QUERY_BACKEND=duckdb and METADATA_DUCKDB_SOURCE=sqlite
+BACKEND_VARIABLE = 'METADATA_QUERY_BACKEND'
+SOURCE_VARIABLE = 'METADATA_DUCKDB_SOURCE'
+
+class SQLiteBackend:
+
+    """Used to run the app's queries on the SQLite database, over a thread-safe pool of read-only connections. A
+    connection is reused by every query, so the statement cache of the connection keeps the prepared queries.
+    """
+
+    def __init__(self, database_file_path, pool_size=DEFAULT_POOL_SIZE):
+        self.database_file_path = database_file_path
+        self.pool = queue.LifoQueue(maxsize=pool_size)   #the most recently used connection has the warmest cache
+
+    @contextmanager
+    def connection(self):
+
+        """Function lends a read-only connection from the pool, opening one when none is idle, and gives it back
+        afterwards; connections beyond the pool size are closed.
+        -----
+        Returns:
+        A context manager giving an open sqlite3.Connection
+        """
+
+        try:
+            db_conn = self.pool.get_nowait()
+        except queue.Empty:
+            db_conn = connect_read_only(self.database_file_path)
+        try:
+            yield db_conn
+        finally:
+            if db_conn.in_transaction:
+                db_conn.rollback()
+            try:
+                self.pool.put_nowait(db_conn)
+            except queue.Full:
+                db_conn.close()
+
+    def read_rows(self, query, parameters=()):
+
+        """Function runs a query and returns its rows.
+        -----
+        Input parameters:
+        query : str
+            SQL query to run, with ? placeholders
+        parameters : tuple
+            values of the query's ? placeholders
+        -----
+        Returns:
+        A list of row tuples
+        """
+
+        with self.connection() as db_conn:
+            return db_conn.execute(query, parameters).fetchall()
+
+    def read_query(self, query, parameters=()):
+
+        """Function runs a query and returns its result.
+        -----
+        Input parameters:
+        query : str
+            SQL query to run
+        parameters : tuple
+            values of the query's ? placeholders
+        -----
+        Returns:
+        A DataFrame of the result
+        """
+
+        with self.connection() as db_conn:
+            return pd.read_sql_query(query, db_conn, params=parameters)
+
+    def close(self):
+
+        """Function closes the idle connections of the pool.
+        -----
+        Returns:
+        Nothing
+        """
+
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+class DuckDBBackend:
+
+    """Used to run the app's queries on the embedded DuckDB engine, which scans and aggregates column-wise in parallel.
+    The metadata tables are exposed under their own names, either from the Parquet snapshot or from the SQLite file
+    (attached read only through DuckDB's sqlite extension), so the same SQL runs on both backends. One DuckDB
+    connection is shared, every query runs on a cursor of its own so threads can query at the same time.
+    """
+
+    def __init__(self, database_file_path, parquet_directory=PARQUET_DIRECTORY, source='parquet'):
+        import duckdb   #only needed when DuckDB is configured
+        self.source = source
+        self.db_conn = duckdb.connect()
+        if source == 'sqlite':
+            try:
+                self.db_conn.execute("LOAD sqlite")     #installed from the DuckDB extension repository on first use
+            except duckdb.Error as error:
+                raise RuntimeError("DuckDB cannot read the SQLite file, its sqlite extension is not available (install it with "
+                                   "INSTALL sqlite, or set " + SOURCE_VARIABLE + "=parquet): " + str(error).split('\n')[0]) from error
+            self.db_conn.execute("ATTACH '" + database_file_path.replace("'", "''") + "' AS metadata (TYPE SQLITE, READ_ONLY)")
+            self.db_conn.execute("USE metadata")
+            return
+        for table_name in METADATA_TABLES:
+            dataset_path = snapshot_path(table_name, parquet_directory)
+            if os.path.isdir(dataset_path):     #a table missing from the snapshot fails its queries, as in SQLite
+                self.db_conn.execute("CREATE VIEW " + table_name + " AS SELECT * EXCLUDE (dataset) FROM read_parquet('" +
+                                     os.path.join(dataset_path, '**', '*.parquet').replace("'", "''") + "', hive_partitioning = true)")
+
+    def read_rows(self, query, parameters=()):
+
+        """Function runs a query and returns its rows.
+        -----
+        Input parameters:
+        query : str
+            SQL query to run, with ? placeholders
+        parameters : tuple
+            values of the query's ? placeholders
+        -----
+        Returns:
+        A list of row tuples
+        """
+
+        cursor = self.db_conn.cursor()
+        try:
+            return cursor.execute(query, list(parameters)).fetchall()
+        finally:
+            cursor.close()
+
+    def read_query(self, query, parameters=()):
+
+        """Function runs a query and returns its result.
+        -----
+        Input parameters:
+        query : str
+            SQL query to run
+        parameters : tuple
+            values of the query's ? placeholders
+        -----
+        Returns:
+        A DataFrame of the result
+        """
+
+        cursor = self.db_conn.cursor()
+        try:
+            return cursor.execute(query, list(parameters)).df()
+        finally:
+            cursor.close()
+
+backends = {}   #backend per (engine, source, database file), created once per process
+backends_lock = threading.Lock()
+
+def get_backend(database_file_path, engine=None, source=None):
+
+    """Function gives the query backend for a database, as configured by METADATA_QUERY_BACKEND (sqlite, the default,
+    or duckdb) and METADATA_DUCKDB_SOURCE (parquet, the default, or sqlite).
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    engine : str
+        sqlite or duckdb, read from the environment when not given
+    source : str
+        what DuckDB reads, parquet or sqlite, read from the environment when not given
+    -----
+    Returns:
+    A SQLiteBackend or DuckDBBackend
+    """
+
+    engine = engine or os.environ.get(BACKEND_VARIABLE, 'sqlite').lower()
+    source = source or os.environ.get(SOURCE_VARIABLE, 'parquet').lower()
+    if engine not in QUERY_BACKENDS or source not in DUCKDB_SOURCES:
+        raise ValueError("Unknown query backend " + engine + " reading " + source)
+    key = (engine, source if engine == 'duckdb' else None, database_file_path)
+    with backends_lock:
+        if key not in backends:
+            backends[key] = DuckDBBackend(database_file_path, source=source) if engine == 'duckdb' else SQLiteBackend(database_file_path)
+        return backends[key]
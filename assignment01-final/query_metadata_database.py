@@ -1,7 +1,7 @@
 import os
-import sqlite3
 import pandas as pd
 from pathlib import Path
+from metadata_repository import get_repository
 
 database_file_name = 'sql_scraped_database.db'    #the database (.db) file which has all the metadata that is needed populated in it
 database_file_path = os.path.join(os.path.dirname(__file__),database_file_name)      #set path to the database file
@@ -18,16 +18,11 @@ def get_product_goes():
      A list containing all distinct product names or False (bool) in case of error
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT DISTINCT product FROM GOES_METADATA"   #sql query to execute
      try: #added try-except block to handle case when GOES18 database/table is not populated
-          df_product = pd.read_sql_query(query, db_conn)
+          return get_repository(database_file_path).goes_products()
      except:
           return False
 
-     products = df_product['product'].tolist()    #convert the returned df to a list
-     return products
-     
 def get_years_in_product_goes(selected_product):
 
      """Function to query distinct year values present in the SQLite database's GOES_METADATA (GOES-18 satellite data) table 
@@ -41,11 +36,7 @@ def get_years_in_product_goes(selected_product):
      A list containing all distinct years for given product name 
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT DISTINCT year FROM GOES_METADATA WHERE product = " + "\'" + selected_product + "\'" #sql query to execute
-     df_year = pd.read_sql_query(query, db_conn)
-     years = df_year['year'].tolist()   #convert the returned df to a list
-     return years
+     return get_repository(database_file_path).goes_years(selected_product)
 
 def get_days_in_year_goes(selected_year, selected_product):
 
@@ -62,11 +53,7 @@ def get_days_in_year_goes(selected_year, selected_product):
      A list containing all distinct days for given year 
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT DISTINCT day FROM GOES_METADATA WHERE year = " + "\'" + selected_year + "\'" + "AND product = " + "\'" + selected_product + "\'" #sql query to execute
-     df_day = pd.read_sql_query(query, db_conn)
-     days = df_day['day'].tolist() #convert the returned df to a list
-     return days
+     return get_repository(database_file_path).goes_days(selected_product, selected_year)
 
 def get_hours_in_day_goes(selected_day, selected_year, selected_product):
 
@@ -85,11 +72,22 @@ def get_hours_in_day_goes(selected_day, selected_year, selected_product):
      A list containing all distinct hours for given day 
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT DISTINCT hour FROM GOES_METADATA WHERE day = " + "\'" + selected_day + "\'" + "AND year = " + "\'" + selected_year + "\'" + "AND product = " + "\'" + selected_product + "\'" #sql query to execute
-     df_hour = pd.read_sql_query(query, db_conn)
-     hours = df_hour['hour'].tolist()   #convert the returned df to a list
-     return hours
+     return get_repository(database_file_path).goes_hours(selected_product, selected_year, selected_day)
+
+def get_product_tree_goes(selected_product):
+
+     """Function to query every year, day and hour present in the SQLite database's GOES_METADATA (GOES-18 satellite
+     data) table for a given product at once, so the year, day and hour boxes are filled without further queries.
+     -----
+     Input parameters:
+     selected_product : str
+          string containing product name
+     -----
+     Returns:
+     A dict of years, each a dict of days, each a list of hours, e.g. {'2023': {'001': ['00', '01']}}
+     """
+
+     return get_repository(database_file_path).subtree('GOES_METADATA', (selected_product,))
 
 def get_years_nexrad():
 
@@ -103,14 +101,10 @@ def get_years_nexrad():
      A list containing all distinct years or False (bool) in case of error
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT DISTINCT year FROM NEXRAD_METADATA"
      try: #added try-except block to handle case when NEXRAD database/table is not populated
-          df_year = pd.read_sql_query(query, db_conn)
+          return get_repository(database_file_path).nexrad_years()
      except:
           return False
-     years = df_year['year'].tolist()   #convert the returned df to a list
-     return years
 
 def get_months_in_year_nexrad(selected_year):
 
@@ -125,11 +119,7 @@ def get_months_in_year_nexrad(selected_year):
      A list containing all distinct month values 
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT DISTINCT month FROM NEXRAD_METADATA WHERE year = " + "\'" + selected_year + "\'"    #sql query to execute
-     df_month = pd.read_sql_query(query, db_conn)
-     months = df_month['month'].tolist()     #convert the returned df to a list
-     return months
+     return get_repository(database_file_path).nexrad_months(selected_year)
 
 def get_days_in_month_nexrad(selected_month, selected_year):
      
@@ -146,11 +136,7 @@ def get_days_in_month_nexrad(selected_month, selected_year):
      A list containing all distinct day values 
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT DISTINCT day FROM NEXRAD_METADATA WHERE month = " + "\'" + selected_month + "\'" + "AND year = " + "\'" + selected_year + "\'"   #sql query to execute
-     df_day = pd.read_sql_query(query, db_conn)
-     days = df_day['day'].tolist() #convert the returned df to a list
-     return days
+     return get_repository(database_file_path).nexrad_days(selected_year, selected_month)
 
 def get_stations_for_day_nexrad(selected_day, selected_month, selected_year):
 
@@ -169,11 +155,42 @@ def get_stations_for_day_nexrad(selected_day, selected_month, selected_year):
      A list containing all distinct day values 
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT DISTINCT ground_station FROM NEXRAD_METADATA WHERE day = " + "\'" + selected_day + "\'" + "AND month = " + "\'" + selected_month + "\'" + " AND year =" + "\'" + selected_year + "\'"   #sql query to execute
-     df_station = pd.read_sql_query(query, db_conn)
-     stations = df_station['ground_station'].tolist()  #convert the returned df to a list
-     return stations
+     return get_repository(database_file_path).nexrad_stations(selected_year, selected_month, selected_day)
+
+def get_year_tree_nexrad(selected_year):
+
+     """Function to query every month, day and ground station present in the SQLite database's NEXRAD_METADATA (NEXRAD
+     satellite data) table for a given year at once, so the month, day and station boxes are filled without further queries.
+     -----
+     Input parameters:
+     selected_year : str
+          string containing year
+     -----
+     Returns:
+     A dict of months, each a dict of days, each a list of ground stations, e.g. {'01': {'01': ['KABX', 'KBGM']}}
+     """
+
+     return get_repository(database_file_path).subtree('NEXRAD_METADATA', (selected_year,))
+
+def get_filename_completions(dataset, typed_filename):
+
+     """Function to query the file names in the SQLite database's FILES (file manifest) table that start with what the
+     user has typed so far, for the search by filename.
+     -----
+     Input parameters:
+     dataset : str
+          GOES or NEXRAD
+     typed_filename : str
+          string containing the beginning of a file name
+     -----
+     Returns:
+     A list containing the matching file names (empty if there are none, or if the manifest cannot be read)
+     """
+
+     try: #added try-except block to handle case when the database is not populated
+          return get_repository(database_file_path).filename_completions(dataset, typed_filename)
+     except:
+          return []
 
 def get_nextrad_mapdata():
 
@@ -187,10 +204,45 @@ def get_nextrad_mapdata():
      A dataframe containing entire table or False (bool) in case of error
      """
 
-     db_conn = sqlite3.connect(database_file_path)     #connection to the db
-     query = "SELECT * FROM MAPDATA_NEXRAD"
      try: #added try-except block to handle case when NEXRAD database/table is not populated
-          df_mapdata = pd.read_sql_query(query, db_conn)
+          return get_repository(database_file_path).nexrad_mapdata()
      except:
           return pd.DataFrame()
-     return df_mapdata
\ No newline at end of file
+
+def get_nearest_stations_nexrad(latitude, longitude, k=3):
+
+     """Function to find the NEXRAD ground stations nearest to a point, from the locations in the SQLite database's
+     MAPDATA_NEXRAD table.
+     -----
+     Input parameters:
+     latitude : float
+          latitude of the point in degrees
+     longitude : float
+          longitude of the point in degrees
+     k : int
+          number of stations to return
+     -----
+     Returns:
+     A dataframe with the ground_station and distance_km of the k nearest stations, nearest first
+     """
+
+     codes, distances = get_repository(database_file_path).station_locator().nearest(latitude, longitude, k)
+     return pd.DataFrame({'ground_station': codes[0], 'distance_km': distances[0]})
+
+def get_stations_covering_nexrad(latitude, longitude):
+
+     """Function to find the NEXRAD ground stations whose radar coverage reaches a point, from the locations in the
+     SQLite database's MAPDATA_NEXRAD table.
+     -----
+     Input parameters:
+     latitude : float
+          latitude of the point in degrees
+     longitude : float
+          longitude of the point in degrees
+     -----
+     Returns:
+     A dataframe with the ground_station and distance_km of the covering stations, nearest first
+     """
+
+     hits = get_repository(database_file_path).station_locator().covering(latitude, longitude)[0]
+     return pd.DataFrame(hits, columns=['ground_station', 'distance_km'])
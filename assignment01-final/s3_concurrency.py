@@ -0,0 +1,206 @@
+import time
+import random
+import threading
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectTimeoutError, ReadTimeoutError, EndpointConnectionError, ConnectionClosedError
+
+INITIAL_LIMIT = 8   #requests allowed in flight before the governor has seen any latency
+MIN_LIMIT = 1
+MAX_LIMIT = 256
+DECREASE_FACTOR = 0.5   #multiplicative cut of the limit on a throttle
+LATENCY_TOLERANCE = 2.0     #the limit only grows while latency stays within this factor of the best latency seen
+BEST_LATENCY_DRIFT = 1.01   #the best latency slowly drifts up, so a single lucky response is forgotten
+MAX_THROTTLE_RETRIES = 6    #throttled and transient failures are retried by the governor instead of by botocore
+BACKOFF_BASE_SECONDS = 0.1
+THROTTLE_CODES = {'SlowDown', '503', 'ServiceUnavailable', 'RequestTimeout', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded'}
+TRANSIENT_CODES = {'InternalError', '500', '502', '504'}    #server errors worth retrying that do not ask for fewer requests
+#single requests only: a managed transfer (copy, download_file) makes its calls on the wrapped client, past the governor
+GOVERNED_OPERATIONS = {'list_objects', 'list_objects_v2', 'head_object', 'copy_object', 'get_object'}
+
+#botocore's own retries are switched off for governed clients: a throttled request is retried by the governor after
+#the limit has been cut, and other transient failures (server errors, dropped connections) are retried by it with the
+#same backoff, instead of every worker hammering S3 with its own retries
+NO_RETRIES_CONFIG = Config(retries={'mode': 'standard', 'max_attempts': 1})
+
+class ConcurrencyGovernor:
+
+    """Used to adapt the number of S3 requests in flight with additive increase / multiplicative decrease (AIMD).
+    Every successful request whose latency stays within LATENCY_TOLERANCE of the best latency seen raises the limit
+    by 1/limit (so about one more request per round of limit requests); a SlowDown, 503 or timeout cuts the limit by
+    DECREASE_FACTOR, at most once per round trip so a burst of throttles from the same window only counts once.
+    One governor is shared by every thread of a process.
+    """
+
+    def __init__(self, initial_limit=INITIAL_LIMIT, min_limit=MIN_LIMIT, max_limit=MAX_LIMIT):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.requests = 0
+        self.throttle_events = []   #(time, operation, error code) of every throttled request
+        self.condition = threading.Condition()
+
+    @property
+    def current_limit(self):
+
+        """Function gives the number of requests currently allowed in flight.
+        -----
+        Returns:
+        An int, at least min_limit
+        """
+
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self):
+
+        """Function blocks until one more request may be sent.
+        -----
+        Returns:
+        The start time (float) of the request, to hand back to release
+        """
+
+        with self.condition:
+            while self.in_flight >= self.current_limit:
+                self.condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, start_time, operation, error_code=None, succeeded=True):
+
+        """Function records the outcome of a request and adapts the limit.
+        -----
+        Input parameters:
+        start_time : float
+            value returned by acquire
+        operation : str
+            name of the S3 operation, recorded with throttle events
+        error_code : str
+            throttle error the request failed with, None if it was not throttled
+        succeeded : bool
+            False if the request failed for any other reason, which leaves the limit as it is
+        -----
+        Returns:
+        Nothing
+        """
+
+        now = time.monotonic()
+        latency = now - start_time
+        with self.condition:
+            self.in_flight -= 1
+            self.requests += 1
+            if error_code is not None:
+                self.throttle_events.append((time.time(), operation, error_code))
+                if start_time >= self.last_decrease:    #only cut once for the requests that were already in flight
+                    self.limit = max(float(self.min_limit), self.limit * DECREASE_FACTOR)
+                    self.last_decrease = now
+            elif succeeded:
+                self.best_latency = latency if self.best_latency is None else min(self.best_latency * BEST_LATENCY_DRIFT, latency)
+                if latency <= self.best_latency * LATENCY_TOLERANCE:
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def stats(self):
+
+        """Function summarises the governor's state.
+        -----
+        Returns:
+        A dict with the current limit, requests in flight, requests completed, number of throttle events and the best
+        latency seen in seconds
+        """
+
+        with self.condition:
+            return {'current_limit': self.current_limit, 'in_flight': self.in_flight, 'requests': self.requests,
+                    'throttle_events': len(self.throttle_events), 'best_latency': self.best_latency}
+
+def throttle_code(error):
+
+    """Function tells whether an error raised by an S3 call means S3 wants fewer requests.
+    -----
+    Input parameters:
+    error : Exception
+        error raised by the call
+    -----
+    Returns:
+    The error code (str) if it is a throttle or timeout, else None
+    """
+
+    if isinstance(error, (ConnectTimeoutError, ReadTimeoutError)):
+        return type(error).__name__
+    if isinstance(error, ClientError):
+        code = str(error.response.get('Error', {}).get('Code'))
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if code in THROTTLE_CODES or status == 503:
+            return code
+    return None
+
+def transient_error(error):
+
+    """Function tells whether an error raised by an S3 call is a transient failure that is not a throttle, e.g. a 500
+    InternalError or a dropped connection, so the call can be retried without cutting the limit.
+    -----
+    Input parameters:
+    error : Exception
+        error raised by the call
+    -----
+    Returns:
+    True if the call is worth retrying, else False
+    """
+
+    if isinstance(error, (EndpointConnectionError, ConnectionClosedError)):
+        return True
+    if isinstance(error, ClientError):
+        code = str(error.response.get('Error', {}).get('Code'))
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return code in TRANSIENT_CODES or status in (500, 502, 504)
+    return False
+
+class GovernedS3Client:
+
+    """Used to send the listing and copy calls of a boto3 S3 client through a ConcurrencyGovernor. Throttled calls
+    are retried with jittered exponential backoff after the limit has been cut, other transient failures with the
+    same backoff and the limit left as it is; every other attribute is passed through to the wrapped client.
+    """
+
+    def __init__(self, s3client, governor):
+        self.s3client = s3client
+        self.governor = governor
+
+    def __getattr__(self, name):
+        attribute = getattr(self.s3client, name)
+        if name not in GOVERNED_OPERATIONS:
+            return attribute
+        def governed_call(*args, **kwargs):
+            for attempt in range(MAX_THROTTLE_RETRIES + 1):
+                start_time = self.governor.acquire()
+                try:
+                    result = attribute(*args, **kwargs)
+                except Exception as error:
+                    error_code = throttle_code(error)
+                    self.governor.release(start_time, name, error_code, succeeded=False)
+                    if (error_code is None and not transient_error(error)) or attempt == MAX_THROTTLE_RETRIES:
+                        raise
+                    time.sleep(random.uniform(0, BACKOFF_BASE_SECONDS * 2 ** attempt))     #full jitter backoff
+                    continue
+                self.governor.release(start_time, name)
+                return result
+        return governed_call
+
+s3_governor = ConcurrencyGovernor()     #shared by every listing and copy path of the process
+
+def governed(s3client, governor=None):
+
+    """Function wraps a boto3 S3 client so its listing and copy calls go through a concurrency governor.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client to wrap, ideally created with NO_RETRIES_CONFIG
+    governor : ConcurrencyGovernor
+        governor to use, defaults to the one shared by the whole process
+    -----
+    Returns:
+    A GovernedS3Client
+    """
+
+    return GovernedS3Client(s3client, governor or s3_governor)
@@ -0,0 +1,225 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 16    #size of the worker pool used to list prefixes concurrently
+PAGE_SIZE = 1000    #maximum number of keys S3 returns in one ListObjectsV2 page
+
+def iter_list_pages(s3client, bucket_name, prefix, delimiter='/'):
+
+    """Function lists a single prefix within an S3 bucket with ListObjectsV2 and yields every page of the response,
+    following the continuation token until the listing is no longer truncated. A plain list_objects call stops at
+    the first 1000 children, so any level bigger than that has to be paged through.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client used to call the S3 list API
+    bucket_name : str
+        name of the S3 bucket to list
+    prefix : str
+        folder path (ending with /) to list
+    delimiter : str
+        delimiter used to group keys into CommonPrefixes, None to list every object below the prefix
+    -----
+    Returns:
+    A generator of raw ListObjectsV2 response pages
+    """
+
+    list_kwargs = {'Bucket': bucket_name, 'Prefix': prefix, 'MaxKeys': PAGE_SIZE}
+    if delimiter:
+        list_kwargs['Delimiter'] = delimiter
+    while True:
+        page = s3client.list_objects_v2(**list_kwargs)
+        yield page
+        if not page.get('IsTruncated'):     #last page reached
+            break
+        list_kwargs['ContinuationToken'] = page.get('NextContinuationToken')
+
+def list_common_prefixes(s3client, bucket_name, prefix):
+
+    """Function lists all immediate sub folders (CommonPrefixes) of a single prefix within an S3 bucket, across
+    every page of the listing.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client used to call the S3 list API
+    bucket_name : str
+        name of the S3 bucket to list
+    prefix : str
+        folder path (ending with /) whose sub folders should be listed
+    -----
+    Returns:
+    A list containing the full prefix of every sub folder, in the order S3 returned them
+    """
+
+    sub_folders = []
+    for page in iter_list_pages(s3client, bucket_name, prefix):
+        sub_folders.extend(p.get('Prefix') for p in page.get('CommonPrefixes', []))    #a page may have no CommonPrefixes key
+    return sub_folders
+
+def list_objects_under(s3client, bucket_name, prefix):
+
+    """Function lists every object below a prefix within an S3 bucket, across every page of the listing.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client used to call the S3 list API
+    bucket_name : str
+        name of the S3 bucket to list
+    prefix : str
+        folder path (ending with /) whose objects should be listed
+    -----
+    Returns:
+    A list of the Contents entries (dicts with Key, Size, ETag, LastModified) in key order
+    """
+
+    objects = []
+    for page in iter_list_pages(s3client, bucket_name, prefix, delimiter=None):
+        objects.extend(page.get('Contents', []))     #an empty folder has no Contents key
+    return objects
+
+def iter_in_order(executor, function, items, window_size):
+
+    """Function runs a function over items on an executor and yields (item, result) pairs strictly in item order,
+    keeping at most window_size calls in flight, so results can be consumed while the rest are still running
+    without the whole result set being held in memory.
+    -----
+    Input parameters:
+    executor : concurrent.futures.Executor
+        executor the calls are submitted to
+    function : function
+        function called with a single item
+    items : iterable
+        items to call the function with
+    window_size : int
+        maximum number of submitted calls whose result has not been consumed yet
+    -----
+    Returns:
+    A generator of (item, result) tuples
+    """
+
+    in_flight = deque()     #futures drained in submission order
+    items = iter(items)
+    for item in items:
+        in_flight.append((item, executor.submit(function, item)))
+        if len(in_flight) >= window_size:   #keep the window full while the oldest call is consumed
+            break
+    while in_flight:
+        item, future = in_flight.popleft()
+        result = future.result()
+        next_item = next(items, None)
+        if next_item is not None:
+            in_flight.append((next_item, executor.submit(function, next_item)))
+        yield item, result
+
+def prefixes_from(start_parts):
+
+    """Function builds a prefix filter for the crawler that keeps only the folders at or after a given position in the
+    folder tree, e.g. ('2023', '02', '10') keeps 2023/, 2023/02/, 2023/02/10/, 2023/03/... but drops 2022/ and
+    2023/01/. Folder names in both buckets are zero padded, so plain string comparison follows time order.
+    -----
+    Input parameters:
+    start_parts : tuple
+        folder names, from the top of the bucket down, of the first position to keep
+    -----
+    Returns:
+    A function taking a prefix and returning True if the prefix should be crawled
+    """
+
+    start_parts = tuple(start_parts)
+    def keep_prefix(prefix):
+        parts = tuple(prefix.split('/')[:-1])   #drop the empty string after the trailing /
+        compared_levels = min(len(parts), len(start_parts))
+        return parts[:compared_levels] >= start_parts[:compared_levels]
+    return keep_prefix
+
+def iter_prefix_tree(s3client, bucket_name, root_prefixes, depth, max_workers=DEFAULT_MAX_WORKERS, stats=None, prefix_filter=None):
+
+    """Function walks the folder tree of an S3 bucket, level by level, starting from the given root prefixes, and
+    yields the leaf prefixes as soon as their parent has been listed. All prefixes of an upper level are listed
+    concurrently on a bounded thread pool and flattened back in the same order as their parents. The last level is
+    streamed through a bounded window of in-flight listings that is drained strictly in order, so the leaves come out
+    in exactly the order a sequential nested walk gives while only a window's worth of them is held in memory.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client used to call the S3 list API (boto3 clients are thread safe)
+    bucket_name : str
+        name of the S3 bucket to crawl
+    root_prefixes : list
+        list of prefixes (ending with /) to start the crawl from
+    depth : int
+        number of folder levels to descend below the root prefixes
+    max_workers : int
+        maximum number of list requests in flight at any time
+    stats : dict
+        optional dict that is filled with the number of prefixes listed, number of leaves, elapsed seconds and
+        throughput in prefixes per second once the generator is exhausted
+    prefix_filter : function
+        optional function taking a prefix and returning False for folders (roots included) that should be skipped
+        along with everything below them, see prefixes_from
+    -----
+    Returns:
+    A generator of all prefixes found at the requested depth, in deterministic order
+    """
+
+    start_time = time.time()
+    prefixes_listed = 0
+    leaf_prefixes = 0
+    keep_prefix = prefix_filter if prefix_filter is not None else (lambda prefix: True)
+    current_level = [root for root in root_prefixes if keep_prefix(root)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list_children = lambda prefix: [child for child in list_common_prefixes(s3client, bucket_name, prefix) if keep_prefix(child)]
+        for level in range(depth - 1):
+            #executor.map keeps the results in the same order as the input prefixes
+            children = executor.map(list_children, current_level)
+            prefixes_listed += len(current_level)
+            current_level = [child for level_children in children for child in level_children]
+
+        if depth > 0:
+            for parent, level_children in iter_in_order(executor, list_children, current_level, 2 * max_workers):
+                prefixes_listed += 1
+                for child in level_children:
+                    leaf_prefixes += 1
+                    yield child
+        else:
+            for root in current_level:
+                leaf_prefixes += 1
+                yield root
+
+    if stats is not None:
+        elapsed = time.time() - start_time
+        stats['prefixes_listed'] = prefixes_listed
+        stats['leaf_prefixes'] = leaf_prefixes
+        stats['elapsed_seconds'] = elapsed
+        stats['prefixes_per_second'] = prefixes_listed / elapsed if elapsed > 0 else 0.0
+
+def crawl_prefix_tree(s3client, bucket_name, root_prefixes, depth, max_workers=DEFAULT_MAX_WORKERS, prefix_filter=None):
+
+    """Function walks the folder tree of an S3 bucket starting from the given root prefixes and collects every leaf
+    prefix found at the requested depth. See iter_prefix_tree for the streaming version.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client used to call the S3 list API (boto3 clients are thread safe)
+    bucket_name : str
+        name of the S3 bucket to crawl
+    root_prefixes : list
+        list of prefixes (ending with /) to start the crawl from
+    depth : int
+        number of folder levels to descend below the root prefixes
+    max_workers : int
+        maximum number of list requests in flight at any time
+    prefix_filter : function
+        optional function taking a prefix and returning False for folders that should be skipped
+    -----
+    Returns:
+    leaf_prefixes : list
+        all prefixes found at the requested depth, in deterministic order
+    stats : dict
+        number of prefixes listed, number of leaves, elapsed seconds and throughput in prefixes per second
+    """
+
+    stats = {}
+    leaf_prefixes = list(iter_prefix_tree(s3client, bucket_name, root_prefixes, depth, max_workers, stats, prefix_filter))
+    return leaf_prefixes, stats
@@ -0,0 +1,350 @@
+import os
+import time
+import socket
+import sqlite3
+import threading
+from s3_crawler import iter_prefix_tree, DEFAULT_MAX_WORKERS
+from scraper_archive import s3_client, GOES_ARCHIVE_COLUMNS, NEXRAD_ARCHIVE_COLUMNS
+from metadata_schema import connect_database, prepare_shadow_table, swap_in_shadow, split_ddl, read_ddl_script, declared_columns, METADATA_DDL_FILES
+
+DEFAULT_LEASE_SECONDS = 300     #a leased prefix goes back to the queue if its worker stops renewing for this long
+DEFAULT_POLL_SECONDS = 15   #how long an idle worker waits before asking again while other leases are still running
+MAX_ATTEMPTS = 5    #leases of a prefix before it is marked as failed instead of being handed out again
+QUEUE_TABLE_NAME = 'WORK_QUEUE'
+RESULTS_TABLE_NAME = 'WORK_RESULTS'
+QUEUE_DDL = """
+CREATE TABLE IF NOT EXISTS WORK_QUEUE (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    satellite TEXT NOT NULL,
+    root TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    UNIQUE (bucket, root)
+);
+CREATE INDEX IF NOT EXISTS WORK_QUEUE_STATUS_INDEX ON WORK_QUEUE (status, lease_expires);
+CREATE TABLE IF NOT EXISTS WORK_RESULTS (
+    item_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    bucket TEXT, satellite TEXT, level1 TEXT, level2 TEXT, level3 TEXT, level4 TEXT,
+    PRIMARY KEY (item_id, seq)
+);
+"""
+
+def connect_queue(queue_file_path):
+
+    """Function opens the queue database. Several processes on several hosts share it, so it waits on locks instead
+    of failing right away; for workers on other hosts the file has to sit on a shared volume.
+    -----
+    Input parameters:
+    queue_file_path : str
+        path of the SQLite queue database, created if missing
+    -----
+    Returns:
+    A sqlite3.Connection in autocommit mode, transactions are opened explicitly
+    """
+
+    db_conn = sqlite3.connect(queue_file_path, timeout=60, isolation_level=None)
+    db_conn.executescript(QUEUE_DDL)
+    return db_conn
+
+def seed_work_queue(queue_file_path, shards):
+
+    """Function seeds the queue with the shards of a crawl (see plan_archive_shards). Shards already in the queue are
+    left as they are, so seeding again after new years showed up only adds the new ones.
+    -----
+    Input parameters:
+    queue_file_path : str
+        path of the SQLite queue database
+    shards : list
+        shard dicts with the dataset, bucket, satellite, root prefix and depth to crawl
+    -----
+    Returns:
+    The number of new queue items
+    """
+
+    db_conn = connect_queue(queue_file_path)
+    db_conn.execute("BEGIN IMMEDIATE")
+    before = db_conn.execute("SELECT COUNT(*) FROM " + QUEUE_TABLE_NAME).fetchone()[0]
+    db_conn.executemany("INSERT OR IGNORE INTO " + QUEUE_TABLE_NAME + " (dataset, bucket, satellite, root, depth) VALUES (?, ?, ?, ?, ?)",
+                        [(shard['dataset'], shard['bucket'], shard['satellite'], shard['root'], shard['depth']) for shard in shards])
+    added = db_conn.execute("SELECT COUNT(*) FROM " + QUEUE_TABLE_NAME).fetchone()[0] - before
+    db_conn.execute("COMMIT")
+    db_conn.close()
+    return added
+
+def lease_work(db_conn, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+
+    """Function hands the next free queue item to a worker: a pending one, or one whose lease has expired because
+    its worker crashed or hung. The claim is a single UPDATE, so two workers can never lease the same item.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        connection opened with connect_queue
+    worker_id : str
+        name of the worker, e.g. host:pid
+    lease_seconds : int
+        seconds the lease is valid for unless renewed
+    -----
+    Returns:
+    A dict with the item's id, dataset, bucket, satellite, root and depth, or None if nothing is free right now
+    """
+
+    now = time.time()
+    db_conn.execute("UPDATE " + QUEUE_TABLE_NAME + " SET status = 'failed', lease_owner = NULL"
+                    " WHERE status IN ('pending', 'leased') AND attempts >= ? AND (status = 'pending' OR lease_expires < ?)", (MAX_ATTEMPTS, now))
+    row = db_conn.execute("UPDATE " + QUEUE_TABLE_NAME + " SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1"
+                          " WHERE id = (SELECT id FROM " + QUEUE_TABLE_NAME + " WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)"
+                          " ORDER BY id LIMIT 1)"
+                          " RETURNING id, dataset, bucket, satellite, root, depth", (worker_id, now + lease_seconds, now)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(['id', 'dataset', 'bucket', 'satellite', 'root', 'depth'], row))
+
+def renew_lease(db_conn, item_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+
+    """Function extends a worker's lease on an item.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        connection opened with connect_queue
+    item_id : int
+        id of the leased item
+    worker_id : str
+        name of the worker holding the lease
+    lease_seconds : int
+        seconds the lease is valid for from now
+    -----
+    Returns:
+    True if the worker still held the lease, False if it expired and was handed to someone else
+    """
+
+    cursor = db_conn.execute("UPDATE " + QUEUE_TABLE_NAME + " SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                             (time.time() + lease_seconds, item_id, worker_id))
+    return cursor.rowcount == 1
+
+def complete_work(db_conn, item_id, worker_id, rows):
+
+    """Function stores the rows listed for an item and marks it done, in one transaction. Rows of an earlier attempt
+    are replaced. If the worker lost its lease in the meantime nothing is written, since the item belongs to the
+    worker that took it over.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        connection opened with connect_queue
+    item_id : int
+        id of the leased item
+    worker_id : str
+        name of the worker holding the lease
+    rows : list
+        row tuples of (bucket, satellite, folder names...)
+    -----
+    Returns:
+    True if the rows were stored, False if the lease had been lost
+    """
+
+    db_conn.execute("BEGIN IMMEDIATE")
+    owner = db_conn.execute("SELECT lease_owner FROM " + QUEUE_TABLE_NAME + " WHERE id = ? AND status = 'leased'", (item_id,)).fetchone()
+    if owner is None or owner[0] != worker_id:
+        db_conn.execute("ROLLBACK")
+        return False
+    db_conn.execute("DELETE FROM " + RESULTS_TABLE_NAME + " WHERE item_id = ?", (item_id,))
+    db_conn.executemany("INSERT INTO " + RESULTS_TABLE_NAME + " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        ((item_id, seq) + tuple(row) for seq, row in enumerate(rows)))
+    db_conn.execute("UPDATE " + QUEUE_TABLE_NAME + " SET status = 'done', lease_owner = NULL, lease_expires = NULL WHERE id = ?", (item_id,))
+    db_conn.execute("COMMIT")
+    return True
+
+def release_work(db_conn, item_id, worker_id, error):
+
+    """Function gives an item back to the queue after its listing failed, so another worker can retry it.
+    -----
+    Input parameters:
+    db_conn : sqlite3.Connection
+        connection opened with connect_queue
+    item_id : int
+        id of the leased item
+    worker_id : str
+        name of the worker holding the lease
+    error : Exception
+        error the listing failed with, recorded on the item
+    -----
+    Returns:
+    Nothing
+    """
+
+    db_conn.execute("UPDATE " + QUEUE_TABLE_NAME + " SET status = 'pending', lease_owner = NULL, lease_expires = NULL, last_error = ?"
+                    " WHERE id = ? AND lease_owner = ?", (repr(error), item_id, worker_id))
+
+def list_work_item(item, max_workers=DEFAULT_MAX_WORKERS, s3client=None):
+
+    """Function lists every leaf folder of a queue item.
+    -----
+    Input parameters:
+    item : dict
+        item as returned by lease_work
+    max_workers : int
+        maximum number of concurrent list requests
+    s3client : boto3 S3 client
+        client used to call the S3 list API, a new one is created if not given
+    -----
+    Returns:
+    A list of (bucket, satellite, folder names...) tuples
+    """
+
+    s3client = s3client or s3_client(max_workers)
+    leaf_prefixes = iter_prefix_tree(s3client, item['bucket'], [item['root']], item['depth'], max_workers)
+    return [(item['bucket'], item['satellite']) + tuple(leaf_prefix.split('/')[:4]) for leaf_prefix in leaf_prefixes]
+
+def run_queue_worker(queue_file_path, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS, poll_seconds=DEFAULT_POLL_SECONDS,
+                     max_workers=DEFAULT_MAX_WORKERS, s3client=None):
+
+    """Function runs one queue worker: it keeps leasing items, listing them and storing their rows until no item is
+    pending and no other lease is still running. While an item is being listed a background thread renews the lease,
+    so only a worker that crashed or hung loses it. Any number of workers can run at once, on any host that sees the
+    queue database.
+    -----
+    Input parameters:
+    queue_file_path : str
+        path of the SQLite queue database
+    worker_id : str
+        name of the worker, defaults to host:pid
+    lease_seconds : int
+        seconds a lease is valid for unless renewed
+    poll_seconds : int
+        seconds to wait before asking again when every remaining item is leased by another worker
+    max_workers : int
+        maximum number of concurrent list requests made by this worker
+    s3client : boto3 S3 client
+        client used to call the S3 list API, a new one is created if not given
+    -----
+    Returns:
+    A dict with the number of items completed, failed and lost (taken over by another worker)
+    """
+
+    worker_id = worker_id or socket.gethostname() + ':' + str(os.getpid())
+    s3client = s3client or s3_client(max_workers)
+    db_conn = connect_queue(queue_file_path)
+    summary = {'completed': 0, 'failed': 0, 'lost': 0}
+    while True:
+        item = lease_work(db_conn, worker_id, lease_seconds)
+        if item is None:
+            running = db_conn.execute("SELECT COUNT(*) FROM " + QUEUE_TABLE_NAME + " WHERE status = 'leased'").fetchone()[0]
+            if running == 0:    #nothing pending and nothing that could still expire, the crawl is finished
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        listing_done = threading.Event()
+        def keep_lease():   #renews the lease on its own connection while the listing runs
+            renew_conn = connect_queue(queue_file_path)
+            while not listing_done.wait(lease_seconds / 3):
+                if not renew_lease(renew_conn, item['id'], worker_id, lease_seconds):
+                    break
+            renew_conn.close()
+        renewer = threading.Thread(target=keep_lease, daemon=True)
+        renewer.start()
+        try:
+            rows = list_work_item(item, max_workers, s3client)
+        except Exception as error:
+            release_work(db_conn, item['id'], worker_id, error)
+            summary['failed'] += 1
+            continue
+        finally:
+            listing_done.set()
+            renewer.join()
+        if complete_work(db_conn, item['id'], worker_id, rows):
+            summary['completed'] += 1
+        else:
+            summary['lost'] += 1
+    db_conn.close()
+    return summary
+
+def queue_progress(queue_file_path):
+
+    """Function counts the queue items per status.
+    -----
+    Input parameters:
+    queue_file_path : str
+        path of the SQLite queue database
+    -----
+    Returns:
+    A dict mapping each status (pending, leased, done, failed) to its number of items
+    """
+
+    db_conn = connect_queue(queue_file_path)
+    progress = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+    progress.update(dict(db_conn.execute("SELECT status, COUNT(*) FROM " + QUEUE_TABLE_NAME + " GROUP BY status").fetchall()))
+    db_conn.close()
+    return progress
+
+def failed_work(queue_file_path):
+
+    """Function lists the queue items that were given up on after MAX_ATTEMPTS leases.
+    -----
+    Input parameters:
+    queue_file_path : str
+        path of the SQLite queue database
+    -----
+    Returns:
+    A list of (bucket, root, last error) tuples in queue order
+    """
+
+    db_conn = connect_queue(queue_file_path)
+    failed = db_conn.execute("SELECT bucket, root, last_error FROM " + QUEUE_TABLE_NAME + " WHERE status = 'failed' ORDER BY id").fetchall()
+    db_conn.close()
+    return failed
+
+def merge_work_results(queue_file_path, database_file_path, goes_table_name, nexrad_table_name, allow_failed=False):
+
+    """Function merges the rows of all finished queue items into the GOES and NEXRAD metadata tables, replacing
+    them through the shadow views of their DDL scripts. Rows are ordered by queue item and listing order, so the same
+    queue always gives the same ids. The tables are replaced, so the folders of failed items would be dropped from
+    them; the merge is refused while any item has failed unless allow_failed is set.
+    -----
+    Input parameters:
+    queue_file_path : str
+        path of the SQLite queue database
+    database_file_path : str
+        path of the metadata database
+    goes_table_name : str
+        table the GOES items are merged into
+    nexrad_table_name : str
+        table the NEXRAD items are merged into
+    allow_failed : bool
+        merge the finished items even though some items have failed
+    -----
+    Returns:
+    A dict with the number of rows merged per table
+    """
+
+    failed = failed_work(queue_file_path)
+    if failed and not allow_failed:
+        raise ValueError("Work queue has " + str(len(failed)) + " failed items, merging would drop their folders from the tables: " +
+                         ", ".join(bucket + "/" + root for bucket, root, _ in failed) + " (pass --allow-failed to merge without them)")
+    db_conn = connect_database(database_file_path, 'write')
+    db_conn.execute("ATTACH DATABASE ? AS queue_db", (queue_file_path,))
+    summary = {}
+    for dataset, table_name, columns in (('GOES', goes_table_name, GOES_ARCHIVE_COLUMNS), ('NEXRAD', nexrad_table_name, NEXRAD_ARCHIVE_COLUMNS)):
+        if not db_conn.execute("SELECT 1 FROM queue_db." + QUEUE_TABLE_NAME + " WHERE dataset = ? AND status = 'done' LIMIT 1", (dataset,)).fetchone():
+            continue
+        table_statements, index_statements = split_ddl(read_ddl_script(METADATA_DDL_FILES[table_name]))
+        shadow_name = prepare_shadow_table(db_conn, table_statements, table_name)
+        table_columns = {column[0] for column in declared_columns(db_conn, shadow_name)}
+        #the results hold the bucket, the satellite and the folder levels in the order of the archive columns
+        result_columns = [(column, result_column) for column, result_column in zip(columns, ['bucket', 'satellite', 'level1', 'level2', 'level3', 'level4'])
+                          if column in table_columns]
+        db_conn.execute("INSERT INTO " + shadow_name + " (id, " + ", ".join(column for column, _ in result_columns) + ")"
+                        " SELECT ROW_NUMBER() OVER (ORDER BY results.item_id, results.seq), " + ", ".join("results." + result_column for _, result_column in result_columns) +
+                        " FROM queue_db." + RESULTS_TABLE_NAME + " AS results JOIN queue_db." + QUEUE_TABLE_NAME + " AS queue ON queue.id = results.item_id"
+                        " WHERE queue.dataset = ? AND queue.status = 'done' ORDER BY results.item_id, results.seq", (dataset,))
+        summary[table_name] = db_conn.execute("SELECT COUNT(*) FROM " + shadow_name).fetchone()[0]
+        swap_in_shadow(db_conn, table_name, table_statements, index_statements)     #readers keep the old table until every result is in
+    db_conn.execute("DETACH DATABASE queue_db")
+    db_conn.close()
+    return summary
@@ -0,0 +1,231 @@
+import os
+import sqlite3
+import boto3
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from botocore.config import Config
+from s3_concurrency import governed, NO_RETRIES_CONFIG
+from s3_crawler import iter_prefix_tree, crawl_prefix_tree, DEFAULT_MAX_WORKERS
+from metadata_schema import connect_database, prepare_shadow_table, swap_in_shadow, split_ddl, read_ddl_script, declared_columns, METADATA_DDL_FILES
+
+GOES_ARCHIVE_BUCKETS = {    #GOES buckets on the open data registry and the satellite their data comes from
+    'noaa-goes16': 'GOES-16',
+    'noaa-goes17': 'GOES-17',
+    'noaa-goes18': 'GOES-18'
+}
+GOES_PRODUCT_PREFIX = 'ABI-'    #only Advanced Baseline Imager products are scraped from the GOES buckets
+NEXRAD_ARCHIVE_BUCKET = 'noaa-nexrad-level2'
+NEXRAD_FIRST_YEAR = 1991    #first year of NEXRAD Level 2 data in the bucket
+DEFAULT_PROCESSES = 4   #number of shards crawled at the same time
+PARTITION_BATCH_SIZE = 5000     #rows written per transaction into a shard partition
+
+#columns of the archive partitions, every row is tagged with the bucket and satellite it was scraped from; GOES keeps
+#both in its product dimension, NEXRAD has a single bucket so its tables leave them out
+GOES_ARCHIVE_COLUMNS = ['bucket', 'satellite', 'product', 'year', 'day', 'hour']
+NEXRAD_ARCHIVE_COLUMNS = ['bucket', 'satellite', 'year', 'month', 'day', 'ground_station']
+
+def s3_client(max_workers=DEFAULT_MAX_WORKERS):
+
+    """Function creates an S3 client with your user credentials that are stored in your .env config file.
+    -----
+    Input parameters:
+    max_workers : int
+        number of pooled connections, one per concurrent list request
+    -----
+    Returns:
+    A boto3 S3 client whose listing and copy calls go through the process's concurrency governor
+    """
+
+    return governed(boto3.client('s3',
+                        region_name='us-east-1',
+                        aws_access_key_id = os.environ.get('AWS_ACCESS_KEY'),
+                        aws_secret_access_key = os.environ.get('AWS_SECRET_KEY'),
+                        config = Config(max_pool_connections=max_workers).merge(NO_RETRIES_CONFIG)
+                        ))
+
+def plan_archive_shards(s3client, goes_buckets=GOES_ARCHIVE_BUCKETS, nexrad_bucket=NEXRAD_ARCHIVE_BUCKET,
+                        product_prefix=GOES_PRODUCT_PREFIX, first_year=NEXRAD_FIRST_YEAR, last_year=None):
+
+    """Function splits a full-archive crawl into independent shards, one per GOES bucket, product and year and one
+    per NEXRAD year. Only the top two levels of the GOES buckets and the top level of the NEXRAD bucket are listed here.
+    -----
+    Input parameters:
+    s3client : boto3 S3 client
+        client used to call the S3 list API
+    goes_buckets : dict
+        GOES bucket names mapped to the satellite name rows are tagged with
+    nexrad_bucket : str
+        name of the NEXRAD Level 2 bucket, None to leave NEXRAD out
+    product_prefix : str
+        only GOES products starting with this are planned
+    first_year : int
+        first NEXRAD year to plan
+    last_year : int
+        last NEXRAD year to plan, defaults to the current year
+    -----
+    Returns:
+    A list of shard dicts with the dataset, bucket, satellite, root prefix and depth to crawl, in a fixed order
+    """
+
+    shards = []
+    for bucket_name in sorted(goes_buckets):
+        product_prefixes, _ = crawl_prefix_tree(s3client, bucket_name, [''], 1)
+        product_prefixes = [product for product in product_prefixes if product.startswith(product_prefix)]
+        year_prefixes, _ = crawl_prefix_tree(s3client, bucket_name, product_prefixes, 1)
+        for year_prefix in year_prefixes:   #product/year/ shards, leaving the day and hour levels to the shard
+            shards.append({'dataset': 'GOES', 'bucket': bucket_name, 'satellite': goes_buckets[bucket_name], 'root': year_prefix, 'depth': 2})
+
+    if nexrad_bucket:
+        last_year = last_year or datetime.now(timezone.utc).year
+        wanted_years = {str(year) + '/' for year in range(first_year, last_year + 1)}
+        year_prefixes, _ = crawl_prefix_tree(s3client, nexrad_bucket, [''], 1)
+        for year_prefix in year_prefixes:   #year/ shards, leaving the month, day and station levels to the shard
+            if year_prefix in wanted_years:
+                shards.append({'dataset': 'NEXRAD', 'bucket': nexrad_bucket, 'satellite': 'NEXRAD', 'root': year_prefix, 'depth': 3})
+    return shards
+
+def partition_file_name(shard):
+
+    """Function names the SQLite partition file a shard writes its rows to.
+    -----
+    Input parameters:
+    shard : dict
+        shard as planned by plan_archive_shards
+    -----
+    Returns:
+    The file name (str) of the partition
+    """
+
+    return '__'.join([shard['dataset'], shard['bucket']] + shard['root'].strip('/').split('/')) + '.db'
+
+def scrape_archive_shard(shard, partition_dir, max_workers=DEFAULT_MAX_WORKERS, resume=False):
+
+    """Function crawls one shard of the archive and writes its rows, tagged with bucket and satellite, into the
+    shard's own SQLite partition file. Runs in a worker process, so it sets up its own S3 client. The partition is
+    written under a .partial name and only renamed once the shard is complete, so a finished partition can be kept
+    when an interrupted crawl is resumed.
+    -----
+    Input parameters:
+    shard : dict
+        shard as planned by plan_archive_shards
+    partition_dir : str
+        directory the partition file is written to
+    max_workers : int
+        maximum number of concurrent list requests made by this shard
+    resume : bool
+        keep the partition of a shard finished by an earlier, interrupted crawl instead of crawling it again
+    -----
+    Returns:
+    partition_path : str
+        path of the written partition file
+    crawl_stats : dict
+        number of prefixes listed, number of leaves, elapsed seconds and throughput in prefixes per second
+    """
+
+    columns = GOES_ARCHIVE_COLUMNS if shard['dataset'] == 'GOES' else NEXRAD_ARCHIVE_COLUMNS
+    partition_path = os.path.join(partition_dir, partition_file_name(shard))
+    partial_path = partition_path + '.partial'
+    if resume and Path(partition_path).is_file():   #shard finished before the crawl was interrupted
+        return partition_path, {'prefixes_listed': 0, 'leaf_prefixes': 0, 'elapsed_seconds': 0.0, 'prefixes_per_second': 0.0}
+    for stale_path in (partition_path, partial_path):   #anything else left over from an earlier run is rebuilt from scratch
+        if Path(stale_path).is_file():
+            os.remove(stale_path)
+
+    crawl_stats = {}
+    leaf_prefixes = iter_prefix_tree(s3_client(max_workers), shard['bucket'], [shard['root']], shard['depth'], max_workers, crawl_stats)
+    rows = ((shard['bucket'], shard['satellite']) + tuple(leaf_prefix.split('/')[:4]) for leaf_prefix in leaf_prefixes)
+
+    db_conn = sqlite3.connect(partial_path)
+    db_conn.execute("CREATE TABLE ARCHIVE_METADATA (" + ", ".join(column + " TEXT" for column in columns) + ")")
+    insert = "INSERT INTO ARCHIVE_METADATA VALUES (" + ", ".join("?" * len(columns)) + ")"
+    while True:
+        batch = list(islice(rows, PARTITION_BATCH_SIZE))
+        if not batch:
+            break
+        db_conn.executemany(insert, batch)
+        db_conn.commit()
+    db_conn.close()
+    os.replace(partial_path, partition_path)
+    return partition_path, crawl_stats
+
+def merge_archive_partitions(partition_paths, database_file_path, table_name, columns):
+
+    """Function merges shard partitions into a single metadata table, replacing it. The table keeps the schema of its
+    DDL script: partitions are inserted, in the given order, into the shadow view of the table, with ids assigned
+    sequentially so the same shard plan always gives the same ids, and the shadow is swapped in once every partition
+    is in. Partition columns the table does not declare are left out.
+    -----
+    Input parameters:
+    partition_paths : list
+        partition files written by scrape_archive_shard, in shard order
+    database_file_path : str
+        path of the metadata database
+    table_name : str
+        name of the table to replace, GOES_METADATA or NEXRAD_METADATA
+    columns : list
+        columns of the partitions, without the id
+    -----
+    Returns:
+    The number of rows merged
+    """
+
+    db_conn = connect_database(database_file_path, 'write')
+    table_statements, index_statements = split_ddl(read_ddl_script(METADATA_DDL_FILES[table_name]))
+    shadow_name = prepare_shadow_table(db_conn, table_statements, table_name)
+    table_columns = {column[0] for column in declared_columns(db_conn, shadow_name)}
+    loaded_columns = ", ".join(column for column in columns if column in table_columns)
+    rows_merged = 0
+    for partition_path in partition_paths:
+        db_conn.execute("ATTACH DATABASE ? AS partition_db", (partition_path,))
+        db_conn.execute("INSERT INTO " + shadow_name + " (id, " + loaded_columns + ") SELECT rowid + ?, " + loaded_columns +
+                        " FROM partition_db.ARCHIVE_METADATA ORDER BY rowid", (rows_merged,))
+        rows_merged += db_conn.execute("SELECT COUNT(*) FROM partition_db.ARCHIVE_METADATA").fetchone()[0]
+        db_conn.commit()
+        db_conn.execute("DETACH DATABASE partition_db")
+    swap_in_shadow(db_conn, table_name, table_statements, index_statements)
+    db_conn.close()
+    return rows_merged
+
+def scrape_full_archive(database_file_path, goes_table_name, nexrad_table_name, shards, partition_dir,
+                        processes=DEFAULT_PROCESSES, max_workers=DEFAULT_MAX_WORKERS, resume=False):
+
+    """Function crawls every planned shard on a process pool, each shard writing to its own partition file, then
+    merges the partitions into the GOES and NEXRAD metadata tables and removes them.
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    goes_table_name : str
+        table the GOES shards are merged into
+    nexrad_table_name : str
+        table the NEXRAD shards are merged into
+    shards : list
+        shards as planned by plan_archive_shards
+    partition_dir : str
+        directory holding the partition files while the crawl runs
+    processes : int
+        number of shards crawled at the same time
+    max_workers : int
+        maximum number of concurrent list requests made by each shard
+    resume : bool
+        reuse the partitions of shards finished by an earlier, interrupted crawl
+    -----
+    Returns:
+    A dict with the number of rows merged per table and the number of prefixes listed
+    """
+
+    os.makedirs(partition_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        #map keeps the partitions in shard order, which fixes the row order and ids after the merge
+        results = list(executor.map(scrape_archive_shard, shards, [partition_dir] * len(shards), [max_workers] * len(shards), [resume] * len(shards)))
+
+    summary = {'prefixes_listed': sum(crawl_stats['prefixes_listed'] for _, crawl_stats in results)}
+    for dataset, table_name, columns in (('GOES', goes_table_name, GOES_ARCHIVE_COLUMNS), ('NEXRAD', nexrad_table_name, NEXRAD_ARCHIVE_COLUMNS)):
+        partition_paths = [partition_path for shard, (partition_path, _) in zip(shards, results) if shard['dataset'] == dataset]
+        if partition_paths:
+            summary[table_name] = merge_archive_partitions(partition_paths, database_file_path, table_name, columns)
+        for partition_path in partition_paths:
+            os.remove(partition_path)
+    return summary
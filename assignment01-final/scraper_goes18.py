@@ -2,25 +2,43 @@ import os
 import boto3
 import time
 import pandas as pd
+from botocore.config import Config
+from s3_concurrency import governed, NO_RETRIES_CONFIG
+from s3_crawler import iter_prefix_tree, prefixes_from, DEFAULT_MAX_WORKERS
+from prefix_calendar import goes_hour_prefixes, probe_prefixes
 
-def scrape_goes18_data():
+GOES18_COLUMNS = ['id', 'product', 'year', 'day', 'hour']    #columns of the GOES_METADATA table
 
-    """Function scrapes the publically available amazon s3 bucket for GOES-18 satellite radar data,
-    all sub folders for the pre-defined product are selected and appended into a dictionary, the final return 
-    value is a dataframe. Initially, the function sets up 2 boto3 clients (to connect to AWS): 1 for accessing s3 buckets
-    and the other for accessing AWS CloudWatch to perform logging to a log group and log stream. Both these clients have their
-    own AWS access & secret key generated from AWS with necessary permissions that should be stored in your .env file.
+def scrape_goes18_rows(max_workers=DEFAULT_MAX_WORKERS, start_from=None, date_range=None):
+
+    """Function scrapes the publically available amazon s3 bucket for GOES-18 satellite radar data and yields one
+    row per hour folder of the pre-defined product as soon as its day folder has been listed, so the caller can write
+    rows out in batches without holding the whole scrape in memory. Initially, the function sets up 2 boto3 clients 
+    (to connect to AWS): 1 for accessing s3 buckets and the other for accessing AWS CloudWatch to perform logging to a 
+    log group and log stream. Both these clients have their own AWS access & secret key generated from AWS with necessary 
+    permissions that should be stored in your .env file. The folder levels are listed concurrently and page by page 
+    through the shared prefix crawler.
+    -----
+    Input parameters:
+    max_workers : int
+        maximum number of concurrent list requests made to the bucket
+    start_from : tuple
+        optional (product, year, day, hour) folder names; when given, only folders at or after this position are listed
+    date_range : tuple
+        optional (start_date, end_date) of datetime.date values; when given, the hour folders of that range are
+        generated from the calendar and probed directly instead of being discovered level by level
     -----
     Returns:
-    A dataframe containing path for all subfolders 
+    A generator of dicts, each holding the id, product, year, day and hour of one scraped folder
     """
 
     #authenticate S3 client with your user credentials that are stored in your .env config file
-    s3client = boto3.client('s3',
+    s3client = governed(boto3.client('s3',
                             region_name='us-east-1',
                             aws_access_key_id = os.environ.get('AWS_ACCESS_KEY'),
-                            aws_secret_access_key = os.environ.get('AWS_SECRET_KEY')
-                            )
+                            aws_secret_access_key = os.environ.get('AWS_SECRET_KEY'),
+                            config = Config(max_pool_connections=max_workers).merge(NO_RETRIES_CONFIG)    #one pooled connection per crawler worker
+                            ))  #requests in flight are adapted to throttling by the shared governor
 
     #authenticate S3 client for logging with your user credentials that are stored in your .env config file
     clientLogs = boto3.client('logs',
@@ -29,15 +47,6 @@ def scrape_goes18_data():
                             aws_secret_access_key = os.environ.get('AWS_LOG_SECRET_KEY')
                             )
 
-    #intialise dictionary to store scraped data before moving it to a sqllite table
-    scraped_goes18_dict = {
-        'id': [],
-        'product': [],
-        'year': [],
-        'day': [],
-        'hour': []
-    }
-
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "db-logs",
@@ -51,26 +60,38 @@ def scrape_goes18_data():
 
     id=1    #for storing as primary key in db
     prefix = "ABI-L1b-RadC/"    #just one product to consider as per scope of assignment
-    result = s3client.list_objects(Bucket=os.environ.get('GOES18_BUCKET_NAME'), Prefix=prefix, Delimiter='/')
 
-    #traversing into each subfolder and store the folder names within each
-    for o in result.get('CommonPrefixes'):
-        path = o.get('Prefix').split('/')
-        prefix_2 = prefix + path[-2] + "/"      #new prefix with added subdirectory path
-        sub_folder = s3client.list_objects(Bucket=os.environ.get('GOES18_BUCKET_NAME'), Prefix=prefix_2, Delimiter='/')
-        for p in sub_folder.get('CommonPrefixes'):
-            sub_path = p.get('Prefix').split('/')
-            prefix_3 = prefix_2 + sub_path[-2] + "/"    #new prefix with added subdirectory path
-            sub_sub_folder = s3client.list_objects(Bucket=os.environ.get('GOES18_BUCKET_NAME'), Prefix=prefix_3, Delimiter='/')
-            for q in sub_sub_folder.get('CommonPrefixes'):
-                sub_sub_path = q.get('Prefix').split('/')
-                sub_sub_path = sub_sub_path[:-1]    #remove the filename from the path
-                scraped_goes18_dict['id'].append(id)   #map all scraped data into the dict
-                scraped_goes18_dict['product'].append(sub_sub_path[0])
-                scraped_goes18_dict['year'].append(sub_sub_path[1])
-                scraped_goes18_dict['day'].append(sub_sub_path[2])
-                scraped_goes18_dict['hour'].append(sub_sub_path[3])
-                id+=1
+    crawl_stats = {}
+    crawl_filter = prefixes_from(start_from) if start_from else None   #incremental and resumed scrapes skip everything before start_from
+    if date_range is not None:
+        #generate the hour folders of the date range and probe them concurrently, skipping the upper listing levels
+        candidate_prefixes = [hour_prefix for hour_prefix in goes_hour_prefixes(prefix, *date_range) if crawl_filter is None or crawl_filter(hour_prefix)]
+        hour_prefixes = probe_prefixes(s3client, os.environ.get('GOES18_BUCKET_NAME'), candidate_prefixes, max_workers, crawl_stats)
+    else:
+        #crawl the year, day and hour levels below the product folder concurrently; leaves come back in sorted order
+        hour_prefixes = iter_prefix_tree(s3client, os.environ.get('GOES18_BUCKET_NAME'), [prefix], 3, max_workers, crawl_stats, crawl_filter)
+    for hour_prefix in hour_prefixes:
+        sub_sub_path = hour_prefix.split('/')
+        sub_sub_path = sub_sub_path[:-1]    #remove the filename from the path
+        yield {
+            'id': id,
+            'product': sub_sub_path[0],
+            'year': sub_sub_path[1],
+            'day': sub_sub_path[2],
+            'hour': sub_sub_path[3]
+        }
+        id+=1
+
+    clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+        logGroupName = "assignment01-logs",
+        logStreamName = "db-logs",
+        logEvents = [
+            {
+            'timestamp' : int(time.time() * 1e3),
+            'message' : "Crawled " + str(crawl_stats['prefixes_listed']) + " GOES18 prefixes at " + str(round(crawl_stats['prefixes_per_second'], 2)) + " prefixes/second"
+            }
+        ]
+    )
 
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
@@ -82,6 +103,25 @@ def scrape_goes18_data():
             }
         ]
     )
-      
-    scraped_goes18_df = pd.DataFrame(scraped_goes18_dict)     #final scraped metadata stored in dataframe
-    return scraped_goes18_df    #the dataframe containing all scraped data
\ No newline at end of file
+
+def scrape_goes18_data(max_workers=DEFAULT_MAX_WORKERS, start_from=None, date_range=None):
+
+    """Function scrapes the publically available amazon s3 bucket for GOES-18 satellite radar data,
+    all sub folders for the pre-defined product are selected and collected into a dataframe. The rows are produced
+    by scrape_goes18_rows; use that generator directly to stream a large scrape into the database.
+    -----
+    Input parameters:
+    max_workers : int
+        maximum number of concurrent list requests made to the bucket
+    start_from : tuple
+        optional (product, year, day, hour) folder names; when given, only folders at or after this position are listed
+    date_range : tuple
+        optional (start_date, end_date) of datetime.date values; when given, the hour folders of that range are
+        generated from the calendar and probed directly instead of being discovered level by level
+    -----
+    Returns:
+    A dataframe containing path for all subfolders 
+    """
+
+    scraped_goes18_df = pd.DataFrame(list(scrape_goes18_rows(max_workers, start_from, date_range)), columns=GOES18_COLUMNS)     #final scraped metadata stored in dataframe
+    return scraped_goes18_df    #the dataframe containing all scraped data
@@ -2,11 +2,25 @@ import os
 import sqlite3
 import boto3
 import time
+import argparse
 import pandas as pd
+from datetime import date, datetime, timezone
+from functools import partial
+from itertools import chain, islice
 from pathlib import Path
-from scraper_goes18 import scrape_goes18_data
-from scraper_nexrad import scrape_nexrad_data
+from scraper_goes18 import scrape_goes18_rows
+from scraper_nexrad import scrape_nexrad_rows
 from scraper_mapdata import scrape_nexrad_locations
+from prefix_calendar import last_days
+from file_manifest import scrape_file_manifest
+from inventory_ingest import ingest_inventory
+from scrape_work_queue import seed_work_queue, run_queue_worker, merge_work_results, queue_progress
+from scraper_archive import plan_archive_shards, scrape_full_archive, s3_client, GOES_ARCHIVE_BUCKETS, NEXRAD_FIRST_YEAR, DEFAULT_PROCESSES
+from metadata_schema import connect_database, prepare_table, split_ddl, prepare_shadow_table, swap_in_shadow, shadow_table_name, table_exists, read_ddl_script, folder_columns_sql, scope_filter, insert_rows, bump_generation
+from crawl_checkpoint import write_checkpoint, read_checkpoint, clear_checkpoint
+from metadata_parquet import refresh_parquet_snapshot, PARQUET_DIRECTORY
+from hierarchy_index import refresh_hierarchy_index
+from incremental_scrape import read_high_water_mark, write_high_water_mark, newest_key_in_table, append_new_rows, goes_scrape_start, nexrad_scrape_start, DEFAULT_OVERLAP_HOURS, DEFAULT_OVERLAP_DAYS
 from dotenv import load_dotenv
 
 #load env variables
@@ -19,24 +33,222 @@ clientLogs = boto3.client('logs',
                         aws_secret_access_key = os.environ.get('AWS_LOG_SECRET_KEY')
                         )
 
-def store_scraped_data_to_db(scraped_data, database_file_name, ddl_file_name, table_name):
+DEFAULT_BATCH_SIZE = 5000   #number of rows written and committed at a time when storing a stream of scraped rows
+
+def refresh_dropdown_index(database_file_path):
+
+    """Used to rebuild the hierarchy index of the app's dropdowns right after a load changed the generation of a
+    metadata table, so the app is only briefly without an index of the current generation (it queries the database
+    meanwhile).
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    -----
+    Returns:
+    Nothing
+    """
+
+    if refresh_hierarchy_index(database_file_path):     #only rebuilt when a table's generation changed
+        clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+            logGroupName = "assignment01-logs",
+            logStreamName = "db-logs",
+            logEvents = [
+                {
+                'timestamp' : int(time.time() * 1e3),
+                'message' : "Rebuilt the hierarchy index of the metadata tables"
+                }
+            ]
+        )
+
+def write_rows_in_batches(scraped_rows, db_conn, table_name, batch_size=DEFAULT_BATCH_SIZE, checkpoint_columns=None):
+
+    """Used to write an iterator of scraped rows into a SQLite table, appending them to the table (created by the
+    caller from its DDL script) batch by batch. Every batch is committed on its own, so only batch_size rows are ever
+    held in memory.
+    -----
+    Input parameters:
+    scraped_rows : iterable
+        iterable of dicts (one per row, keyed by column name) you wish to populate into SQLite table
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the table you wish to enter records into
+    batch_size : int
+        number of rows written per transaction
+    checkpoint_columns : list
+        key columns of the rows; when given, a checkpoint of the last key written is committed with every batch so an
+        interrupted scrape can be resumed
+    -----
+    Returns:
+    The number of rows written
+    """
+
+    rows_written = 0
+    started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    scraped_rows = iter(scraped_rows)
+    while True:
+        batch = list(islice(scraped_rows, batch_size))
+        if not batch:
+            break
+        rows_written += insert_rows(db_conn, table_name, batch)
+        if checkpoint_columns:
+            write_checkpoint(db_conn, table_name, tuple(batch[-1][column] for column in checkpoint_columns), rows_written, started_at)
+        db_conn.commit()    #commit every batch so a long scrape is flushed to disk as it goes
+    return rows_written
+
+def merge_rows_into_table(scraped_rows, db_conn, table_name, key_columns, delete_missing=False, key_prefix=()):
+
+    """Used to merge scraped rows into a table on their natural key instead of replacing the table, so the table (and
+    the schema it was created with) is kept. The keys already stored are read once; the scraped rows are streamed
+    through that set and only rows with a new key are inserted, with executemany, getting ids after the current
+    largest id, so the scrape is never held in memory. With delete_missing, stored rows whose key was not scraped
+    again are deleted. All changes, and the generation bump when the table changed, are made in a single transaction.
+    -----
+    Input parameters:
+    scraped_rows : iterable
+        iterable of dicts (one per row, keyed by column name) you wish to merge into SQLite table
+    db_conn : sqlite3.Connection
+        open connection to the database
+    table_name : str
+        name of the table to merge into, created from the first row's columns if it does not exist
+    key_columns : list
+        columns that identify a row, e.g. ['product', 'year', 'day', 'hour']
+    delete_missing : bool
+        delete stored rows that are not in scraped_rows; only use it when scraped_rows is a complete scrape
+    key_prefix : tuple
+        optional values of the first key columns, e.g. ('2023',); only stored rows under this prefix are read and
+        (with delete_missing) deleted, so a single year can be rebuilt without touching the others; every scraped row
+        must be under the prefix
+    -----
+    Returns:
+    A dict with the number of rows inserted, unchanged and deleted
+    """
+
+    table_columns = [column[1] for column in db_conn.execute("PRAGMA table_info(" + table_name + ")")]
+    scope_conditions, scope_parameters = scope_filter(db_conn, table_name, key_columns)     #e.g. the assignment's GOES bucket
+    conditions = (["(" + ", ".join(key_columns[:len(key_prefix)]) + ") = (" + ", ".join("?" * len(key_prefix)) + ")"] if key_prefix else []) + scope_conditions
+    existing_keys = set(db_conn.execute("SELECT " + folder_columns_sql(table_name, key_columns) + " FROM " + table_name +
+                                        (" WHERE " + " AND ".join(conditions) if conditions else ""),
+                                        tuple(key_prefix) + tuple(scope_parameters)).fetchall()) if table_columns else set()
+
+    scraped_keys = set()
+    merge_counts = {'inserted': 0, 'unchanged': 0, 'deleted': 0}
+    def new_rows():     #the scraped rows whose key is not stored yet, counted as they are inserted
+        for row in scraped_rows:
+            key = tuple(row[column] for column in key_columns)
+            if key in scraped_keys:     #the same folder scraped twice
+                continue
+            scraped_keys.add(key)
+            if key not in existing_keys:
+                merge_counts['inserted'] += 1
+                yield row
+
+    rows = new_rows()
+    first_row = next(rows, None)    #its columns give the INSERT statement
+    with db_conn:   #one transaction, committed at the end or rolled back on error
+        if first_row is not None:
+            columns = [column for column in first_row if column != 'id']
+            if not table_columns:   #no table yet, create one from the scraped columns
+                column_types = {int: "INTEGER", float: "REAL"}
+                db_conn.execute("CREATE TABLE " + table_name + " (id INTEGER, " + ", ".join(
+                    column + " " + column_types.get(type(first_row[column]), "TEXT") for column in columns) + ")")
+            next_id = (db_conn.execute("SELECT MAX(id) FROM " + table_name).fetchone()[0] or 0) + 1
+            db_conn.executemany("INSERT INTO " + table_name + " (id, " + ", ".join(columns) + ") VALUES (" + ", ".join("?" * (len(columns) + 1)) + ")",
+                                ((next_id + number,) + tuple(row[column] for column in columns) for number, row in enumerate(chain([first_row], rows))))
+        if delete_missing:
+            missing_keys = [key for key in existing_keys if key not in scraped_keys]
+            db_conn.executemany("DELETE FROM " + table_name + " WHERE (" + ", ".join(key_columns) + ") = (" + ", ".join("?" * len(key_columns)) + ")" +
+                                "".join(" AND " + condition for condition in scope_conditions),
+                                [key + tuple(scope_parameters) for key in missing_keys])     #by key, the primary key of the folder tables
+            merge_counts['deleted'] = len(missing_keys)
+        merge_counts['unchanged'] = len(scraped_keys) - merge_counts['inserted']
+        if merge_counts['inserted'] or merge_counts['deleted']:
+            bump_generation(db_conn, table_name)    #committed with the rows, so readers never see new rows under the old generation
+    return merge_counts
+
+def load_scraped_data(scraped_data, db_conn, sql_script, table_name, batch_size, checkpoint_columns, load_mode, key_columns, delete_missing,
+                      shadow_checkpoint=None, key_prefix=()):
+
+    """Used to load scraped data into an open database with the chosen load mode. The table always keeps the schema
+    of its DDL script. In replace mode the rows go into a shadow table (checkpointed under the shadow table's name),
+    which is then swapped in for the table in one transaction, so readers never see a half-loaded table. In merge
+    mode the table is created (or brought to the declared schema) first.
+    -----
+    Input parameters:
+    scraped_data : DataFrame or iterable
+        dataframe, or iterable of row dicts, containing the data you wish to populate into SQLite table
+    db_conn : sqlite3.Connection
+        open connection to the database
+    sql_script : str
+        DDL script creating the table and its indexes
+    table_name : str
+        name of the table you wish to enter records into
+    batch_size, checkpoint_columns, load_mode, key_columns, delete_missing, shadow_checkpoint
+        as for store_scraped_data_to_db
+    key_prefix : tuple
+        in merge mode, the values of the first key columns the merge is limited to (see merge_rows_into_table)
+    -----
+    Returns:
+    The merge counts (dict) in merge mode, else a dict with the new generation of the table
+    """
+
+    if load_mode == 'merge':
+        prepare_table(db_conn, sql_script, table_name)
+        scraped_rows = scraped_data.to_dict('records') if isinstance(scraped_data, pd.DataFrame) else scraped_data
+        return merge_rows_into_table(scraped_rows, db_conn, table_name, key_columns, delete_missing, key_prefix)     #bumps the generation itself
+    table_statements, index_statements = split_ddl(sql_script)
+    shadow_name = shadow_table_name(table_name)
+    if shadow_checkpoint is not None:   #carry on filling the shadow table of an interrupted load
+        append_new_rows(scraped_data, db_conn, shadow_name, key_columns, shadow_checkpoint['last_key'], batch_size, shadow_checkpoint)
+    else:
+        prepare_shadow_table(db_conn, table_statements, table_name)    #empty table with the declared schema, indexes come with the swap
+        if isinstance(scraped_data, pd.DataFrame):
+            insert_rows(db_conn, shadow_name, scraped_data.to_dict('records'))     #store scraped data into the shadow table
+        else:
+            write_rows_in_batches(scraped_data, db_conn, shadow_name, batch_size, checkpoint_columns)     #stream rows into the shadow table batch by batch
+    generation = swap_in_shadow(db_conn, table_name, table_statements, index_statements)
+    clear_checkpoint(db_conn, shadow_name)
+    return {'generation': generation}
+
+def store_scraped_data_to_db(scraped_data, database_file_name, ddl_file_name, table_name, batch_size=DEFAULT_BATCH_SIZE, checkpoint_columns=None,
+                             load_mode='replace', key_columns=None, delete_missing=False, shadow_checkpoint=None):
 
     """Used to store/load scraped data into a SQLite table within a database. A database file is created if does not 
     exist and then the SQL script is run to create a table. Records/data from the input dataframe are then populated 
-    into the table.
+    into the table. Instead of a dataframe, a (possibly lazy) iterator of row dicts can be given, which is written and
+    committed batch_size rows at a time so a large scrape runs in constant memory. In replace load mode the rows are
+    written to a shadow table that is swapped in for the table at the end, so the app keeps reading the old rows
+    until the new ones are complete. In merge load mode the table is kept and only rows with new natural keys are
+    inserted (see merge_rows_into_table).
     -----
     Input parameters:
-    scraped_data : DataFrame
-        dataframe containing the data you wish to populate into SQLite table
+    scraped_data : DataFrame or iterable
+        dataframe, or iterable of row dicts, containing the data you wish to populate into SQLite table
     database_file_name : str
         name of database file along with .db extension for creating SQLite database
     ddl_file_name : str
         name of sql script with .sql extension that contains the create table SQL statement
     table_name : str
         name of the table you wish to enter records into within the database_file_name
+    batch_size : int
+        number of rows written per transaction when scraped_data is an iterator
+    checkpoint_columns : list
+        key columns of the rows; when given, every batch of an iterator is committed together with a checkpoint
+        (replace mode only, a merge is a single transaction)
+    load_mode : str
+        replace to rewrite the table, merge to insert only new rows into the existing table
+    key_columns : list
+        natural key columns of the rows, needed in merge mode
+    delete_missing : bool
+        in merge mode, delete stored rows that were not scraped again
+    shadow_checkpoint : dict
+        in replace mode, checkpoint of an interrupted load whose shadow table is filled further instead of being
+        started again; scraped_data then starts at the checkpoint's last key
     -----
     Returns:
-    Nothing 
+    A dict with the number of rows inserted, unchanged and deleted in merge mode, else a dict with the new generation
+    of the table
     """
 
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
@@ -50,7 +262,7 @@ def store_scraped_data_to_db(scraped_data, database_file_name, ddl_file_name, ta
         ]
     )
     database_file_path = os.path.join(os.path.dirname(__file__),database_file_name)
-    ddl_file_path = os.path.join(os.path.dirname(__file__),ddl_file_name)
+    sql_script = read_ddl_script(ddl_file_name)
     #first check if the database file exists or not
     if not Path(database_file_path).is_file():  #if .db does not exist, create one
         clientLogs.put_log_events(      #logging to AWS CloudWatch logs
@@ -63,13 +275,10 @@ def store_scraped_data_to_db(scraped_data, database_file_name, ddl_file_name, ta
                 }
             ]
         )
-        #create database
-        with open(ddl_file_path, 'r') as sql_file:
-            sql_script = sql_file.read()
-        db_conn = sqlite3.connect(database_file_path)   #connect to the database
-        cursor = db_conn.cursor()
-        cursor.executescript(sql_script)    #execute the sql script to create the table
-        scraped_data.to_sql(table_name, db_conn, if_exists='replace', index=False)     #store scraped data into table and replace table if table already exists
+        #create database, the table is created from the sql script when the data is loaded
+        db_conn = connect_database(database_file_path, 'write')   #connect to the database with the bulk write PRAGMAs
+        load_result = load_scraped_data(scraped_data, db_conn, sql_script, table_name, batch_size, checkpoint_columns, load_mode, key_columns, delete_missing,
+                                        shadow_checkpoint)
     
     else:   #if database already exists
         clientLogs.put_log_events(      #logging to AWS CloudWatch logs
@@ -82,30 +291,359 @@ def store_scraped_data_to_db(scraped_data, database_file_name, ddl_file_name, ta
                 }
             ]
         )
-        db_conn = sqlite3.connect(database_file_path)   #connect to the database
-        cursor = db_conn.cursor()
-        scraped_data.to_sql(table_name, db_conn, if_exists='replace', index=False)     #store scraped data into table and replace table if table already exists
+        db_conn = connect_database(database_file_path, 'write')   #connect to the database with the bulk write PRAGMAs
+        load_result = load_scraped_data(scraped_data, db_conn, sql_script, table_name, batch_size, checkpoint_columns, load_mode, key_columns, delete_missing,
+                                        shadow_checkpoint)
 
     db_conn.commit()
     db_conn.close()     #finally commit changes to database and close
+    refresh_dropdown_index(database_file_path)
+    if load_mode == 'replace':
+        clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+            logGroupName = "assignment01-logs",
+            logStreamName = "db-logs",
+            logEvents = [
+                {
+                'timestamp' : int(time.time() * 1e3),
+                'message' : "Swapped in new table " + table_name + ", generation " + str(load_result['generation'])
+                }
+            ]
+        )
+    return load_result
+
+def scrape_and_store(scrape_rows, database_file_name, ddl_file_name, table_name, key_columns, scrape_start=None, batch_size=DEFAULT_BATCH_SIZE,
+                     resume=False, load_mode='replace'):
+
+    """Used to scrape one bucket dataset and store it into its SQLite table, either fully or from a start position. A
+    full scrape replaces the table by swapping in a shadow table. When scrape_start gives a start position (e.g. a small overlap window before the
+    dataset's persisted high-water mark, or the first day of a date range), only folders from that position onwards are
+    scraped and the rows that are not stored yet are appended; without a start position or an existing table it falls
+    back to a full scrape. Either way the newest folder seen is persisted as the new high-water mark. Every batch is
+    committed together with a checkpoint of the last folder written; when resuming, a scrape that was interrupted
+    carries on after its checkpoint instead of listing the finished folders again; an interrupted full scrape carries
+    on filling its shadow table.
+    -----
+    Input parameters:
+    scrape_rows : function
+        row generator of the scraper, e.g. scrape_goes18_rows, called with start_from for partial scrapes
+    database_file_name : str
+        name of database file along with .db extension for creating SQLite database
+    ddl_file_name : str
+        name of sql script with .sql extension that contains the create table SQL statement
+    table_name : str
+        name of the table you wish to enter records into within the database_file_name
+    key_columns : list
+        columns that identify a scraped folder, from the top of the bucket down
+    scrape_start : function
+        function mapping the high-water mark (None if never scraped) to the start position of a partial scrape, or to
+        None for a full scrape; leave out for a full scrape
+    batch_size : int
+        number of rows written per transaction
+    resume : bool
+        carry on from the checkpoint of an interrupted scrape of this table, if there is one
+    load_mode : str
+        how a full scrape is stored: replace rewrites the table, merge keeps it, inserts the new folders and deletes
+        the ones that are gone (without checkpoints, since the merge is a single transaction)
+    -----
+    Returns:
+    Nothing
+    """
+
+    database_file_path = os.path.join(os.path.dirname(__file__),database_file_name)
+    high_water_mark = None
+    start_from = None
+    checkpoint = None
+    shadow_checkpoint = None
+    if (scrape_start is not None or resume) and Path(database_file_path).is_file():
+        db_conn = sqlite3.connect(database_file_path)
+        if resume and load_mode == 'replace' and table_exists(db_conn, shadow_table_name(table_name)):
+            shadow_checkpoint = read_checkpoint(db_conn, shadow_table_name(table_name))    #an interrupted full scrape
+        if shadow_checkpoint is None and table_exists(db_conn, table_name):
+            high_water_mark = read_high_water_mark(db_conn, table_name)
+            checkpoint = read_checkpoint(db_conn, table_name) if resume else None
+            if checkpoint is not None:  #the interrupted scrape finished every folder before its last key
+                start_from = checkpoint['last_key']
+            elif scrape_start is not None:
+                start_from = scrape_start(high_water_mark)
+        db_conn.close()
+
+    if start_from is None:     #full scrape, replacing the table
+        if shadow_checkpoint is not None:
+            clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+                logGroupName = "assignment01-logs",
+                logStreamName = "db-logs",
+                logEvents = [
+                    {
+                    'timestamp' : int(time.time() * 1e3),
+                    'message' : "Resuming full scrape of " + table_name + " starting from " + "/".join(shadow_checkpoint['last_key'])
+                    }
+                ]
+            )
+        scraped_rows = scrape_rows(start_from=shadow_checkpoint['last_key']) if shadow_checkpoint is not None else scrape_rows()
+        merge_counts = store_scraped_data_to_db(scraped_rows, database_file_name, ddl_file_name, table_name, batch_size,
+                                                key_columns if load_mode == 'replace' else None, load_mode, key_columns, delete_missing=True,
+                                                shadow_checkpoint=shadow_checkpoint)
+        if load_mode == 'merge':
+            clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+                logGroupName = "assignment01-logs",
+                logStreamName = "db-logs",
+                logEvents = [
+                    {
+                    'timestamp' : int(time.time() * 1e3),
+                    'message' : "Merged into table " + table_name + ": " + str(merge_counts['inserted']) + " inserted, " + str(merge_counts['unchanged']) + " unchanged, " + str(merge_counts['deleted']) + " deleted"
+                    }
+                ]
+            )
+        db_conn = connect_database(database_file_path, 'write')
+        newest_key = newest_key_in_table(db_conn, table_name, key_columns)
+    else:   #partial scrape, appending only the new folders
+        clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+            logGroupName = "assignment01-logs",
+            logStreamName = "db-logs",
+            logEvents = [
+                {
+                'timestamp' : int(time.time() * 1e3),
+                'message' : ("Resuming" if checkpoint else "Partial") + " scrape of " + table_name + " starting from " + "/".join(start_from)
+                }
+            ]
+        )
+        db_conn = connect_database(database_file_path, 'write')
+        prepare_table(db_conn, read_ddl_script(ddl_file_name), table_name)    #append into the declared schema and its indexes
+        checkpoint = checkpoint or {'rows_written': 0, 'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'last_key': None}
+        rows_added, newest_key = append_new_rows(scrape_rows(start_from=start_from), db_conn, table_name, key_columns, start_from, batch_size, checkpoint)
+        known_keys = [key for key in (newest_key, high_water_mark, checkpoint['last_key']) if key is not None]
+        newest_key = max(known_keys) if known_keys else None
+        clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+            logGroupName = "assignment01-logs",
+            logStreamName = "db-logs",
+            logEvents = [
+                {
+                'timestamp' : int(time.time() * 1e3),
+                'message' : "Appended " + str(rows_added) + " new rows into table: " + table_name
+                }
+            ]
+        )
+
+    if start_from is not None and rows_added:
+        bump_generation(db_conn, table_name)    #the rows changed, so caches and the hierarchy index are rebuilt
+    if newest_key is not None:
+        write_high_water_mark(db_conn, table_name, newest_key)
+    clear_checkpoint(db_conn, table_name)   #the scrape finished, together with its high-water mark
+    db_conn.commit()
+    db_conn.close()
+    refresh_dropdown_index(database_file_path)
+
+def rebuild_year(scrape_rows, database_file_name, ddl_file_name, table_name, key_columns, year):
+
+    """Used to rebuild the rows of a single year of a year-keyed table (NEXRAD) without touching the other years. The
+    year is scraped again and merged into the table within that year only: new folders are inserted and the folders
+    of the year that are gone are deleted, in one transaction. The folder table is clustered on the year first, so
+    the stored year is read and changed as one range of pages.
+    -----
+    Input parameters:
+    scrape_rows : function
+        row generator of the scraper, e.g. scrape_nexrad_rows, called with years=[year]
+    database_file_name : str
+        name of database file along with .db extension
+    ddl_file_name : str
+        name of sql script with .sql extension that contains the create table SQL statement
+    table_name : str
+        name of the table holding the year
+    key_columns : list
+        columns that identify a scraped folder, starting with the year
+    year : str
+        year to rebuild, e.g. '2023'
+    -----
+    Returns:
+    A dict with the number of rows inserted, unchanged and deleted
+    """
 
-def main():
-    #call scraper function to perform data scraping for all sources required
-    scraped_goes18_df = scrape_goes18_data()   #scrape goes18 bucket data and store result as dataframe
-    scraped_nexrad_df = scrape_nexrad_data()   #scrape nexrad bucket data and store result as dataframe
-    scraped_map_df = pd.DataFrame(scrape_nexrad_locations())   #scrape nexrad map data and store result as dataframe
+    database_file_path = os.path.join(os.path.dirname(__file__),database_file_name)
+    db_conn = connect_database(database_file_path, 'write')
+    merge_counts = load_scraped_data(scrape_rows(years=[year]), db_conn, read_ddl_script(ddl_file_name), table_name, DEFAULT_BATCH_SIZE, None,
+                                     'merge', key_columns, True, key_prefix=(year,))
+    db_conn.commit()
+    db_conn.close()
+    refresh_dropdown_index(database_file_path)
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "db-logs",
         logEvents = [
             {
             'timestamp' : int(time.time() * 1e3),
-            'message' : "All scraping scripts ran successfully"
+            'message' : "Rebuilt year " + year + " of table " + table_name + ": " + str(merge_counts['inserted']) + " inserted, " + str(merge_counts['unchanged']) + " unchanged, " + str(merge_counts['deleted']) + " deleted"
+            }
+        ]
+    )
+    return merge_counts
+
+def scrape_archive(database_file_name, goes_table_name, nexrad_table_name, goes_buckets, first_year, processes, resume=False):
+
+    """Used to crawl the full GOES and NEXRAD archive into the metadata tables. The crawl is planned into product/year
+    and year shards, the shards are crawled in parallel processes into their own partition files and the partitions
+    are merged into the tables, replacing them. The incremental and date range modes keep covering the assignment scope
+    (the GOES-18 ABI-L1b-RadC product) only.
+    -----
+    Input parameters:
+    database_file_name : str
+        name of database file along with .db extension
+    goes_table_name : str
+        name of the GOES metadata table
+    nexrad_table_name : str
+        name of the NEXRAD metadata table
+    goes_buckets : dict
+        GOES bucket names mapped to satellite names
+    first_year : int
+        first NEXRAD year to crawl
+    processes : int
+        number of shards crawled at the same time
+    resume : bool
+        keep the shards finished by an interrupted crawl instead of crawling them again
+    -----
+    Returns:
+    Nothing
+    """
+
+    database_file_path = os.path.join(os.path.dirname(__file__),database_file_name)
+    partition_dir = os.path.join(os.path.dirname(__file__),'archive_partitions')
+    shards = plan_archive_shards(s3_client(), goes_buckets, os.environ.get('NEXRAD_BUCKET_NAME'), first_year=first_year)
+    clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+        logGroupName = "assignment01-logs",
+        logStreamName = "db-logs",
+        logEvents = [
+            {
+            'timestamp' : int(time.time() * 1e3),
+            'message' : "Full archive scrape planned into " + str(len(shards)) + " shards"
+            }
+        ]
+    )
+    summary = scrape_full_archive(database_file_path, goes_table_name, nexrad_table_name, shards, partition_dir, processes, resume=resume)
+    refresh_dropdown_index(database_file_path)
+    clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+        logGroupName = "assignment01-logs",
+        logStreamName = "db-logs",
+        logEvents = [
+            {
+            'timestamp' : int(time.time() * 1e3),
+            'message' : "Full archive scrape merged " + str(summary.get(goes_table_name, 0)) + " GOES rows and " + str(summary.get(nexrad_table_name, 0)) + " NEXRAD rows"
+            }
+        ]
+    )
+
+def run_queue_role(database_file_name, goes_table_name, nexrad_table_name, queue_file_path, queue_role, goes_buckets, first_year, allow_failed=False):
+
+    """Used to run one role of a crawl shared through a work queue. The coordinator seeds the queue with the shards of
+    the full archive, any number of workers (on any host that sees the queue database) lease shards, list them and
+    store their rows in the queue, and once the queue is drained the rows are merged into the metadata tables.
+    -----
+    Input parameters:
+    database_file_name : str
+        name of database file along with .db extension
+    goes_table_name : str
+        name of the GOES metadata table
+    nexrad_table_name : str
+        name of the NEXRAD metadata table
+    queue_file_path : str
+        path of the SQLite queue database
+    queue_role : str
+        seed, work or merge
+    goes_buckets : dict
+        GOES bucket names mapped to satellite names, used when seeding
+    first_year : int
+        first NEXRAD year, used when seeding
+    allow_failed : bool
+        merge even though some shards failed, leaving their folders out of the tables
+    -----
+    Returns:
+    Nothing
+    """
+
+    if queue_role == 'seed':
+        shards = plan_archive_shards(s3_client(), goes_buckets, os.environ.get('NEXRAD_BUCKET_NAME'), first_year=first_year)
+        message = "Seeded work queue with " + str(seed_work_queue(queue_file_path, shards)) + " new shards out of " + str(len(shards))
+    elif queue_role == 'work':
+        summary = run_queue_worker(queue_file_path)
+        message = "Queue worker finished: " + str(summary['completed']) + " shards completed, " + str(summary['failed']) + " failed, " + str(summary['lost']) + " lost"
+    else:
+        progress = queue_progress(queue_file_path)
+        if progress['pending'] or progress['leased']:
+            raise SystemExit("Work queue not drained yet: " + str(progress))
+        summary = merge_work_results(queue_file_path, os.path.join(os.path.dirname(__file__),database_file_name), goes_table_name, nexrad_table_name, allow_failed)
+        refresh_dropdown_index(os.path.join(os.path.dirname(__file__),database_file_name))
+        message = "Merged work queue into " + str(summary.get(goes_table_name, 0)) + " GOES rows and " + str(summary.get(nexrad_table_name, 0)) + " NEXRAD rows"
+        if progress['failed']:
+            message += ", leaving out " + str(progress['failed']) + " failed shards"
+    clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+        logGroupName = "assignment01-logs",
+        logStreamName = "db-logs",
+        logEvents = [
+            {
+            'timestamp' : int(time.time() * 1e3),
+            'message' : message
             }
         ]
     )
 
-    #next, store this scraped data into a database; define variables for database name, individual sql scripts and individual table names
+def main(incremental=False, overlap_hours=DEFAULT_OVERLAP_HOURS, overlap_days=DEFAULT_OVERLAP_DAYS, date_range=None,
+         full_archive=False, goes_buckets=GOES_ARCHIVE_BUCKETS, first_year=NEXRAD_FIRST_YEAR, processes=DEFAULT_PROCESSES, manifest=False,
+         inventories=None, queue_file_path=None, queue_role=None, resume=False, load_mode='replace', parquet_directory=PARQUET_DIRECTORY,
+         rebuild_years=None, allow_failed=False):
+
+    """Scrapes all sources and stores them into the SQLite database.
+    -----
+    Input parameters:
+    incremental : bool
+        re-list the buckets only from each dataset's high-water mark onwards and append the new rows
+    overlap_hours : int
+        GOES hours before the high-water mark re-listed on an incremental run
+    overlap_days : int
+        NEXRAD days before the high-water mark re-listed on an incremental run
+    date_range : tuple
+        optional (start_date, end_date) of datetime.date values; when given, only the folders of that range are
+        scraped, from calendar generated prefixes (GOES hours are probed, NEXRAD days are listed for their stations),
+        and the new rows are appended
+    full_archive : bool
+        crawl every ABI product of every GOES bucket and every NEXRAD year instead of the assignment scope, sharded by
+        product and year across a process pool; rows are tagged with their bucket and satellite
+    goes_buckets : dict
+        GOES bucket names mapped to satellite names, crawled in full-archive mode
+    first_year : int
+        first NEXRAD year crawled in full-archive mode
+    processes : int
+        number of shards crawled at the same time in full-archive mode
+    manifest : bool
+        also record every object under the scraped folders into the FILES table, so file listings in the app can be
+        answered from the database
+    inventories : list
+        optional paths of local S3 Inventory reports (manifest.json and its CSV.gz or Parquet data files); when given,
+        the GOES and NEXRAD metadata tables and the FILES table are loaded from the reports instead of listing the
+        buckets, parsing the data files across processes
+    queue_file_path : str
+        path of the SQLite work queue shared by the hosts of a distributed full-archive crawl
+    queue_role : str
+        seed (plan the shards into the queue) or work (lease and list shards) run only that step and return; merge
+        loads the drained queue into the metadata tables in place of scraping the buckets
+    resume : bool
+        carry on from the checkpoints of an interrupted scrape (or the finished shards of an interrupted full-archive
+        crawl) instead of starting over
+    load_mode : str
+        replace rewrites the GOES and NEXRAD tables on a full scrape, merge keeps them and only inserts the new
+        folders and deletes the vanished ones
+    parquet_directory : str
+        folder the metadata tables are also written to as Parquet datasets partitioned by dataset and year, for
+        analytics and the DuckDB query backend; the generation of every table is bumped once its snapshot is written,
+        so the app does not keep answers cached from the previous snapshot. None to skip the snapshot
+    rebuild_years : list
+        optional NEXRAD years (str) to scrape again and rebuild in place of the usual scrape, leaving the other years
+        and the GOES table untouched
+    allow_failed : bool
+        let a queue merge go ahead although some shards failed, leaving their folders out of the tables
+    -----
+    Returns:
+    Nothing
+    """
+
+    #define variables for database name, individual sql scripts and individual table names
     database_file_name = 'sql_scraped_database.db'
     goes_ddl_file_name = 'sql_script_goes18.sql'
     goes_table_name = 'GOES_METADATA'
@@ -114,10 +652,96 @@ def main():
     map_ddl_file_name = 'sql_script_mapdata.sql'
     map_table_name = 'MAPDATA_NEXRAD'
 
-    #call function to move scraped data into SQLite database for all metadata that was extracted above
-    store_scraped_data_to_db(scraped_goes18_df, database_file_name, goes_ddl_file_name, goes_table_name)
-    store_scraped_data_to_db(scraped_nexrad_df, database_file_name, nexrad_ddl_file_name, nexrad_table_name)
-    store_scraped_data_to_db(scraped_map_df, database_file_name, map_ddl_file_name, map_table_name)
+    if queue_role in ('seed', 'work'):
+        run_queue_role(database_file_name, goes_table_name, nexrad_table_name, queue_file_path, queue_role, goes_buckets, first_year)
+        return
+
+    #call scraper functions for all sources required; the bucket scrapers are generators, so their rows are streamed
+    #straight into the SQLite database in batches as the crawl progresses instead of being collected first
+    database_file_path = os.path.join(os.path.dirname(__file__),database_file_name)
+    map_stats = {}
+    scraped_map_df = pd.DataFrame(scrape_nexrad_locations(database_file_path, map_stats))   #scrape nexrad map data and store result as dataframe
+    if inventories:
+        for inventory_path in inventories:
+            summary = ingest_inventory(inventory_path, database_file_path, processes=processes)
+            refresh_dropdown_index(database_file_path)
+            clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+                logGroupName = "assignment01-logs",
+                logStreamName = "db-logs",
+                logEvents = [
+                    {
+                    'timestamp' : int(time.time() * 1e3),
+                    'message' : "Loaded " + str(summary['folders']) + " " + summary['dataset'] + " folders and " + str(summary['files']) + " files from inventory " + str(inventory_path)
+                    }
+                ]
+            )
+    elif queue_role == 'merge':
+        run_queue_role(database_file_name, goes_table_name, nexrad_table_name, queue_file_path, queue_role, goes_buckets, first_year, allow_failed)
+    elif rebuild_years:
+        for year in rebuild_years:
+            rebuild_year(scrape_nexrad_rows, database_file_name, nexrad_ddl_file_name, nexrad_table_name, ['year', 'month', 'day', 'ground_station'], year)
+    elif full_archive:
+        scrape_archive(database_file_name, goes_table_name, nexrad_table_name, goes_buckets, first_year, processes, resume)
+    else:
+        goes_rows, nexrad_rows = scrape_goes18_rows, scrape_nexrad_rows
+        goes_start, nexrad_start = None, None
+        if date_range is not None:     #targeted scrape of a date range, starting from its first day
+            goes_rows = partial(scrape_goes18_rows, date_range=date_range)
+            nexrad_rows = partial(scrape_nexrad_rows, date_range=date_range)     #listing the days finds every station, mapped or not
+            goes_start = lambda high_water_mark: ('ABI-L1b-RadC', date_range[0].strftime('%Y'), date_range[0].strftime('%j'), '00')
+            nexrad_start = lambda high_water_mark: (date_range[0].strftime('%Y'), date_range[0].strftime('%m'), date_range[0].strftime('%d'))
+        elif incremental:   #start a small overlap window before each dataset's high-water mark
+            goes_start = lambda high_water_mark: goes_scrape_start(high_water_mark, overlap_hours) if high_water_mark else None
+            nexrad_start = lambda high_water_mark: nexrad_scrape_start(high_water_mark, overlap_days) if high_water_mark else None
+        scrape_and_store(goes_rows, database_file_name, goes_ddl_file_name, goes_table_name, ['product', 'year', 'day', 'hour'], goes_start, resume=resume, load_mode=load_mode)
+        scrape_and_store(nexrad_rows, database_file_name, nexrad_ddl_file_name, nexrad_table_name, ['year', 'month', 'day', 'ground_station'], nexrad_start, resume=resume, load_mode=load_mode)
+    if not map_stats['reused']:     #stored station rows are only rewritten when nexrad-stations.txt changed
+        store_scraped_data_to_db(scraped_map_df, database_file_name, map_ddl_file_name, map_table_name)
+        db_conn = sqlite3.connect(database_file_path)
+        write_high_water_mark(db_conn, map_table_name, map_stats['source_mark'])    #content and filters the rows were parsed from
+        db_conn.commit()
+        db_conn.close()
+
+    if manifest:    #list every file under the scraped folders into the FILES table
+        for dataset, bucket_name in (('GOES', os.environ.get('GOES18_BUCKET_NAME')), ('NEXRAD', os.environ.get('NEXRAD_BUCKET_NAME'))):
+            files_recorded = scrape_file_manifest(database_file_path, dataset, s3_client(), bucket_name)
+            clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+                logGroupName = "assignment01-logs",
+                logStreamName = "db-logs",
+                logEvents = [
+                    {
+                    'timestamp' : int(time.time() * 1e3),
+                    'message' : "Recorded " + str(files_recorded) + " " + dataset + " files into the file manifest"
+                    }
+                ]
+            )
+
+    if parquet_directory:   #columnar snapshot of every metadata table, read with read_parquet_snapshot and the DuckDB backend
+        for table_name in (goes_table_name, nexrad_table_name, map_table_name):
+            rows_written = refresh_parquet_snapshot(database_file_path, table_name, parquet_directory)     #only tables changed since their snapshot
+            clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+                logGroupName = "assignment01-logs",
+                logStreamName = "db-logs",
+                logEvents = [
+                    {
+                    'timestamp' : int(time.time() * 1e3),
+                    'message' : ("Parquet snapshot of " + table_name + " is up to date" if rows_written is None else
+                                 "Wrote " + str(rows_written) + " rows of " + table_name + " to the Parquet snapshot")
+                    }
+                ]
+            )
+        refresh_dropdown_index(database_file_path)  #built again under the new generations
+
+    clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+        logGroupName = "assignment01-logs",
+        logStreamName = "db-logs",
+        logEvents = [
+            {
+            'timestamp' : int(time.time() * 1e3),
+            'message' : "All scraping scripts ran successfully"
+            }
+        ]
+    )
     
     #the following lines have been commented out since they were needed to run once only, to generate the csv file that has been used in our GreatExpectations part
     #db = sqlite3.connect(os.path.join(os.path.dirname(__file__),database_file_name))
@@ -138,6 +762,40 @@ def main():
     )
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape GOES18 and NEXRAD metadata into the SQLite database")
+    parser.add_argument('--incremental', action='store_true', help="only re-list from the last scrape's high-water mark and append new rows")
+    parser.add_argument('--overlap-hours', type=int, default=DEFAULT_OVERLAP_HOURS, help="GOES hours before the high-water mark to re-list")
+    parser.add_argument('--overlap-days', type=int, default=DEFAULT_OVERLAP_DAYS, help="NEXRAD days before the high-water mark to re-list")
+    parser.add_argument('--last-days', type=int, help="only scrape the last N days, probing calendar generated prefixes")
+    parser.add_argument('--start-date', type=date.fromisoformat, help="first day (YYYY-MM-DD) of a targeted date range scrape")
+    parser.add_argument('--end-date', type=date.fromisoformat, help="last day (YYYY-MM-DD) of a targeted date range scrape, defaults to today")
+    parser.add_argument('--full-archive', action='store_true', help="crawl every GOES ABI product and every NEXRAD year, sharded across processes")
+    parser.add_argument('--goes-buckets', default=",".join(GOES_ARCHIVE_BUCKETS), help="comma separated GOES buckets crawled in full-archive mode")
+    parser.add_argument('--first-year', type=int, default=NEXRAD_FIRST_YEAR, help="first NEXRAD year crawled in full-archive mode")
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES, help="number of shards crawled (or inventory files parsed) at the same time")
+    parser.add_argument('--manifest', action='store_true', help="also record every file under the scraped folders into the FILES table")
+    parser.add_argument('--inventory', action='append', help="load metadata from a local S3 Inventory report (manifest.json or its directory) instead of listing the bucket, can be repeated")
+    parser.add_argument('--queue', help="SQLite work queue shared by the hosts of a distributed full-archive crawl")
+    parser.add_argument('--queue-role', choices=['seed', 'work', 'merge'], help="seed the queue, run a worker, or merge the drained queue into the database")
+    parser.add_argument('--allow-failed', action='store_true', help="merge the queue even though some shards failed, leaving their folders out")
+    parser.add_argument('--resume', action='store_true', help="carry on from the checkpoint of an interrupted scrape instead of starting over")
+    parser.add_argument('--load-mode', choices=['replace', 'merge'], default='replace', help="rewrite the metadata tables on a full scrape, or merge new folders into them")
+    parser.add_argument('--parquet-dir', default=PARQUET_DIRECTORY, help="folder of the Parquet snapshot of the metadata tables")
+    parser.add_argument('--no-parquet', action='store_true', help="do not write the Parquet snapshot")
+    parser.add_argument('--rebuild-year', action='append', help="only scrape this NEXRAD year (YYYY) again and rebuild it in place, can be repeated")
+    args = parser.parse_args()
+    if args.queue_role and not args.queue:
+        parser.error("--queue-role needs --queue")
+    if args.last_days is not None and args.last_days < 1:
+        parser.error("--last-days needs at least 1 day")
+    goes_buckets = {bucket: GOES_ARCHIVE_BUCKETS.get(bucket, bucket) for bucket in args.goes_buckets.split(",")}
+
+    date_range = None
+    if args.last_days is not None:
+        date_range = last_days(args.last_days)
+    elif args.start_date:
+        date_range = (args.start_date, args.end_date or last_days(1)[1])
+
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "db-logs",
@@ -148,7 +806,8 @@ if __name__ == "__main__":
             }
         ]
     )
-    main()
+    main(args.incremental, args.overlap_hours, args.overlap_days, date_range, args.full_archive, goes_buckets, args.first_year, args.processes, args.manifest, args.inventory, args.queue, args.queue_role, args.resume, args.load_mode,
+         None if args.no_parquet else args.parquet_dir, args.rebuild_year, args.allow_failed)
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "db-logs",
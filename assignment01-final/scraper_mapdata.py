@@ -3,15 +3,124 @@ import boto3
 import re
 import os
 import time
+import sqlite3
+import pandas as pd
 import plotly.graph_objects as go
+from http_cache import fetch_cached
+from incremental_scrape import read_high_water_mark
 
-def scrape_nexrad_locations():
+MAP_TABLE_NAME = 'MAPDATA_NEXRAD'
+HOMR_COUNTRIES = ('UNITED STATES',)     #only consider satellites over USA by default
+HOMR_STATION_TYPES = ('NEXRAD',)    #the station list also holds TDWR airport radars
+
+#HOMR column headers and the column names they are parsed into
+HOMR_COLUMNS = {
+    'NCDCID': 'ncdc_id', 'ICAO': 'ground_station', 'WBAN': 'wban', 'NAME': 'name', 'COUNTRY': 'country', 'ST': 'state',
+    'COUNTY': 'county', 'LAT': 'latitude', 'LON': 'longitude', 'ELEV': 'elevation', 'UTC': 'utc_offset', 'STNTYPE': 'station_type'
+}
+
+def parse_homr_stations(text):
+
+    """Function parses the fixed-width station list published by NCEI HOMR (nexrad-stations.txt) in a single
+    vectorized pass. The column boundaries are taken from the dashed line under the header, so every field is read
+    from its own columns instead of being guessed from the tokens of a line.
+    -----
+    Input parameters:
+    text : str
+        content of nexrad-stations.txt
+    -----
+    Returns:
+    A DataFrame with one row per station of every country and station type, with numeric latitude, longitude
+    (floats) and elevation (nullable integer, in feet); fields missing from a line are left empty
+    """
+
+    lines = text.splitlines()
+    if len(lines) < 2 or not re.fullmatch(r'[- ]+', lines[1].strip()):
+        raise ValueError("nexrad-stations.txt does not start with a header and a dashed column line")
+    spans = [match.span() for match in re.finditer(r'-+', lines[1])]
+    spans[-1] = (spans[-1][0], None)    #the last column runs to the end of the line
+    headers = [lines[0][start:end].strip() for start, end in spans]
+
+    station_lines = pd.Series(lines[2:], dtype=str)
+    stations = pd.DataFrame({HOMR_COLUMNS.get(header, header.lower()): station_lines.str.slice(start, end).str.strip()
+                             for header, (start, end) in zip(headers, spans)})     #one vectorized slice per column
+    stations = stations[stations['ground_station'] != ''].reset_index(drop=True)
+    for column in ('latitude', 'longitude'):
+        stations[column] = pd.to_numeric(stations[column], errors='coerce')
+    stations['elevation'] = pd.to_numeric(stations['elevation'], errors='coerce').round().astype('Int64')
+    return stations
+
+def select_stations(stations, countries=HOMR_COUNTRIES, station_types=HOMR_STATION_TYPES):
+
+    """Function filters parsed stations by country and station type.
+    -----
+    Input parameters:
+    stations : DataFrame
+        stations as returned by parse_homr_stations
+    countries : tuple
+        countries to keep, None keeps every country
+    station_types : tuple
+        station types to keep (NEXRAD, TDWR), None keeps every type
+    -----
+    Returns:
+    A DataFrame with the selected stations, in file order
+    """
+
+    keep = pd.Series(True, index=stations.index)
+    if countries is not None:
+        keep &= stations['country'].str.upper().isin([country.upper() for country in countries])
+    if station_types is not None:
+        last_type = stations['station_type'].str.split().str[-1].str.upper()     #type is the last word of a line
+        keep &= last_type.isin([station_type.upper() for station_type in station_types])
+    return stations[keep].reset_index(drop=True)
+
+def read_stored_locations(database_file_path, source_mark):
+
+    """Function reads back the station locations stored in the database, if they were parsed from the same content
+    of nexrad-stations.txt with the same filters (stored as the table's mark in SCRAPE_STATE).
+    -----
+    Input parameters:
+    database_file_path : str
+        path of the metadata database
+    source_mark : tuple
+        SHA-256 of the freshly fetched nexrad-stations.txt followed by the country and station type filters
+    -----
+    Returns:
+    A dict in the same layout scrape_nexrad_locations returns, or None if the stored rows are missing or stale
+    """
+
+    if database_file_path is None or not os.path.isfile(database_file_path):
+        return None
+    db_conn = sqlite3.connect(database_file_path)
+    try:
+        if read_high_water_mark(db_conn, MAP_TABLE_NAME) != source_mark:
+            return None
+        return pd.read_sql_query("SELECT * FROM " + MAP_TABLE_NAME + " ORDER BY id", db_conn).to_dict('list')
+    except (sqlite3.Error, pd.errors.DatabaseError):    #table missing or database busy, parse the file again
+        return None
+    finally:
+        db_conn.close()
+
+def scrape_nexrad_locations(database_file_path=None, stats=None, countries=HOMR_COUNTRIES, station_types=HOMR_STATION_TYPES):
 
     """Function scrapes a .txt file found on the internet containg NEXRAD satellite station locations. It scrapes for
     details like longitude, latitude, state, county, elevation and ground station ID for the satellites geoprapically 
     located in the USA. Initially, the function sets up a boto3 client for accessing AWS CloudWatch to perform logging 
     to a log group and log stream. This client has its own AWS access & secret key generated from AWS with 
-    necessary permissions that should be stored in your .env file.
+    necessary permissions that should be stored in your .env file. The file is fetched through an on-disk HTTP cache
+    that revalidates with ETag/If-Modified-Since, and if its content is the same as the one the stored MAPDATA_NEXRAD
+    rows were parsed from, those rows are returned without parsing the file again.
+    -----
+    Input parameters:
+    database_file_path : str
+        optional path of the metadata database holding previously stored station locations
+    stats : dict
+        optional dict that is filled with the source mark (content hash and filters) of the rows and whether the
+        stored rows were reused
+    countries : tuple
+        countries whose stations are kept, None keeps the non-US sites too
+    station_types : tuple
+        station types kept, e.g. ('NEXRAD', 'TDWR'), None keeps every type
     -----
     Returns:
     A dictionary containing path for all subfolders 
@@ -24,17 +133,6 @@ def scrape_nexrad_locations():
                             aws_secret_access_key = os.environ.get('AWS_LOG_SECRET_KEY')
                             )
 
-    #initialise containers for relevant data
-    nexrad=[]
-    satellite_metadata = {
-        'id': [],
-        'ground_station': [],
-        'state': [],
-        'county': [],
-        'latitude': [],
-        'longitude': [],
-        'elevation': []
-    }
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "db-logs",
@@ -49,8 +147,7 @@ def scrape_nexrad_locations():
     url = "https://www.ncei.noaa.gov/access/homr/file/nexrad-stations.txt"
 
     try:
-        response = requests.get(url)    #recording the response from the webpage
-        response.raise_for_status()
+        text, content_hash = fetch_cached(url)    #recording the response from the webpage, or the cached copy if unchanged
     except requests.exceptions.HTTPError as err_http:
         clientLogs.put_log_events(      #logging to AWS CloudWatch logs
             logGroupName = "assignment01-logs",
@@ -100,40 +197,35 @@ def scrape_nexrad_locations():
         )
         raise SystemExit(err_req)
 
-    #traverse extracted txt data line by line
-    lines = response.text.split('\n')
-    for line in lines:
-        line=line.strip()   #strip leading and trailing whitespaces
-        word_list = line.split(" ")
-        if (word_list[-1].upper() == 'NEXRAD'):     #check if the data belongs to a NEXRAD satellite
-            nexrad.append(line)
-    nexrad = [i for i in nexrad if 'UNITED STATES' in i]    #only consider satellites over USA
-
-    #extracting state and county information 
-    id=0    #to store in database
-    for satellite in nexrad:
-        id+=1
-        satellite = satellite.split("  ")
-        satellite =  [i.strip() for i in satellite if i != ""]
-        satellite_metadata['id'].append(id)
-        satellite_metadata['ground_station'].append(satellite[0].split(" ")[1])
-        for i in range(len(satellite)):
-            if (re.match(r'\b[A-Z][A-Z]\b',satellite[i].strip())):      #use regex to match with the state field containing 2 capital letters
-                satellite_metadata['state'].append(satellite[i][:2])    #append state field to final dict
-                satellite_metadata['county'].append(satellite[i][2:])   #append county field to final dict
-
-    #extracting latitude, longitude and elevation information 
-    for satellite in nexrad:
-        satellite = satellite.split(" ")
-        satellite =  [i.strip() for i in satellite if i != ""]      #strip for any whitespaces if the string is not empty
-        for i in range(len(satellite)):
-            if (re.match(r'^-?[0-9]\d(\.\d+)?$',satellite[i])):     #use regex to match with the coordinate string
-                state_county = satellite[i].split()
-                satellite_metadata['latitude'].append(satellite[i])     #append latitude as string to final dict
-                satellite_metadata['longitude'].append(satellite[i+1])  #append longtidue as string to final dict
-                satellite_metadata['elevation'].append(int(satellite[i+2]))     #append elevation as int to final dict
-                break
-    
+    source_mark = (content_hash, ','.join(countries or ['*']), ','.join(station_types or ['*']))
+    stored_metadata = read_stored_locations(database_file_path, source_mark)
+    if stats is not None:
+        stats['source_mark'] = source_mark
+        stats['reused'] = stored_metadata is not None
+    if stored_metadata is not None:     #same content as last time, skip parsing
+        clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+            logGroupName = "assignment01-logs",
+            logStreamName = "db-logs",
+            logEvents = [
+                {
+                'timestamp' : int(time.time() * 1e3),
+                'message' : "NEXRAD statellite locations unchanged, reusing stored data"
+                }
+            ]
+        )
+        return stored_metadata
+
+    stations = select_stations(parse_homr_stations(text), countries, station_types)
+    satellite_metadata = {
+        'id': list(range(1, len(stations) + 1)),    #to store in database
+        'ground_station': stations['ground_station'].tolist(),
+        'state': stations['state'].tolist(),
+        'county': stations['county'].tolist(),
+        'latitude': stations['latitude'].tolist(),
+        'longitude': stations['longitude'].tolist(),
+        'elevation': stations['elevation'].astype(object).where(stations['elevation'].notna(), None).tolist()
+    }
+
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "db-logs",
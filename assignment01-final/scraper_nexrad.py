@@ -2,25 +2,50 @@ import os
 import boto3
 import time
 import pandas as pd
+from botocore.config import Config
+from s3_concurrency import governed, NO_RETRIES_CONFIG
+from s3_crawler import iter_prefix_tree, prefixes_from, DEFAULT_MAX_WORKERS
+from prefix_calendar import nexrad_day_prefixes, nexrad_station_prefixes, probe_prefixes
 
-def scrape_nexrad_data():
+NEXRAD_COLUMNS = ['id', 'year', 'month', 'day', 'ground_station']    #columns of the NEXRAD_METADATA table
 
-    """Function scrapes the publically available amazon s3 bucket for NEXRAD Level 2 satellite radar data,
-    all sub folders for 2 pre-defined years (2022 and 2023) are selected and appended into a dictionary, the final return 
-    value is a dataframe. Initially, the function sets up 2 boto3 clients (to connect to AWS): 1 for accessing s3 buckets
-    and the other for accessing AWS CloudWatch to perform logging to a log group and log stream. Both these clients have their
-    own AWS access & secret key generated from AWS with necessary permissions that should be stored in your .env file.
+def scrape_nexrad_rows(max_workers=DEFAULT_MAX_WORKERS, start_from=None, date_range=None, stations=None, years=None):
+
+    """Function scrapes the publically available amazon s3 bucket for NEXRAD Level 2 satellite radar data and yields
+    one row per ground station folder for 2 pre-defined years (2022 and 2023) as soon as its day folder has been 
+    listed, so the caller can write rows out in batches without holding the whole scrape in memory. Initially, the 
+    function sets up 2 boto3 clients (to connect to AWS): 1 for accessing s3 buckets and the other for accessing AWS 
+    CloudWatch to perform logging to a log group and log stream. Both these clients have their own AWS access & secret 
+    key generated from AWS with necessary permissions that should be stored in your .env file. The folder levels are 
+    listed concurrently and page by page through the shared prefix crawler.
+    -----
+    Input parameters:
+    max_workers : int
+        maximum number of concurrent list requests made to the bucket
+    start_from : tuple
+        optional (year, month, day) or (year, month, day, ground station) folder names; when given, only folders at or
+        after this position are listed
+    date_range : tuple
+        optional (start_date, end_date) of datetime.date values; when given, the folders of that range are generated
+        from the calendar instead of being discovered level by level
+    stations : list
+        optional ground station IDs probed for every day of date_range, to scrape only those stations; without them
+        each day folder is listed once to find all of its stations, which also finds stations missing from
+        MAPDATA_NEXRAD
+    years : list
+        optional years (str) to crawl instead of the 2 pre-defined ones, e.g. to rebuild a single year
     -----
     Returns:
-    A dataframe containing path for all subfolders 
+    A generator of dicts, each holding the id, year, month, day and ground station of one scraped folder
     """
 
     #authenticate S3 client with your user credentials that are stored in your .env config file
-    s3client = boto3.client('s3',
+    s3client = governed(boto3.client('s3',
                             region_name='us-east-1',
                             aws_access_key_id = os.environ.get('AWS_ACCESS_KEY'),
-                            aws_secret_access_key = os.environ.get('AWS_SECRET_KEY')
-                            )
+                            aws_secret_access_key = os.environ.get('AWS_SECRET_KEY'),
+                            config = Config(max_pool_connections=max_workers).merge(NO_RETRIES_CONFIG)    #one pooled connection per crawler worker
+                            ))  #requests in flight are adapted to throttling by the shared governor
 
     #authenticate S3 client for logging with your user credentials that are stored in your .env config file
     clientLogs = boto3.client('logs',
@@ -29,15 +54,6 @@ def scrape_nexrad_data():
                             aws_secret_access_key = os.environ.get('AWS_LOG_SECRET_KEY')
                             )
 
-    #intialise dictionary to store scraped data before moving it to a sqllite table
-    scraped_nexrad_dict = {
-        'id': [],
-        'year': [],
-        'month': [],
-        'day': [],
-        'ground_station': []
-    }
-
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
         logStreamName = "db-logs",
@@ -50,28 +66,42 @@ def scrape_nexrad_data():
     )
 
     id=1    #for storing as primary key in db
-    years_to_scrape = ['2022', '2023']      #considering only 2 years as per scope of assignment
+    years_to_scrape = years or ['2022', '2023']      #considering only 2 years as per scope of assignment
+    year_prefixes = [year+"/" for year in years_to_scrape]
 
-    for year in years_to_scrape:
-        prefix = year+"/"    #replace this with user input from streamlit UI with / in end
-        result = s3client.list_objects(Bucket=os.environ.get('NEXRAD_BUCKET_NAME'), Prefix=prefix, Delimiter='/')
-        #travesing into each subfolder and store the folder names within each
-        for o in result.get('CommonPrefixes'):
-            path = o.get('Prefix').split('/')
-            prefix_2 = prefix + path[-2] + "/"      #new prefix with added subdirectory path
-            sub_folder = s3client.list_objects(Bucket=os.environ.get('NEXRAD_BUCKET_NAME'), Prefix=prefix_2, Delimiter='/')
-            for p in sub_folder.get('CommonPrefixes'):
-                sub_path = p.get('Prefix').split('/')
-                prefix_3 = prefix_2 + sub_path[-2] + "/"    #new prefix with added subdirectory path
-                sub_sub_folder = s3client.list_objects(Bucket=os.environ.get('NEXRAD_BUCKET_NAME'), Prefix=prefix_3, Delimiter='/')
-                for q in sub_sub_folder.get('CommonPrefixes'):
-                    sub_sub_path = q.get('Prefix').split('/')   #remove the filename from the path
-                    scraped_nexrad_dict['id'].append(id)   #map all scraped data into the dict
-                    scraped_nexrad_dict['year'].append(sub_sub_path[0])
-                    scraped_nexrad_dict['month'].append(sub_sub_path[1])
-                    scraped_nexrad_dict['day'].append(sub_sub_path[2])
-                    scraped_nexrad_dict['ground_station'].append(sub_sub_path[3])
-                    id+=1
+    crawl_stats = {}
+    crawl_filter = prefixes_from(start_from) if start_from else None   #incremental and resumed scrapes skip everything before start_from
+    if date_range is not None and stations:
+        #generate the station folders of the date range and probe them concurrently, skipping all listing levels
+        candidate_prefixes = [station_prefix for station_prefix in nexrad_station_prefixes(date_range[0], date_range[1], stations) if crawl_filter is None or crawl_filter(station_prefix)]
+        station_prefixes = probe_prefixes(s3client, os.environ.get('NEXRAD_BUCKET_NAME'), candidate_prefixes, max_workers, crawl_stats)
+    elif date_range is not None:
+        #generate the day folders of the date range and list only their stations
+        station_prefixes = iter_prefix_tree(s3client, os.environ.get('NEXRAD_BUCKET_NAME'), nexrad_day_prefixes(*date_range), 1, max_workers, crawl_stats, crawl_filter)
+    else:
+        #crawl the month, day and ground station levels below each year concurrently; leaves come back in sorted order
+        station_prefixes = iter_prefix_tree(s3client, os.environ.get('NEXRAD_BUCKET_NAME'), year_prefixes, 3, max_workers, crawl_stats, crawl_filter)
+    for station_prefix in station_prefixes:
+        sub_sub_path = station_prefix.split('/')   #split the prefix into its folder names
+        yield {
+            'id': id,
+            'year': sub_sub_path[0],
+            'month': sub_sub_path[1],
+            'day': sub_sub_path[2],
+            'ground_station': sub_sub_path[3]
+        }
+        id+=1
+
+    clientLogs.put_log_events(      #logging to AWS CloudWatch logs
+        logGroupName = "assignment01-logs",
+        logStreamName = "db-logs",
+        logEvents = [
+            {
+            'timestamp' : int(time.time() * 1e3),
+            'message' : "Crawled " + str(crawl_stats['prefixes_listed']) + " NEXRAD prefixes at " + str(round(crawl_stats['prefixes_per_second'], 2)) + " prefixes/second"
+            }
+        ]
+    )
 
     clientLogs.put_log_events(      #logging to AWS CloudWatch logs
         logGroupName = "assignment01-logs",
@@ -83,6 +113,30 @@ def scrape_nexrad_data():
             }
         ]
     )
-      
-    scraped_nexrad_df = pd.DataFrame(scraped_nexrad_dict)     #final scraped metadata stored in dataframe
-    return scraped_nexrad_df    #the final dataframe containing scraped metadata
\ No newline at end of file
+
+def scrape_nexrad_data(max_workers=DEFAULT_MAX_WORKERS, start_from=None, date_range=None, stations=None):
+
+    """Function scrapes the publically available amazon s3 bucket for NEXRAD Level 2 satellite radar data,
+    all sub folders for 2 pre-defined years (2022 and 2023) are selected and collected into a dataframe. The rows are
+    produced by scrape_nexrad_rows; use that generator directly to stream a large scrape into the database.
+    -----
+    Input parameters:
+    max_workers : int
+        maximum number of concurrent list requests made to the bucket
+    start_from : tuple
+        optional (year, month, day) or (year, month, day, ground station) folder names; when given, only folders at or
+        after this position are listed
+    date_range : tuple
+        optional (start_date, end_date) of datetime.date values; when given, the folders of that range are generated
+        from the calendar instead of being discovered level by level
+    stations : list
+        optional ground station IDs probed for every day of date_range, to scrape only those stations; without them
+        each day folder is listed once to find all of its stations, which also finds stations missing from
+        MAPDATA_NEXRAD
+    -----
+    Returns:
+    A dataframe containing path for all subfolders 
+    """
+
+    scraped_nexrad_df = pd.DataFrame(list(scrape_nexrad_rows(max_workers, start_from, date_range, stations)), columns=NEXRAD_COLUMNS)     #final scraped metadata stored in dataframe
+    return scraped_nexrad_df    #the final dataframe containing scraped metadata
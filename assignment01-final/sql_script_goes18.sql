@@ -1 +1,10 @@
-CREATE TABLE IF NOT EXISTS GOES_METADATA(id number, product text, year text, day text, hour text);
\ No newline at end of file
+CREATE TABLE IF NOT EXISTS GOES_PRODUCT(product_id INTEGER PRIMARY KEY, bucket TEXT NOT NULL DEFAULT 'noaa-goes18', satellite TEXT NOT NULL DEFAULT 'GOES-18', product TEXT NOT NULL, UNIQUE (product, bucket));
+CREATE TABLE IF NOT EXISTS GOES_FOLDER(product_id INTEGER NOT NULL REFERENCES GOES_PRODUCT(product_id), year INTEGER NOT NULL, day INTEGER NOT NULL, hour INTEGER NOT NULL, id INTEGER NOT NULL, PRIMARY KEY (product_id, year, day, hour)) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS GOES_METADATA AS SELECT id, product, year, day, hour, bucket, satellite FROM GOES_FOLDER LEFT JOIN GOES_PRODUCT USING (product_id);
+CREATE TRIGGER IF NOT EXISTS GOES_METADATA_INSERT INSTEAD OF INSERT ON GOES_METADATA BEGIN
+    INSERT OR IGNORE INTO GOES_PRODUCT (bucket, satellite, product) VALUES (COALESCE(NEW.bucket, 'noaa-goes18'), COALESCE(NEW.satellite, 'GOES-18'), NEW.product);
+    INSERT INTO GOES_FOLDER (product_id, year, day, hour, id) SELECT product_id, NEW.year, NEW.day, NEW.hour, NEW.id FROM GOES_PRODUCT WHERE bucket = COALESCE(NEW.bucket, 'noaa-goes18') AND product = NEW.product;
+END;
+CREATE TRIGGER IF NOT EXISTS GOES_METADATA_DELETE INSTEAD OF DELETE ON GOES_METADATA BEGIN
+    DELETE FROM GOES_FOLDER WHERE product_id = (SELECT product_id FROM GOES_PRODUCT WHERE bucket = OLD.bucket AND product = OLD.product) AND year = OLD.year AND day = OLD.day AND hour = OLD.hour;
+END;
@@ -1 +1,2 @@
-CREATE TABLE IF NOT EXISTS MAPDATA_NEXRAD(id number, station text, state text, county text, latitude text, longitude text, elevation text);
\ No newline at end of file
+CREATE TABLE IF NOT EXISTS MAPDATA_NEXRAD(id INTEGER PRIMARY KEY, ground_station TEXT NOT NULL, state TEXT, county TEXT, latitude REAL, longitude REAL, elevation INTEGER);
+CREATE INDEX IF NOT EXISTS MAPDATA_NEXRAD_STATION ON MAPDATA_NEXRAD(ground_station);
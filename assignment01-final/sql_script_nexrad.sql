@@ -1 +1,10 @@
-CREATE TABLE IF NOT EXISTS NEXRAD_METADATA(id number, year text, month text, day text, ground_station text);
\ No newline at end of file
+CREATE TABLE IF NOT EXISTS NEXRAD_STATION(station_id INTEGER PRIMARY KEY, ground_station TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS NEXRAD_FOLDER(year INTEGER NOT NULL, month INTEGER NOT NULL, day INTEGER NOT NULL, station_id INTEGER NOT NULL REFERENCES NEXRAD_STATION(station_id), id INTEGER NOT NULL, PRIMARY KEY (year, month, day, station_id)) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS NEXRAD_METADATA AS SELECT id, year, month, day, ground_station FROM NEXRAD_FOLDER LEFT JOIN NEXRAD_STATION USING (station_id);
+CREATE TRIGGER IF NOT EXISTS NEXRAD_METADATA_INSERT INSTEAD OF INSERT ON NEXRAD_METADATA BEGIN
+    INSERT OR IGNORE INTO NEXRAD_STATION (ground_station) VALUES (NEW.ground_station);
+    INSERT INTO NEXRAD_FOLDER (year, month, day, station_id, id) SELECT NEW.year, NEW.month, NEW.day, station_id, NEW.id FROM NEXRAD_STATION WHERE ground_station = NEW.ground_station;
+END;
+CREATE TRIGGER IF NOT EXISTS NEXRAD_METADATA_DELETE INSTEAD OF DELETE ON NEXRAD_METADATA BEGIN
+    DELETE FROM NEXRAD_FOLDER WHERE year = OLD.year AND month = OLD.month AND day = OLD.day AND station_id = (SELECT station_id FROM NEXRAD_STATION WHERE ground_station = OLD.ground_station);
+END;
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088     #mean earth radius
+COVERAGE_RADIUS_KM = 230    #range of the Level II velocity products of a NEXRAD radar, reflectivity reaches further
+
+def unit_vectors(latitudes, longitudes):
+
+    """Function turns latitudes and longitudes into points on the unit sphere, where the straight-line (chord)
+    distance grows with the great-circle distance, so a KD-tree over them finds the nearest stations on the globe.
+    -----
+    Input parameters:
+    latitudes : array-like
+        latitudes in degrees
+    longitudes : array-like
+        longitudes in degrees
+    -----
+    Returns:
+    A (n, 3) array of the points
+    """
+
+    latitudes, longitudes = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+    return np.column_stack((np.cos(latitudes) * np.cos(longitudes), np.cos(latitudes) * np.sin(longitudes), np.sin(latitudes)))
+
+def chord_to_km(chords):
+
+    """Function converts chord lengths on the unit sphere to great-circle distances.
+    -----
+    Input parameters:
+    chords : array-like
+        chord lengths
+    -----
+    Returns:
+    The distances in km (array)
+    """
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chords) / 2, 1.0))
+
+def km_to_chord(distance_km):
+
+    """Function converts a great-circle distance to the chord length on the unit sphere.
+    -----
+    Input parameters:
+    distance_km : float
+        distance in km
+    -----
+    Returns:
+    The chord length (float)
+    """
+
+    return 2 * np.sin(min(distance_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+class StationLocator:
+
+    """Used to answer spatial lookups on the NEXRAD station locations: the nearest stations to points, the stations
+    covering a point and the stations inside a box. The locations are held in a KD-tree over points on the unit sphere,
+    and the lookups take arrays of points, so thousands of points are answered in one call.
+    """
+
+    def __init__(self, stations):
+        stations = stations.assign(latitude=pd.to_numeric(stations['latitude'], errors='coerce'),     #stored as text by older loads
+                                   longitude=pd.to_numeric(stations['longitude'], errors='coerce'))
+        self.stations = stations.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+        self.codes = self.stations['ground_station'].to_numpy()
+        self.tree = cKDTree(unit_vectors(self.stations['latitude'], self.stations['longitude']))
+
+    def nearest(self, latitudes, longitudes, k=1):
+
+        """Function finds the k nearest stations of every point.
+        -----
+        Input parameters:
+        latitudes : float or array-like
+            latitudes of the points in degrees
+        longitudes : float or array-like
+            longitudes of the points in degrees
+        k : int
+            number of stations per point
+        -----
+        Returns:
+        codes : numpy.ndarray
+            (points, k) array of the ground station codes, nearest first; k is cut to the number of stations
+        distances : numpy.ndarray
+            (points, k) array of the great-circle distances in km
+        """
+
+        points = unit_vectors(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+        k = min(k, len(self.codes))
+        if k < 1:   #no stations stored yet, the tree cannot be asked for none
+            return np.empty((len(points), 0), dtype=self.codes.dtype), np.empty((len(points), 0))
+        chords, positions = self.tree.query(points, k=k)
+        chords, positions = np.asarray(chords).reshape(-1, k), np.asarray(positions).reshape(-1, k)
+        return self.codes[positions], chord_to_km(chords)
+
+    def covering(self, latitudes, longitudes, radius_km=COVERAGE_RADIUS_KM):
+
+        """Function finds the stations whose coverage radius reaches every point.
+        -----
+        Input parameters:
+        latitudes : float or array-like
+            latitudes of the points in degrees
+        longitudes : float or array-like
+            longitudes of the points in degrees
+        radius_km : float
+            coverage radius of a station in km
+        -----
+        Returns:
+        A list with, per point, a list of (ground station, distance in km) tuples, nearest first
+        """
+
+        points = unit_vectors(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+        hits = []
+        for point, positions in zip(points, self.tree.query_ball_point(points, km_to_chord(radius_km))):
+            distances = chord_to_km(np.linalg.norm(self.tree.data[positions] - point, axis=1)) if positions else np.empty(0)
+            hits.append([(self.codes[positions[number]], float(distances[number])) for number in np.argsort(distances, kind='stable')])
+        return hits
+
+    def in_box(self, min_latitude, max_latitude, min_longitude, max_longitude):
+
+        """Function lists the stations inside a latitude/longitude box; a box with min_longitude above max_longitude
+        crosses the antimeridian.
+        -----
+        Input parameters:
+        min_latitude : float
+            southern edge in degrees
+        max_latitude : float
+            northern edge in degrees
+        min_longitude : float
+            western edge in degrees
+        max_longitude : float
+            eastern edge in degrees
+        -----
+        Returns:
+        A DataFrame of the stations inside the box
+        """
+
+        latitude, longitude = self.stations['latitude'], self.stations['longitude']
+        inside_latitude = latitude.between(min_latitude, max_latitude)
+        if min_longitude <= max_longitude:
+            inside_longitude = longitude.between(min_longitude, max_longitude)
+        else:
+            inside_longitude = (longitude >= min_longitude) | (longitude <= max_longitude)
+        return self.stations[inside_latitude & inside_longitude].reset_index(drop=True)
@@ -72,18 +72,19 @@ def goes_main():
             
         product_box = st.selectbox("Product name: ", product_selected, disabled = True, key="selected_product")
         #define year box
-        years_in_selected_product = query_metadata_database.get_years_in_product_goes(product_box)
+        product_tree = query_metadata_database.get_product_tree_goes(product_box)  #years, days and hours of the product in one lookup
+        years_in_selected_product = list(product_tree)
         year_box = st.selectbox("Year for which you are looking to get data for: ", ["--"]+years_in_selected_product, key="selected_year")
         if (year_box == "--"):
             st.warning("Please select an year!")
         else:
-            days_in_selected_year = query_metadata_database.get_days_in_year_goes(year_box, product_box)    #days in selected year
+            days_in_selected_year = list(product_tree[year_box])    #days in selected year
             #define day box
             day_box = st.selectbox("Day within year for which you want data: ", ["--"]+days_in_selected_year, key="selected_day")
             if (day_box == "--"):
                 st.warning("Please select a day!")
             else:
-                hours_in_selected_day = query_metadata_database.get_hours_in_day_goes(day_box, year_box, product_box)   #hours in selected day     
+                hours_in_selected_day = product_tree[year_box][day_box]   #hours in selected day     
                 #define hour box
                 hour_box = st.selectbox("Hour of the day for which you want data: ", ["--"]+hours_in_selected_day, key='selected_hour')
                 if (hour_box == "--"):
@@ -113,6 +114,11 @@ def goes_main():
     if (download_option == "Search by filename"):
         #filename text box
         filename_entered = st.text_input("Enter the filename")
+        completions = query_metadata_database.get_filename_completions('GOES', filename_entered) if filename_entered else []
+        if completions and completions[0] != filename_entered.strip():  #offer the recorded files starting with the text typed so far
+            completion_box = st.selectbox("Matching files: ", ["--"]+completions, key="selected_completion")
+            if (completion_box != "--"):
+                filename_entered = completion_box
         #fetch URL while calling spinner element
         with st.spinner("Loading..."):
             final_url = generate_goes_url(filename_entered)     #call relevant function
@@ -178,19 +184,20 @@ def nexrad_main():
         if (year_box == "--"):
             st.warning("Please select an year!")
         else:
-            months_in_selected_year = query_metadata_database.get_months_in_year_nexrad(year_box)   #months in selected year 
+            year_tree = query_metadata_database.get_year_tree_nexrad(year_box)  #months, days and stations of the year in one lookup
+            months_in_selected_year = list(year_tree)   #months in selected year 
             #define day box
             month_box = st.selectbox("Month for which you are looking to get data for: ", ["--"]+months_in_selected_year, key="selected_month")
             if (month_box == "--"):
                 st.warning("Please select month!")
             else:
-                days_in_selected_month = query_metadata_database.get_days_in_month_nexrad(month_box, year_box)  #days in selected year
+                days_in_selected_month = list(year_tree[month_box])  #days in selected year
                 #define day box
                 day_box = st.selectbox("Day within year for which you want data: ", ["--"]+days_in_selected_month, key="selected_day")
                 if (day_box == "--"):
                     st.warning("Please select a day!")
                 else:
-                    ground_stations_in_selected_day = query_metadata_database.get_stations_for_day_nexrad(day_box, month_box, year_box)     #ground station in selected day     
+                    ground_stations_in_selected_day = year_tree[month_box][day_box]     #ground station in selected day     
                     #define ground station box
                     ground_station_box = st.selectbox("Station for which you want data: ", ["--"]+ground_stations_in_selected_day, key='selected_ground_station')
                     if (ground_station_box == "--"):
@@ -220,6 +227,11 @@ def nexrad_main():
     if download_option == "Search by filename":
         #filename text box
         filename_entered = st.text_input("Enter the filename")
+        completions = query_metadata_database.get_filename_completions('NEXRAD', filename_entered) if filename_entered else []
+        if completions and completions[0] != filename_entered.strip():  #offer the recorded files starting with the text typed so far
+            completion_box = st.selectbox("Matching files: ", ["--"]+completions, key="selected_completion")
+            if (completion_box != "--"):
+                filename_entered = completion_box
         #fetch URL while calling spinner element
         with st.spinner("Loading..."):
             final_url = generate_nexrad_url(filename_entered)     #call relevant function
@@ -270,7 +282,7 @@ def map_main():
     #plotting the coordinates extracted on a map
     hover_text = []
     for j in range(len(map_data)):      #building the text to display when hovering over each point on the plot
-        hover_text.append("Station: " + map_data['ground_station'][j] + " County:" + map_data['county'][j] + ", " + map_data['state'][j])
+        hover_text.append("Station: " + map_data['ground_station'][j] + " County: " + map_data['county'][j] + ", " + map_data['state'][j])
 
     #use plotly to plot
     map_fig = go.Figure(data=go.Scattergeo(
@@ -1,8 +1,36 @@
 import os
 import time
+import gzip
+import json
+import sqlite3
+import threading
 import boto3
+import pytest
+import pandas as pd
+from datetime import date
+from http.server import HTTPServer, BaseHTTPRequestHandler
 from dotenv import load_dotenv
 from url_from_filename import generate_goes_url, generate_nexrad_url
+from incremental_scrape import goes_scrape_start, nexrad_scrape_start, append_new_rows, newest_key_in_table, write_high_water_mark
+from crawl_checkpoint import read_checkpoint, clear_checkpoint
+from prefix_calendar import goes_hour_prefixes, probe_prefixes
+from s3_crawler import prefixes_from, iter_prefix_tree, crawl_prefix_tree, list_common_prefixes, list_objects_under
+from file_manifest import parse_goes_filename, parse_nexrad_filename, complete_filename, list_files_from_manifest, MANIFEST_DDL
+from inventory_ingest import ingest_inventory
+from http_cache import fetch_cached
+from scraper_mapdata import parse_homr_stations, select_stations
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError, ConnectionClosedError
+from s3_concurrency import ConcurrencyGovernor, governed
+from scrape_work_queue import seed_work_queue, connect_queue, lease_work, complete_work, queue_progress, merge_work_results, MAX_ATTEMPTS
+from scraper_archive import plan_archive_shards, partition_file_name, scrape_archive_shard, merge_archive_partitions, GOES_ARCHIVE_COLUMNS, NEXRAD_ARCHIVE_COLUMNS
+from scraper_main import merge_rows_into_table, load_scraped_data, write_rows_in_batches
+from metadata_parquet import write_parquet_snapshot, read_parquet_snapshot, snapshot_row_groups, refresh_parquet_snapshot, snapshot_generation
+from query_backend import get_backend, DuckDBBackend
+from station_locator import StationLocator
+from metadata_repository import get_repository, MetadataRepository
+from hierarchy_index import build_hierarchy_index, refresh_hierarchy_index, load_hierarchy_index, hierarchy_index_path
+from metadata_schema import connect_database, prepare_table, read_ddl_script, split_ddl, prepare_shadow_table, swap_in_shadow, read_generation
 
 #load env variables
 load_dotenv()
@@ -75,6 +103,40 @@ urlNEXRAD11 = "https://noaa-nexrad-level2.s3.amazonaws.com/2008/08/19/KCBW/KCBW2
 urlNEXRAD12 = "https://noaa-nexrad-level2.s3.amazonaws.com/1993/11/12/KLWX/KLWX19931112_005128.gz"
 urlNEXRAD13 = "https://noaa-nexrad-level2.s3.amazonaws.com/2003/07/17/KBOX/KBOX20030717_014732.gz"
 
+#S3 STAND-IN
+class FakeS3:
+
+    """Used to answer ListObjectsV2 calls from an in-memory list of object keys per bucket, in pages of at most
+    MaxKeys entries. Listings of the prefixes in delays are held back that many seconds, so they complete out of order.
+    """
+
+    def __init__(self, buckets, delays=None):
+        self.buckets = {bucket_name: sorted(keys) for bucket_name, keys in buckets.items()}
+        self.delays = delays or {}
+        self.calls = []     #(bucket, prefix, continuation token) of every call
+        self.lock = threading.Lock()
+
+    def list_objects_v2(self, Bucket, Prefix, MaxKeys=1000, Delimiter=None, ContinuationToken=None):
+        with self.lock:
+            self.calls.append((Bucket, Prefix, ContinuationToken))
+        time.sleep(self.delays.get(Prefix, 0))
+        entries = []
+        for key in self.buckets.get(Bucket, []):
+            if not key.startswith(Prefix):
+                continue
+            rest = key[len(Prefix):]
+            entry = ('prefix', Prefix + rest.split(Delimiter)[0] + Delimiter) if Delimiter and Delimiter in rest else ('key', key)
+            if not entries or entries[-1] != entry:
+                entries.append(entry)
+        start = int(ContinuationToken or 0)
+        page_entries = entries[start:start + MaxKeys]
+        page = {'KeyCount': len(page_entries), 'IsTruncated': start + MaxKeys < len(entries),
+                'CommonPrefixes': [{'Prefix': value} for kind, value in page_entries if kind == 'prefix'],
+                'Contents': [{'Key': value, 'Size': 1} for kind, value in page_entries if kind == 'key']}
+        if page['IsTruncated']:
+            page['NextContinuationToken'] = str(start + MaxKeys)
+        return page
+
 #TESTING FUNCTIONS
 def test_gen_goes_url():
     
@@ -132,4 +194,810 @@ def test_gen_nexrad_url():
                 'message' : "Ran tests for NEXRAD"
             }
         ]
-    )
\ No newline at end of file
+    )
+
+def test_crawl_prefix_tree_order():
+
+    """Function to test that the crawler gives the leaves of each depth in the order of a sequential walk, even when the listings complete out of order"""
+
+    keys = [year + '/' + month + '/' + day + '/KABX' + year + month + day for year in ('2022', '2023') for month in ('01', '02', '03') for day in ('01', '02')]
+    delays = {'2022/': 0.05, '2022/01/': 0.05, '2022/02/': 0.02}     #the first prefixes of each level come back last
+    fake_s3 = FakeS3({'noaa-nexrad-level2': keys}, delays)
+    assert crawl_prefix_tree(fake_s3, 'noaa-nexrad-level2', ['2022/', '2023/'], 0)[0] == ['2022/', '2023/']
+    assert crawl_prefix_tree(fake_s3, 'noaa-nexrad-level2', ['2022/', '2023/'], 1, max_workers=4)[0] == [
+        year + '/' + month + '/' for year in ('2022', '2023') for month in ('01', '02', '03')]
+
+    stats = {}
+    leaves = iter_prefix_tree(fake_s3, 'noaa-nexrad-level2', ['2022/', '2023/'], 2, max_workers=4, stats=stats)
+    assert next(leaves) == '2022/01/01/' and stats == {}    #streamed, the stats are filled once the generator is exhausted
+    assert ['2022/01/01/'] + list(leaves) == [key.rsplit('/', 1)[0] + '/' for key in keys]
+    assert stats['prefixes_listed'] == 2 + 6 and stats['leaf_prefixes'] == 12
+    assert stats['prefixes_per_second'] > 0 and abs(stats['prefixes_per_second'] - 8 / stats['elapsed_seconds']) < 1e-6
+    leaf_prefixes, stats = crawl_prefix_tree(fake_s3, 'noaa-nexrad-level2', ['2022/'], 2, max_workers=4, prefix_filter=prefixes_from(('2022', '02')))
+    assert leaf_prefixes == ['2022/02/01/', '2022/02/02/', '2022/03/01/', '2022/03/02/'] and stats['prefixes_listed'] == 1 + 2
+
+def test_listing_follows_continuation_tokens():
+
+    """Function to test that a level with more than 1000 children is paged through with the continuation token"""
+
+    keys = ['2023/01/01/K' + format(number, '04d') + '/scan' for number in range(2500)]
+    fake_s3 = FakeS3({'noaa-nexrad-level2': keys + ['2023/01/01/readme.txt']})
+    stations = list_common_prefixes(fake_s3, 'noaa-nexrad-level2', '2023/01/01/')
+    assert stations == [key.rsplit('/', 1)[0] + '/' for key in keys]
+    assert [token for _, _, token in fake_s3.calls] == [None, '1000', '2000']
+    assert len(list_objects_under(fake_s3, 'noaa-nexrad-level2', '2023/01/01/')) == 2501
+
+def test_write_rows_in_batches(tmp_path):
+
+    """Function to test that rows are written and committed batch by batch, so no more than a batch is pulled ahead of the committed rows"""
+
+    database_file_path = str(tmp_path / "batches.db")
+    db_conn = connect_database(database_file_path, 'write')
+    db_conn.execute("CREATE TABLE NEXRAD_METADATA (id INTEGER, year TEXT, month TEXT, day TEXT, ground_station TEXT)")
+    db_conn.commit()
+    reader = connect_database(database_file_path, 'read')
+    committed_counts = []   #rows committed when each row is pulled from the scrape
+
+    def scraped_rows():
+        for number in range(2500):
+            committed_counts.append(reader.execute("SELECT COUNT(*) FROM NEXRAD_METADATA").fetchone()[0])
+            yield {'id': number, 'year': '2023', 'month': '01', 'day': '01', 'ground_station': 'K' + format(number, '04d')}
+
+    assert write_rows_in_batches(scraped_rows(), db_conn, 'NEXRAD_METADATA', batch_size=1000, checkpoint_columns=['year', 'month', 'day', 'ground_station']) == 2500
+    assert sorted(set(committed_counts)) == [0, 1000, 2000]     #three batches
+    assert all(number - committed < 1000 for number, committed in enumerate(committed_counts))
+    assert read_checkpoint(db_conn, 'NEXRAD_METADATA')['last_key'] == ('2023', '01', '01', 'K2499')
+    reader.close()
+    db_conn.close()
+
+def test_incremental_scrape_start():
+
+    """Function to test the overlap window of incremental scrapes, including year boundaries"""
+
+    assert goes_scrape_start(('ABI-L1b-RadC', '2023', '041', '17'), 3) == ('ABI-L1b-RadC', '2023', '041', '14')
+    assert goes_scrape_start(('ABI-L1b-RadC', '2023', '001', '01'), 3) == ('ABI-L1b-RadC', '2022', '365', '22')
+    assert nexrad_scrape_start(('2023', '03', '01', 'KABX'), 1) == ('2023', '02', '28')
+    assert nexrad_scrape_start(('2023', '01', '01', 'KABX'), 2) == ('2022', '12', '30')
+
+    keep_prefix = prefixes_from(('2023', '02', '28'))
+    assert keep_prefix('2023/') and keep_prefix('2023/02/') and keep_prefix('2023/02/28/KABX/') and keep_prefix('2023/03/01/')
+    assert not keep_prefix('2022/') and not keep_prefix('2023/01/') and not keep_prefix('2023/02/27/KABX/')
+
+def test_probe_prefixes_window():
+
+    """Function to test that probes come back in candidate order and only a window of them is submitted ahead of the consumer"""
+
+    candidates = goes_hour_prefixes('ABI-L1b-RadC/', date(2023, 1, 1), date(2023, 1, 10))
+    fake_s3 = FakeS3({'noaa-goes18': [prefix + 'file.nc' for prefix in candidates[::3]]}, {candidates[3]: 0.05})
+    stats = {}
+    found = probe_prefixes(fake_s3, 'noaa-goes18', candidates, max_workers=2, stats=stats)
+    assert next(found) == candidates[0]
+    time.sleep(0.1)
+    assert len(fake_s3.calls) <= 2 * 2 + 1     #the window, not the 240 candidates
+    assert [candidates[0]] + list(found) == candidates[::3]
+    assert stats['prefixes_listed'] == 240 and stats['leaf_prefixes'] == 80
+
+def archive_s3():
+
+    """Function gives an S3 stand-in holding two GOES buckets and the NEXRAD bucket"""
+
+    goes_keys = [product + '/' + year + '/001/00/file.nc' for product in ('ABI-L1b-RadC', 'ABI-L2-ACMC', 'GLM-L2-LCFA') for year in ('2022', '2023')]
+    nexrad_keys = [year + '/01/01/KABX/KABX' + year + '0101_000000_V06' for year in ('1990', '2022', '2023', '2024')]
+    return FakeS3({'noaa-goes16': goes_keys, 'noaa-goes18': goes_keys[:2], 'noaa-nexrad-level2': nexrad_keys})
+
+def test_plan_archive_shards(tmp_path, monkeypatch):
+
+    """Function to test that the archive is planned into shards in a fixed order, and that resumed shards keep their partitions"""
+
+    fake_s3 = archive_s3()
+    shards = plan_archive_shards(fake_s3, {'noaa-goes18': 'GOES-18', 'noaa-goes16': 'GOES-16'}, 'noaa-nexrad-level2', first_year=1991, last_year=2023)
+    assert [(shard['dataset'], shard['bucket'], shard['satellite'], shard['root'], shard['depth']) for shard in shards] == [
+        ('GOES', 'noaa-goes16', 'GOES-16', 'ABI-L1b-RadC/2022/', 2), ('GOES', 'noaa-goes16', 'GOES-16', 'ABI-L1b-RadC/2023/', 2),
+        ('GOES', 'noaa-goes16', 'GOES-16', 'ABI-L2-ACMC/2022/', 2), ('GOES', 'noaa-goes16', 'GOES-16', 'ABI-L2-ACMC/2023/', 2),
+        ('GOES', 'noaa-goes18', 'GOES-18', 'ABI-L1b-RadC/2022/', 2), ('GOES', 'noaa-goes18', 'GOES-18', 'ABI-L1b-RadC/2023/', 2),
+        ('NEXRAD', 'noaa-nexrad-level2', 'NEXRAD', '2022/', 3), ('NEXRAD', 'noaa-nexrad-level2', 'NEXRAD', '2023/', 3)]
+    assert partition_file_name(shards[0]) == 'GOES__noaa-goes16__ABI-L1b-RadC__2022.db'
+    assert len({partition_file_name(shard) for shard in shards}) == len(shards)
+
+    monkeypatch.setattr('scraper_archive.s3_client', lambda max_workers=4: fake_s3)     #the shards list through the stand-in
+    partition_dir = str(tmp_path / "partitions")
+    os.makedirs(partition_dir)
+    partitions = [scrape_archive_shard(shard, partition_dir)[0] for shard in shards]
+    calls = len(fake_s3.calls)
+    resumed = [scrape_archive_shard(shard, partition_dir, resume=True) for shard in shards]
+    assert [partition_path for partition_path, _ in resumed] == partitions and len(fake_s3.calls) == calls
+    assert all(crawl_stats['prefixes_listed'] == 0 for _, crawl_stats in resumed)
+    os.replace(partitions[1], partitions[1] + '.partial')   #a shard interrupted before it finished is crawled again
+    assert scrape_archive_shard(shards[1], partition_dir, resume=True)[1]['prefixes_listed'] == 2
+    assert sorted(os.listdir(partition_dir)) == sorted(os.path.basename(partition_path) for partition_path in partitions)   #no .partial left
+
+    database_file_paths = [str(tmp_path / "first.db"), str(tmp_path / "second.db")]
+    for database_file_path in database_file_paths:
+        assert merge_archive_partitions(partitions[:6], database_file_path, 'GOES_METADATA', GOES_ARCHIVE_COLUMNS) == 6
+        assert merge_archive_partitions(partitions[6:], database_file_path, 'NEXRAD_METADATA', NEXRAD_ARCHIVE_COLUMNS) == 2
+    merged = []
+    for database_file_path in database_file_paths:
+        db_conn = sqlite3.connect(database_file_path)
+        merged.append(db_conn.execute("SELECT id, bucket, product, year FROM GOES_METADATA ORDER BY id").fetchall())
+        db_conn.close()
+    assert merged[0] == merged[1] and [row[0] for row in merged[0]] == list(range(1, 7))   #same ids on every merge, in shard order
+    assert merged[0][0] == (1, 'noaa-goes16', 'ABI-L1b-RadC', 2022) and merged[0][-1] == (6, 'noaa-goes18', 'ABI-L1b-RadC', 2023)
+
+def test_parse_manifest_filenames():
+
+    """Function to test the file name fields recorded into the file manifest"""
+
+    goes_fields = parse_goes_filename(fileGOES1)
+    assert goes_fields['product_code'] == "ABI-L1b-RadC-M6C01"
+    assert goes_fields['scan_start'] == "2023-01-02T01:01:17"
+    assert goes_fields['scan_end'] == "2023-01-02T01:03:54"
+    assert goes_fields['version'] == "G18"
+
+    nexrad_fields = parse_nexrad_filename(fileNEXRAD1)
+    assert nexrad_fields['station'] == "KBGM"
+    assert nexrad_fields['scan_start'] == "2011-10-10T00:03:01"
+    assert nexrad_fields['version'] == "V03"
+    assert parse_nexrad_filename(fileNEXRAD5)['version'] is None
+    assert parse_goes_filename(fileNEXRAD1)['scan_start'] is None
+
+def test_ingest_inventory(tmp_path):
+
+    """Function to test loading a synthetic local S3 Inventory report into the metadata and file tables"""
+
+    os.makedirs(tmp_path / "data")
+    keys = [["2023/01/01/KABX/KABX20230101_000301_V06", "2023/01/01/KABX/KABX20230101_000812_V06"],
+            ["2022/12/31/KBGM/KBGM20221231_235901_V06", "2023/01/01/KABX/", "index.html"]]
+    for number, file_keys in enumerate(keys):
+        with gzip.open(tmp_path / "data" / ("part" + str(number) + ".csv.gz"), "wt") as data_file:
+            for key in file_keys:
+                data_file.write('"noaa-nexrad-level2","' + key + '","1024","2023-01-01T00:10:00.000Z","abc"\n')
+    manifest = {"sourceBucket": "noaa-nexrad-level2", "fileFormat": "CSV", "fileSchema": "Bucket, Key, Size, LastModifiedDate, ETag",
+                "files": [{"key": "inventory/data/part" + str(number) + ".csv.gz"} for number in range(len(keys))]}
+    with open(tmp_path / "manifest.json", "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    database_file_path = str(tmp_path / "inventory.db")
+    summary = ingest_inventory(str(tmp_path), database_file_path, processes=2)
+    assert summary == {'dataset': 'NEXRAD', 'folders': 2, 'files': 3}
+    db_conn = sqlite3.connect(database_file_path)
+    assert db_conn.execute("SELECT id, year, month, day, ground_station FROM NEXRAD_METADATA ORDER BY id").fetchall() == [
+        (1, 2022, 12, 31, 'KBGM'), (2, 2023, 1, 1, 'KABX')]
+    assert db_conn.execute("SELECT station, scan_start, size FROM FILES WHERE filename = 'KABX20230101_000812_V06'").fetchone() == (
+        'KABX', '2023-01-01T00:08:12', 1024)
+    db_conn.close()
+
+def test_fetch_cached(tmp_path):
+
+    """Function to test the on-disk HTTP cache revalidating against a local server with ETags"""
+
+    served = {'body': b"KABX NEXRAD", 'etag': '"v1"', 'full_responses': 0}
+
+    class StationsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get('If-None-Match') == served['etag']:
+                self.send_response(304)
+                self.end_headers()
+                return
+            served['full_responses'] += 1
+            self.send_response(200)
+            self.send_header('ETag', served['etag'])
+            self.send_header('Content-Length', str(len(served['body'])))
+            self.end_headers()
+            self.wfile.write(served['body'])
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), StationsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:" + str(server.server_port) + "/nexrad-stations.txt"
+    try:
+        body, first_hash = fetch_cached(url, str(tmp_path), timeout=5)
+        assert body == "KABX NEXRAD" and served['full_responses'] == 1
+        body, second_hash = fetch_cached(url, str(tmp_path), timeout=5)
+        assert body == "KABX NEXRAD" and second_hash == first_hash and served['full_responses'] == 1   #answered from the cache
+        served['body'], served['etag'] = b"KABX KBGM NEXRAD", '"v2"'
+        body, third_hash = fetch_cached(url, str(tmp_path), timeout=5)
+        assert body == "KABX KBGM NEXRAD" and third_hash != first_hash and served['full_responses'] == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_parse_homr_stations():
+
+    """Function to test the fixed-width parser of nexrad-stations.txt, including lines with empty fields"""
+
+    widths = [8, 4, 5, 30, 20, 2, 30, 9, 10, 6, 5, 50]
+    lines = [["NCDCID", "ICAO", "WBAN", "NAME", "COUNTRY", "ST", "COUNTY", "LAT", "LON", "ELEV", "UTC", "STNTYPE"],
+             ["-" * width for width in widths],
+             ["30001795", "KABR", "14929", "ABERDEEN", "UNITED STATES", "SD", "BROWN", "45.45583", "-98.41306", "1383", "-6", "NEXRAD"],
+             ["30001800", "TADW", "", "ANDREWS AFB", "UNITED STATES", "MD", "PRINCE GEORGES", "38.695", "-76.845", "345", "-5", "TDWR"],
+             ["30001901", "RKSG", "", "CAMP HUMPHREYS", "KOREA, REPUBLIC OF", "", "", "36.95583", "127.02111", "52", "+9", "NEXRAD"]]
+    text = "\n".join(" ".join(field.ljust(width) for field, width in zip(line, widths)).rstrip() for line in lines) + "\n"
+
+    stations = parse_homr_stations(text)
+    assert stations['ground_station'].tolist() == ["KABR", "TADW", "RKSG"]
+    assert stations.loc[1, 'county'] == "PRINCE GEORGES" and stations.loc[2, 'state'] == ""
+    assert stations.loc[0, 'latitude'] == 45.45583 and stations.loc[2, 'longitude'] == 127.02111 and stations.loc[0, 'elevation'] == 1383
+    assert select_stations(stations)['ground_station'].tolist() == ["KABR"]
+    assert select_stations(stations, None, ('NEXRAD', 'TDWR'))['ground_station'].tolist() == ["KABR", "TADW", "RKSG"]
+
+def test_work_queue_leases(tmp_path):
+
+    """Function to test that a prefix leased by a crashed worker is handed out again once its lease expires"""
+
+    queue_file_path = str(tmp_path / "queue.db")
+    shards = [{'dataset': 'NEXRAD', 'bucket': 'noaa-nexrad-level2', 'satellite': 'NEXRAD', 'root': year + '/', 'depth': 3} for year in ('2022', '2023')]
+    assert seed_work_queue(queue_file_path, shards) == 2
+    assert seed_work_queue(queue_file_path, shards) == 0
+
+    db_conn = connect_queue(queue_file_path)
+    crashed_item = lease_work(db_conn, 'crashed-worker', lease_seconds=0.2)
+    live_item = lease_work(db_conn, 'live-worker')
+    assert (crashed_item['root'], live_item['root']) == ('2022/', '2023/')
+    assert lease_work(db_conn, 'live-worker') is None   #both leases still valid
+
+    time.sleep(0.3)
+    retried_item = lease_work(db_conn, 'live-worker')
+    assert retried_item['id'] == crashed_item['id']
+    assert not complete_work(db_conn, crashed_item['id'], 'crashed-worker', [])    #lease was taken over
+    assert complete_work(db_conn, retried_item['id'], 'live-worker', [('noaa-nexrad-level2', 'NEXRAD', '2022', '01', '01', 'KABX')])
+    assert queue_progress(queue_file_path) == {'pending': 0, 'leased': 1, 'done': 1, 'failed': 0}
+    db_conn.close()
+
+def test_concurrency_governor_backs_off():
+
+    """Function to test that the concurrency governor cuts its limit when a local S3 stand-in throttles and still
+    completes every request"""
+
+    class ThrottlingS3:     #answers at most 4 requests at a time, anything above gets a SlowDown
+        def __init__(self):
+            self.in_flight, self.lock = 0, threading.Lock()
+        def list_objects_v2(self, **kwargs):
+            with self.lock:
+                self.in_flight += 1
+                throttled = self.in_flight > 4
+            try:
+                if throttled:
+                    raise ClientError({'Error': {'Code': 'SlowDown'}, 'ResponseMetadata': {'HTTPStatusCode': 503}}, 'ListObjectsV2')
+                time.sleep(0.005)
+                return {'KeyCount': 1, 'Prefix': kwargs['Prefix']}
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+    governor = ConcurrencyGovernor(initial_limit=16)
+    s3client = governed(ThrottlingS3(), governor)
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        pages = list(executor.map(lambda number: s3client.list_objects_v2(Bucket='bucket', Prefix=str(number) + '/'), range(300)))
+    assert [page['Prefix'] for page in pages] == [str(number) + '/' for number in range(300)]
+    assert len(governor.throttle_events) > 0 and governor.throttle_events[0][2] == 'SlowDown'
+    assert governor.current_limit < 16 and governor.stats()['in_flight'] == 0
+
+def test_governor_retries_transient_errors():
+
+    """Function to test that server errors and dropped connections are retried without cutting the limit, and client errors are not"""
+
+    class FlakyS3:     #fails the first two calls of every prefix with a transient error
+        def __init__(self):
+            self.calls = {}
+        def list_objects_v2(self, **kwargs):
+            self.calls[kwargs['Prefix']] = self.calls.get(kwargs['Prefix'], 0) + 1
+            if kwargs['Prefix'] == 'missing/':
+                raise ClientError({'Error': {'Code': 'NoSuchBucket'}, 'ResponseMetadata': {'HTTPStatusCode': 404}}, 'ListObjectsV2')
+            if self.calls[kwargs['Prefix']] == 1:
+                raise ClientError({'Error': {'Code': 'InternalError'}, 'ResponseMetadata': {'HTTPStatusCode': 500}}, 'ListObjectsV2')
+            if self.calls[kwargs['Prefix']] == 2:
+                raise ConnectionClosedError(endpoint_url='https://bucket.s3.amazonaws.com')
+            return {'KeyCount': 1, 'Prefix': kwargs['Prefix']}
+
+    governor = ConcurrencyGovernor(initial_limit=16)
+    flaky = FlakyS3()
+    s3client = governed(flaky, governor)
+    assert s3client.list_objects_v2(Bucket='bucket', Prefix='2023/')['Prefix'] == '2023/'
+    assert flaky.calls['2023/'] == 3 and governor.throttle_events == [] and governor.current_limit == 16
+    try:
+        s3client.list_objects_v2(Bucket='bucket', Prefix='missing/')
+        assert False, "a client error must not be retried"
+    except ClientError:
+        assert flaky.calls['missing/'] == 1
+
+def test_append_rows_checkpoint(tmp_path):
+
+    """Function to test that appended batches are committed with a checkpoint of the last folder processed"""
+
+    db_conn = sqlite3.connect(str(tmp_path / "checkpoint.db"))
+    db_conn.execute("CREATE TABLE NEXRAD_METADATA (id INTEGER, year TEXT, month TEXT, day TEXT, ground_station TEXT)")
+    db_conn.execute("INSERT INTO NEXRAD_METADATA VALUES (1, '2023', '01', '01', 'KABX')")
+    rows = [{'id': 0, 'year': '2023', 'month': '01', 'day': '01', 'ground_station': station} for station in ('KABX', 'KBGM', 'KLWX')]
+    checkpoint = {'rows_written': 5, 'started_at': '2023-01-02T00:00:00+00:00'}
+    keys = ['year', 'month', 'day', 'ground_station']
+    assert append_new_rows(rows, db_conn, 'NEXRAD_METADATA', keys, ('2023', '01', '01'), 2, checkpoint) == (2, ('2023', '01', '01', 'KLWX'))
+    assert read_checkpoint(db_conn, 'NEXRAD_METADATA') == {'last_key': ('2023', '01', '01', 'KLWX'), 'rows_written': 7, 'started_at': '2023-01-02T00:00:00+00:00'}
+    assert db_conn.execute("SELECT id, ground_station FROM NEXRAD_METADATA ORDER BY id").fetchall() == [(1, 'KABX'), (2, 'KBGM'), (3, 'KLWX')]
+    clear_checkpoint(db_conn, 'NEXRAD_METADATA')
+    assert read_checkpoint(db_conn, 'NEXRAD_METADATA') is None
+    db_conn.close()
+
+def test_append_rows_into_normalized_view(tmp_path):
+
+    """Function to test that an incremental scrape appends its new folders through the triggers of the normalized GOES view"""
+
+    db_conn = connect_database(str(tmp_path / "incremental.db"), 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_goes18.sql'), 'GOES_METADATA')
+    keys = ['product', 'year', 'day', 'hour']
+    merge_rows_into_table([{'id': 0, 'product': 'ABI-L1b-RadC', 'year': '2023', 'day': '001', 'hour': '00'}], db_conn, 'GOES_METADATA', keys)
+    rows = [{'id': 0, 'product': 'ABI-L1b-RadC', 'year': '2023', 'day': '001', 'hour': hour} for hour in ('00', '01', '02')]
+    assert append_new_rows(rows, db_conn, 'GOES_METADATA', keys, ('ABI-L1b-RadC', '2023', '001'), 2) == (2, ('ABI-L1b-RadC', '2023', '001', '02'))
+    assert db_conn.execute("SELECT id, year, day, hour, bucket FROM GOES_METADATA ORDER BY id").fetchall() == [
+        (1, 2023, 1, 0, 'noaa-goes18'), (2, 2023, 1, 1, 'noaa-goes18'), (3, 2023, 1, 2, 'noaa-goes18')]
+    assert db_conn.execute("SELECT COUNT(*) FROM GOES_PRODUCT").fetchone()[0] == 1
+    db_conn.close()
+
+def test_merge_rows_into_table(tmp_path):
+
+    """Function to test that a merge keeps the stored rows, inserts the new folders and deletes the missing ones"""
+
+    db_conn = sqlite3.connect(str(tmp_path / "merge.db"))
+    db_conn.execute("CREATE TABLE GOES_METADATA (id INTEGER, product TEXT, year TEXT, day TEXT, hour TEXT)")
+    db_conn.executemany("INSERT INTO GOES_METADATA VALUES (?, 'ABI-L1b-RadC', '2023', '001', ?)", [(1, '00'), (2, '01'), (3, '02')])
+    db_conn.commit()
+    rows = [{'id': 0, 'product': 'ABI-L1b-RadC', 'year': '2023', 'day': '001', 'hour': hour} for hour in ('01', '02', '02', '03')]
+    keys = ['product', 'year', 'day', 'hour']
+    assert merge_rows_into_table(rows, db_conn, 'GOES_METADATA', keys, delete_missing=True) == {'inserted': 1, 'unchanged': 2, 'deleted': 1}
+    assert db_conn.execute("SELECT id, hour FROM GOES_METADATA ORDER BY id").fetchall() == [(2, '01'), (3, '02'), (4, '03')]
+    assert merge_rows_into_table(rows, db_conn, 'GOES_METADATA', keys) == {'inserted': 0, 'unchanged': 3, 'deleted': 0}
+    db_conn.close()
+
+def test_prepare_typed_table(tmp_path):
+
+    """Function to test that an all-text table is rebuilt with the declared schema and keys still read back zero padded"""
+
+    db_conn = connect_database(str(tmp_path / "typed.db"), 'write')
+    assert db_conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    db_conn.execute("CREATE TABLE GOES_METADATA (id INTEGER, product TEXT, year TEXT, day TEXT, hour TEXT)")
+    db_conn.executemany("INSERT INTO GOES_METADATA VALUES (?, 'ABI-L1b-RadC', '2023', ?, ?)", [(1, '009', '23'), (2, '041', '07')])
+    db_conn.commit()
+    sql_script = read_ddl_script('sql_script_goes18.sql')
+    prepare_table(db_conn, sql_script, 'GOES_METADATA')
+    assert db_conn.execute("SELECT year, day, hour FROM GOES_METADATA ORDER BY id").fetchall() == [(2023, 9, 23), (2023, 41, 7)]
+    assert newest_key_in_table(db_conn, 'GOES_METADATA', ['product', 'year', 'day', 'hour']) == ('ABI-L1b-RadC', '2023', '041', '07')
+    plan = db_conn.execute("EXPLAIN QUERY PLAN SELECT DISTINCT hour FROM GOES_METADATA WHERE day = '041' AND year = '2023' AND product = 'ABI-L1b-RadC'").fetchall()
+    assert any('GOES_FOLDER USING PRIMARY KEY' in step[3] for step in plan)
+    db_conn.close()
+
+def test_swap_in_shadow(tmp_path):
+
+    """Function to test that a shadow table is swapped in atomically while a reader keeps its snapshot of the old one"""
+
+    database_file_path = str(tmp_path / "swap.db")
+    db_conn = connect_database(database_file_path, 'write')
+    table_statements, index_statements = split_ddl(read_ddl_script('sql_script_nexrad.sql'))
+    for rows in ([(1, 2023, 1, 1, 'KABX')], [(1, 2023, 1, 1, 'KBGM'), (2, 2023, 1, 2, 'KLWX')]):
+        shadow_name = prepare_shadow_table(db_conn, table_statements, 'NEXRAD_METADATA')
+        db_conn.executemany("INSERT INTO " + shadow_name + " (id, year, month, day, ground_station) VALUES (?, ?, ?, ?, ?)", rows)
+        db_conn.commit()
+        if len(rows) == 1:
+            assert swap_in_shadow(db_conn, 'NEXRAD_METADATA', table_statements, index_statements) == 1
+            reader = connect_database(database_file_path, 'read')
+            reader.execute("BEGIN")     #hold a read snapshot of the first generation across the second swap
+            assert reader.execute("SELECT ground_station FROM NEXRAD_METADATA").fetchall() == [('KABX',)]
+    assert swap_in_shadow(db_conn, 'NEXRAD_METADATA', table_statements, index_statements) == 2
+    assert reader.execute("SELECT ground_station FROM NEXRAD_METADATA").fetchall() == [('KABX',)]
+    reader.execute("COMMIT")
+    assert reader.execute("SELECT ground_station FROM NEXRAD_METADATA ORDER BY id").fetchall() == [('KBGM',), ('KLWX',)]
+    assert read_generation(reader, 'NEXRAD_METADATA') == 2 and read_generation(reader, 'GOES_METADATA') == 0
+    assert db_conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%SHADOW%'").fetchall() == []
+    reader.close()
+    db_conn.close()
+
+def test_normalized_metadata_views(tmp_path):
+
+    """Function to test that the metadata views store each station once and merge through their triggers"""
+
+    db_conn = connect_database(str(tmp_path / "normalized.db"), 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA')
+    rows = [{'id': 0, 'year': '2023', 'month': '01', 'day': day, 'ground_station': station} for day in ('01', '02') for station in ('KABX', 'KBGM')]
+    merge_rows_into_table(rows, db_conn, 'NEXRAD_METADATA', ['year', 'month', 'day', 'ground_station'])
+    assert db_conn.execute("SELECT COUNT(*) FROM NEXRAD_STATION").fetchone()[0] == 2
+    assert db_conn.execute("SELECT COUNT(*) FROM NEXRAD_FOLDER").fetchone()[0] == 4
+    assert merge_rows_into_table(rows[1:], db_conn, 'NEXRAD_METADATA', ['year', 'month', 'day', 'ground_station'], delete_missing=True) == {'inserted': 0, 'unchanged': 3, 'deleted': 1}
+    assert db_conn.execute("SELECT id, year, month, day, ground_station FROM NEXRAD_METADATA ORDER BY id").fetchall() == [(2, 2023, 1, 1, 'KBGM'), (3, 2023, 1, 2, 'KABX'), (4, 2023, 1, 2, 'KBGM')]
+    db_conn.close()
+
+def test_parquet_snapshot_pushdown(tmp_path):
+
+    """Function to test that the Parquet snapshot is partitioned by year and filtered reads skip row groups"""
+
+    database_file_path = str(tmp_path / "snapshot.db")
+    db_conn = connect_database(database_file_path, 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA')
+    rows = [{'id': 0, 'year': year, 'month': month, 'day': 1, 'ground_station': station}
+            for year in (2022, 2023) for month in range(1, 13) for station in ('KABX', 'KBGM', 'KLWX', 'TJUA')]
+    merge_rows_into_table(rows, db_conn, 'NEXRAD_METADATA', ['year', 'month', 'day', 'ground_station'])
+    db_conn.close()
+    assert write_parquet_snapshot(database_file_path, 'NEXRAD_METADATA', str(tmp_path / "parquet"), rows_per_group=8) == 96
+    assert sorted(os.listdir(tmp_path / "parquet" / "dataset=NEXRAD_METADATA")) == ['year=2022', 'year=2023']
+    filters = [('year', '=', 2023), ('month', '>=', 11)]
+    assert snapshot_row_groups('NEXRAD_METADATA', filters, str(tmp_path / "parquet")) == {'files': 1, 'row_groups': 1, 'total_row_groups': 12}
+    df = read_parquet_snapshot('NEXRAD_METADATA', filters, ['month', 'ground_station'], str(tmp_path / "parquet"))
+    assert len(df) == 8 and set(df['month']) == {11, 12}
+
+def test_parquet_snapshot_refreshed_on_change(tmp_path):
+
+    """Function to test that the Parquet snapshot is only written again, and the generation only bumped, when the table changed since the snapshot"""
+
+    database_file_path = str(tmp_path / "refresh.db")
+    parquet_directory = str(tmp_path / "parquet")
+    db_conn = connect_database(database_file_path, 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA')
+    keys = ['year', 'month', 'day', 'ground_station']
+    merge_rows_into_table([{'id': 0, 'year': '2023', 'month': '01', 'day': '01', 'ground_station': 'KABX'}], db_conn, 'NEXRAD_METADATA', keys)
+    assert read_generation(db_conn, 'NEXRAD_METADATA') == 1
+    assert refresh_parquet_snapshot(database_file_path, 'NEXRAD_METADATA', parquet_directory) == 1
+    assert read_generation(db_conn, 'NEXRAD_METADATA') == 2 and snapshot_generation('NEXRAD_METADATA', parquet_directory) == 2
+    assert refresh_parquet_snapshot(database_file_path, 'NEXRAD_METADATA', parquet_directory) is None     #unchanged table, nothing to invalidate
+    assert read_generation(db_conn, 'NEXRAD_METADATA') == 2
+    merge_rows_into_table([{'id': 0, 'year': '2023', 'month': '01', 'day': '02', 'ground_station': 'KABX'}], db_conn, 'NEXRAD_METADATA', keys)
+    assert refresh_parquet_snapshot(database_file_path, 'NEXRAD_METADATA', parquet_directory) == 2
+    assert read_generation(db_conn, 'NEXRAD_METADATA') == 4 and snapshot_generation('NEXRAD_METADATA', parquet_directory) == 4
+    assert refresh_parquet_snapshot(database_file_path, 'MAPDATA_NEXRAD', parquet_directory) == 0
+    db_conn.close()
+
+def test_duckdb_parquet_backend(tmp_path):
+
+    """Function to test that DuckDB over the Parquet snapshot answers the app's queries like SQLite does"""
+
+    database_file_path = str(tmp_path / "backend.db")
+    db_conn = connect_database(database_file_path, 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_goes18.sql'), 'GOES_METADATA')
+    rows = [{'id': 0, 'product': product, 'year': 2023, 'day': day, 'hour': hour} for product in ('ABI-L2-CMIPF', 'ABI-L1b-RadC') for day in (41, 9) for hour in (7, 23)]
+    merge_rows_into_table(rows, db_conn, 'GOES_METADATA', ['product', 'year', 'day', 'hour'])
+    db_conn.close()
+    write_parquet_snapshot(database_file_path, 'GOES_METADATA', str(tmp_path / "parquet"))
+    duckdb_backend = DuckDBBackend(database_file_path, str(tmp_path / "parquet"))
+    assert get_backend(database_file_path, 'sqlite') is get_backend(database_file_path, 'sqlite')
+    for query in ("SELECT DISTINCT product FROM GOES_METADATA ORDER BY product",
+                  "SELECT DISTINCT printf('%03d', day) AS day FROM GOES_METADATA WHERE year = '2023'AND product = 'ABI-L1b-RadC' ORDER BY 1"):
+        assert duckdb_backend.read_query(query).values.tolist() == get_backend(database_file_path, 'sqlite').read_query(query).values.tolist()
+    assert duckdb_backend.read_query("SELECT COUNT(*) AS folders FROM GOES_METADATA WHERE hour = ?", (23,))['folders'][0] == 4
+
+def test_duckdb_sqlite_source(tmp_path):
+
+    """Function to test that DuckDB reading the SQLite file itself answers the app's queries like SQLite does"""
+
+    database_file_path = str(tmp_path / "attached.db")
+    db_conn = connect_database(database_file_path, 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA')
+    rows = [{'id': 0, 'year': 2023, 'month': month, 'day': 1, 'ground_station': station} for month in (1, 11) for station in ('KBGM', 'KABX')]
+    merge_rows_into_table(rows, db_conn, 'NEXRAD_METADATA', ['year', 'month', 'day', 'ground_station'])
+    db_conn.close()
+    try:
+        get_backend(database_file_path, 'duckdb', 'csv')
+        assert False, "an unknown DuckDB source was accepted"
+    except ValueError:
+        pass
+    try:
+        duckdb_backend = DuckDBBackend(database_file_path, source='sqlite')
+    except RuntimeError as error:
+        assert 'sqlite extension' in str(error)
+        pytest.skip("DuckDB's sqlite extension cannot be loaded here")
+    query = "SELECT DISTINCT ground_station FROM NEXRAD_METADATA WHERE year = ? AND month = ? ORDER BY 1"
+    assert duckdb_backend.read_rows(query, (2023, 11)) == get_backend(database_file_path, 'sqlite').read_rows(query, (2023, 11)) == [('KABX',), ('KBGM',)]
+
+def test_hierarchy_index(tmp_path):
+
+    """Function to test that the memory-mapped hierarchy index answers the NEXRAD cascade and is rebuilt on a new generation"""
+
+    database_file_path = str(tmp_path / "hierarchy.db")
+    db_conn = connect_database(database_file_path, 'write')
+    sql_script = read_ddl_script('sql_script_nexrad.sql')
+    rows = [{'id': 0, 'year': '2023', 'month': month, 'day': day, 'ground_station': station}
+            for month in ('01', '02') for day in ('01', '10') for station in ('KBGM', 'KABX')]
+    load_scraped_data(rows, db_conn, sql_script, 'NEXRAD_METADATA', 100, None, 'merge', ['year', 'month', 'day', 'ground_station'], False)
+    db_conn.commit()
+    assert build_hierarchy_index(database_file_path) == {'NEXRAD_METADATA': 1}
+    index = load_hierarchy_index(hierarchy_index_path(database_file_path))
+    assert index.children('NEXRAD_METADATA', ()) == ['2023']
+    assert index.children('NEXRAD_METADATA', ('2023', '02')) == ['01', '10']
+    assert index.children('NEXRAD_METADATA', ('2023', '02', '10')) == ['KABX', 'KBGM']
+    assert index.children('NEXRAD_METADATA', ('2023', '03')) == [] and index.children('NEXRAD_METADATA', ('1999',)) == []
+    assert refresh_hierarchy_index(database_file_path) is False
+    load_scraped_data([{'id': 0, 'year': '2023', 'month': '03', 'day': '01', 'ground_station': 'TJUA'}], db_conn, sql_script, 'NEXRAD_METADATA', 100, None,
+                      'merge', ['year', 'month', 'day', 'ground_station'], False)
+    db_conn.commit()
+    db_conn.close()
+    assert refresh_hierarchy_index(database_file_path) is True
+    assert load_hierarchy_index(hierarchy_index_path(database_file_path)).children('NEXRAD_METADATA', ('2023',)) == ['01', '02', '03']
+
+def test_merge_single_year(tmp_path):
+
+    """Function to test that a year is rebuilt by a merge limited to its key prefix, leaving the other years untouched"""
+
+    db_conn = connect_database(str(tmp_path / "years.db"), 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA')
+    key_columns = ['year', 'month', 'day', 'ground_station']
+    rows = [{'id': 0, 'year': year, 'month': '01', 'day': day, 'ground_station': 'KABX'} for year in ('2022', '2023') for day in ('01', '02')]
+    merge_rows_into_table(rows, db_conn, 'NEXRAD_METADATA', key_columns)
+    rebuilt = [{'id': 0, 'year': '2023', 'month': '01', 'day': day, 'ground_station': 'KABX'} for day in ('02', '03')]
+    assert merge_rows_into_table(rebuilt, db_conn, 'NEXRAD_METADATA', key_columns, delete_missing=True, key_prefix=('2023',)) == {'inserted': 1, 'unchanged': 1, 'deleted': 1}
+    assert db_conn.execute("SELECT id, year, day FROM NEXRAD_METADATA ORDER BY id").fetchall() == [(1, 2022, 1), (2, 2022, 2), (4, 2023, 2), (5, 2023, 3)]
+    plan = db_conn.execute("EXPLAIN QUERY PLAN SELECT DISTINCT day FROM NEXRAD_METADATA WHERE month = '01' AND year = '2023'").fetchall()
+    assert any('NEXRAD_FOLDER USING PRIMARY KEY (year=? AND month=?)' in step[3] for step in plan)
+    db_conn.close()
+
+def test_metadata_repository_pool(tmp_path):
+
+    """Function to test that the repository answers the cascade with bound parameters over pooled read-only connections"""
+
+    database_file_path = str(tmp_path / "repository.db")
+    db_conn = connect_database(database_file_path, 'write')
+    rows = [{'id': 0, 'year': '2023', 'month': month, 'day': '01', 'ground_station': station} for month in ('01', '02') for station in ('KBGM', "K'AB")]
+    load_scraped_data(rows, db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA', 100, None, 'merge', ['year', 'month', 'day', 'ground_station'], False)
+    db_conn.commit()
+    db_conn.close()
+    repository = get_repository(database_file_path)
+    assert repository is get_repository(database_file_path)
+    assert repository.nexrad_years() == ['2023'] and repository.nexrad_months('2023') == ['01', '02']
+    assert repository.nexrad_stations('2023', '02', '01') == ["K'AB", 'KBGM']    #quotes in a value are bound, not spliced into the SQL
+    backend = get_backend(database_file_path, 'sqlite')
+    with backend.connection() as pooled:
+        try:
+            pooled.execute("DELETE FROM NEXRAD_FOLDER")
+            assert False
+        except sqlite3.OperationalError as error:
+            assert 'readonly' in str(error)
+    with backend.connection() as reused:
+        assert reused is pooled
+    assert backend.read_rows("SELECT COUNT(*) FROM NEXRAD_METADATA WHERE year = ?", ('2023',)) == [(4,)]
+
+def test_generation_cache(tmp_path):
+
+    """Function to test that cached lookups are reused, evicted past the size cap and dropped when a scrape bumps the generation"""
+
+    database_file_path = str(tmp_path / "cache.db")
+    db_conn = connect_database(database_file_path, 'write')
+    sql_script = read_ddl_script('sql_script_nexrad.sql')
+    key_columns = ['year', 'month', 'day', 'ground_station']
+    rows = [{'id': 0, 'year': '2023', 'month': month, 'day': '01', 'ground_station': 'KABX'} for month in ('01', '02', '03')]
+    load_scraped_data(rows, db_conn, sql_script, 'NEXRAD_METADATA', 100, None, 'merge', key_columns, False)
+    db_conn.commit()
+    repository = MetadataRepository(database_file_path, max_entries=2, check_seconds=0)
+    assert repository.nexrad_months('2023') == ['01', '02', '03'] and repository.nexrad_months('2023') == ['01', '02', '03']
+    for month in ('01', '02'):
+        repository.nexrad_days('2023', month)
+    assert repository.cache_stats() == {'hits': 1, 'misses': 3, 'evictions': 1, 'invalidations': 0, 'entries': 2}
+    load_scraped_data([{'id': 0, 'year': '2023', 'month': '04', 'day': '01', 'ground_station': 'KABX'}], db_conn, sql_script, 'NEXRAD_METADATA', 100, None,
+                      'merge', key_columns, False)
+    db_conn.commit()
+    db_conn.close()
+    assert repository.nexrad_months('2023') == ['01', '02', '03', '04']
+    assert repository.cache_stats()['invalidations'] == 2
+
+def test_subtree_in_one_lookup(tmp_path):
+
+    """Function to test that the subtree of a NEXRAD year is the same from one query and from the hierarchy index"""
+
+    database_file_path = str(tmp_path / "subtree.db")
+    db_conn = connect_database(database_file_path, 'write')
+    rows = [{'id': 0, 'year': year, 'month': month, 'day': day, 'ground_station': station}
+            for year in ('2022', '2023') for month in ('01', '11') for day in ('02', '30') for station in ('KBGM', 'KABX')]
+    load_scraped_data(rows, db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA', 100, None, 'merge', ['year', 'month', 'day', 'ground_station'], False)
+    db_conn.commit()
+    db_conn.close()
+    expected = {month: {day: ['KABX', 'KBGM'] for day in ('02', '30')} for month in ('01', '11')}
+    repository = MetadataRepository(database_file_path, check_seconds=0)
+    assert repository.read_subtree('NEXRAD_METADATA', ('2023',)) == expected
+    assert repository.read_subtree('NEXRAD_METADATA', ('2023', '11', '30')) == ['KABX', 'KBGM']
+    build_hierarchy_index(database_file_path)
+    assert repository.read_subtree('NEXRAD_METADATA', ('2023',)) == expected
+    assert list(repository.subtree('NEXRAD_METADATA', ('2022',))) == ['01', '11']
+
+def test_complete_filename(tmp_path):
+
+    """Function to test that typed file names are completed from a range of the manifest's filename index"""
+
+    db_conn = connect_database(str(tmp_path / "manifest.db"), 'write')
+    assert complete_filename(db_conn, 'NEXRAD', 'KBGM') == []   #no manifest yet
+    db_conn.executescript(MANIFEST_DDL)
+    names = ['KBGM20111010_000301_V03.gz', 'KBGM20111010_000802_V03.gz', 'KBGX20111010_000301_V03.gz', 'KBGN20111010_000301_V03.gz']
+    db_conn.executemany("INSERT INTO FILES (dataset, bucket, prefix, filename) VALUES ('NEXRAD', 'noaa-nexrad-level2', '2011/10/10/' || substr(?, 1, 4) || '/', ?)",
+                        [(name, name) for name in names])
+    assert complete_filename(db_conn, 'NEXRAD', ' KBGM2011 ') == names[:2]
+    assert complete_filename(db_conn, 'NEXRAD', 'KBG', limit=3) == sorted(names)[:3]
+    assert complete_filename(db_conn, 'NEXRAD', 'KBGZ') == [] and complete_filename(db_conn, 'GOES', 'KBG') == []
+    plan = db_conn.execute("EXPLAIN QUERY PLAN SELECT DISTINCT filename FROM FILES WHERE dataset = ? AND filename >= ? AND filename < ? ORDER BY filename LIMIT 20",
+                           ('NEXRAD', 'KBG', 'KBH')).fetchall()
+    assert any('COVERING INDEX FILES_DATASET_FILENAME_INDEX' in step[3] for step in plan)
+    db_conn.close()
+
+def test_manifest_listing_falls_back_to_s3(tmp_path):
+
+    """Function to test that only folders listed into the manifest are answered from it, backfilled folders behind its mark are not"""
+
+    database_file_path = str(tmp_path / "listing.db")
+    db_conn = connect_database(database_file_path, 'write')
+    db_conn.executescript(MANIFEST_DDL)
+    db_conn.execute("INSERT INTO FILES (dataset, bucket, prefix, filename) VALUES ('NEXRAD', 'noaa-nexrad-level2', '2011/10/10/KBGM/', ?)", (fileNEXRAD1,))
+    write_high_water_mark(db_conn, 'FILES_NEXRAD', ('2011', '10', '11', 'KBGM'))
+    db_conn.commit()
+    db_conn.close()
+    assert list_files_from_manifest(database_file_path, 'NEXRAD', 'noaa-nexrad-level2', ('2011', '10', '10', 'KBGM')) == [fileNEXRAD1]
+    assert list_files_from_manifest(database_file_path, 'NEXRAD', 'noaa-nexrad-level2', ('2011', '06', '12', 'KBGM')) is None     #backfilled
+    assert list_files_from_manifest(database_file_path, 'NEXRAD', 'noaa-nexrad-level2', ('2011', '10', '11', 'KBGM')) is None     #newest folder
+
+def test_station_locator():
+
+    """Function to test the nearest, coverage and box lookups on station locations, with batched points"""
+
+    stations = pd.DataFrame({'ground_station': ['KBGM', 'KENX', 'KOKX', 'PHKI'], 'latitude': ['42.199694', '42.586556', '40.865528', '21.894167'],
+                             'longitude': ['-75.984722', '-74.064083', '-72.863917', '-159.552222']})
+    locator = StationLocator(stations)
+    codes, distances = locator.nearest([42.1, 40.7, 21.9], [-75.9, -74.0, -159.5], k=2)
+    assert codes[:, 0].tolist() == ['KBGM', 'KOKX', 'PHKI'] and codes[0, 1] == 'KENX'
+    assert abs(distances[1, 0] - 97.4) < 1    #Manhattan to Upton, NY
+    assert [code for code, _ in locator.covering(40.7, -74.0)[0]] == ['KOKX', 'KENX'] and locator.covering(30.0, -140.0) == [[]]    #KBGM is 235 km away
+    assert locator.in_box(40, 43, -76, -73)['ground_station'].tolist() == ['KBGM', 'KENX']
+    assert locator.in_box(20, 23, 170, -150)['ground_station'].tolist() == ['PHKI']
+    empty = StationLocator(stations.iloc[:0])   #before the station locations are scraped
+    codes, distances = empty.nearest([42.1, 40.7], [-75.9, -74.0], k=3)
+    assert codes.shape == (2, 0) and distances.shape == (2, 0)
+    assert empty.covering(40.7, -74.0) == [[]] and empty.in_box(40, 43, -76, -73).empty
+
+def test_stale_hierarchy_index_skipped(tmp_path):
+
+    """Function to test that an index built from an older generation is not used, nor its answers cached, until it is rebuilt"""
+
+    database_file_path = str(tmp_path / "stale.db")
+    db_conn = connect_database(database_file_path, 'write')
+    sql_script = read_ddl_script('sql_script_nexrad.sql')
+    key_columns = ['year', 'month', 'day', 'ground_station']
+    load_scraped_data([{'id': 1, 'year': '2023', 'month': '01', 'day': '01', 'ground_station': 'KABX'}], db_conn, sql_script, 'NEXRAD_METADATA', 100, None,
+                      'replace', key_columns, False)
+    db_conn.commit()
+    build_hierarchy_index(database_file_path)
+    rows = [{'id': number + 1, 'year': '2023', 'month': '01', 'day': day, 'ground_station': 'KABX'} for number, day in enumerate(('01', '02'))]
+    load_scraped_data(rows, db_conn, sql_script, 'NEXRAD_METADATA', 100, None, 'replace', key_columns, False)
+    db_conn.commit()
+    db_conn.close()
+    repository = MetadataRepository(database_file_path, check_seconds=0)
+    assert repository.nexrad_days('2023', '01') == ['01', '02']     #the index still holds the previous generation
+    assert repository.subtree('NEXRAD_METADATA', ('2023',)) == {'01': {'01': ['KABX'], '02': ['KABX']}}
+    assert refresh_hierarchy_index(database_file_path) is True
+    assert repository.nexrad_days('2023', '01') == ['01', '02'] and repository.cache_stats()['hits'] == 1
+
+def write_partition(partition_path, columns, rows):
+
+    """Function writes an archive partition file the way scrape_archive_shard does"""
+
+    db_conn = sqlite3.connect(partition_path)
+    db_conn.execute("CREATE TABLE ARCHIVE_METADATA (" + ", ".join(column + " TEXT" for column in columns) + ")")
+    db_conn.executemany("INSERT INTO ARCHIVE_METADATA VALUES (" + ", ".join("?" * len(columns)) + ")", rows)
+    db_conn.commit()
+    db_conn.close()
+    return partition_path
+
+def test_archive_merge_then_merge_load(tmp_path):
+
+    """Function to test that a full-archive merge keeps the normalized tables, so a normal merge load of the assignment's bucket runs after it"""
+
+    database_file_path = str(tmp_path / "archive.db")
+    goes_partitions = [write_partition(str(tmp_path / (bucket + ".db")), GOES_ARCHIVE_COLUMNS,
+                                       [(bucket, satellite, 'ABI-L1b-RadC', '2023', '001', hour) for hour in ('00', '01')])
+                       for bucket, satellite in (('noaa-goes16', 'GOES-16'), ('noaa-goes18', 'GOES-18'))]
+    nexrad_partition = write_partition(str(tmp_path / "nexrad.db"), NEXRAD_ARCHIVE_COLUMNS, [('noaa-nexrad-level2', 'NEXRAD', '2023', '01', '01', 'KABX')])
+    assert merge_archive_partitions(goes_partitions, database_file_path, 'GOES_METADATA', GOES_ARCHIVE_COLUMNS) == 4
+    assert merge_archive_partitions([nexrad_partition], database_file_path, 'NEXRAD_METADATA', NEXRAD_ARCHIVE_COLUMNS) == 1
+
+    db_conn = connect_database(database_file_path, 'write')
+    assert db_conn.execute("SELECT type FROM sqlite_master WHERE name = 'GOES_METADATA'").fetchone() == ('view',)
+    assert db_conn.execute("SELECT id, year, month, day, ground_station FROM NEXRAD_METADATA").fetchall() == [(1, 2023, 1, 1, 'KABX')]
+    rows = [{'id': 0, 'product': 'ABI-L1b-RadC', 'year': '2023', 'day': '001', 'hour': hour} for hour in ('01', '02')]
+    merge_counts = load_scraped_data(rows, db_conn, read_ddl_script('sql_script_goes18.sql'), 'GOES_METADATA', 100, None, 'merge',
+                                     ['product', 'year', 'day', 'hour'], True)
+    db_conn.commit()
+    assert merge_counts == {'inserted': 1, 'unchanged': 1, 'deleted': 1}     #only the folders of the assignment's bucket are compared
+    assert db_conn.execute("SELECT satellite, hour FROM GOES_METADATA ORDER BY id").fetchall() == [('GOES-16', 0), ('GOES-16', 1), ('GOES-18', 1), ('GOES-18', 2)]
+    assert newest_key_in_table(db_conn, 'GOES_METADATA', ['product', 'year', 'day', 'hour']) == ('ABI-L1b-RadC', '2023', '001', '02')
+    db_conn.close()
+
+def test_merge_archive_into_normalized_table(tmp_path):
+
+    """Function to test that an archive merge replaces the rows of a table that already has the normalized schema, keeping its product dimension"""
+
+    database_file_path = str(tmp_path / "normalized.db")
+    db_conn = connect_database(database_file_path, 'write')
+    sql_script = read_ddl_script('sql_script_goes18.sql')
+    prepare_table(db_conn, sql_script, 'GOES_METADATA')
+    merge_rows_into_table([{'id': 0, 'product': 'ABI-L1b-RadC', 'year': '2021', 'day': '001', 'hour': '00'}], db_conn, 'GOES_METADATA',
+                          ['product', 'year', 'day', 'hour'])
+    db_conn.close()
+    partition = write_partition(str(tmp_path / "partition.db"), GOES_ARCHIVE_COLUMNS,
+                                [('noaa-goes18', 'GOES-18', 'ABI-L1b-RadC', '2023', '001', '00'), ('noaa-goes16', 'GOES-16', 'ABI-L1b-RadC', '2023', '001', '00')])
+    assert merge_archive_partitions([partition], database_file_path, 'GOES_METADATA', GOES_ARCHIVE_COLUMNS) == 2
+
+    db_conn = connect_database(database_file_path, 'write')
+    assert db_conn.execute("SELECT id, satellite, year FROM GOES_METADATA ORDER BY id").fetchall() == [(1, 'GOES-18', 2023), (2, 'GOES-16', 2023)]
+    assert db_conn.execute("SELECT product_id, bucket FROM GOES_PRODUCT ORDER BY product_id").fetchall() == [(1, 'noaa-goes18'), (2, 'noaa-goes16')]
+    assert read_generation(db_conn, 'GOES_METADATA') == 2     #the merge, then the swap
+    prepare_table(db_conn, sql_script, 'GOES_METADATA')     #the schema is still the declared one
+    db_conn.close()
+
+def test_goes_cascade_limited_to_assignment_bucket(tmp_path):
+
+    """Function to test that the GOES dropdowns and the hierarchy index only show the folders of the assignment's bucket after a full-archive merge"""
+
+    database_file_path = str(tmp_path / "buckets.db")
+    partition = write_partition(str(tmp_path / "partition.db"), GOES_ARCHIVE_COLUMNS,
+                                [('noaa-goes18', 'GOES-18', 'ABI-L1b-RadC', '2023', '001', '00'), ('noaa-goes16', 'GOES-16', 'ABI-L1b-RadC', '2019', '001', '00'),
+                                 ('noaa-goes16', 'GOES-16', 'ABI-L1b-RadF', '2019', '002', '03'), ('noaa-goes16', 'GOES-16', 'ABI-L1b-RadC', '2023', '001', '05')])
+    assert merge_archive_partitions([partition], database_file_path, 'GOES_METADATA', GOES_ARCHIVE_COLUMNS) == 4
+    repository = MetadataRepository(database_file_path, check_seconds=0)
+    for lookups in range(2):    #from the database, then from the hierarchy index
+        assert repository.read_children('GOES_METADATA', ()) == ['ABI-L1b-RadC']
+        assert repository.read_children('GOES_METADATA', ('ABI-L1b-RadC',)) == ['2023']
+        assert repository.read_children('GOES_METADATA', ('ABI-L1b-RadC', '2023', '001')) == ['00']
+        assert repository.read_subtree('GOES_METADATA', ('ABI-L1b-RadC',)) == {'2023': {'001': ['00']}}
+        assert repository.read_subtree('GOES_METADATA', ('ABI-L1b-RadF',)) == {}
+        build_hierarchy_index(database_file_path)
+
+def test_merge_is_one_transaction(tmp_path):
+
+    """Function to test that a merge streams the scrape and commits its rows together with the generation bump, or neither"""
+
+    db_conn = connect_database(str(tmp_path / "stream.db"), 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA')
+    key_columns = ['year', 'month', 'day', 'ground_station']
+
+    def scraped_rows(fail_after=None):
+        for number in range(3):
+            if number == fail_after:
+                raise ConnectionError("listing failed")
+            yield {'id': 0, 'year': '2023', 'month': '01', 'day': '0' + str(number + 1), 'ground_station': 'KABX'}
+
+    try:
+        merge_rows_into_table(scraped_rows(fail_after=2), db_conn, 'NEXRAD_METADATA', key_columns)
+        assert False, "the failed scrape must not be merged"
+    except ConnectionError:
+        pass
+    assert db_conn.execute("SELECT COUNT(*) FROM NEXRAD_METADATA").fetchone()[0] == 0 and read_generation(db_conn, 'NEXRAD_METADATA') == 0
+    assert merge_rows_into_table(scraped_rows(), db_conn, 'NEXRAD_METADATA', key_columns) == {'inserted': 3, 'unchanged': 0, 'deleted': 0}
+    assert read_generation(db_conn, 'NEXRAD_METADATA') == 1
+    assert merge_rows_into_table(scraped_rows(), db_conn, 'NEXRAD_METADATA', key_columns) == {'inserted': 0, 'unchanged': 3, 'deleted': 0}
+    assert read_generation(db_conn, 'NEXRAD_METADATA') == 1     #nothing changed, nothing to invalidate
+    db_conn.close()
+
+def test_queue_merge_refuses_failed_items(tmp_path):
+
+    """Function to test that a queue with a failed item is not merged, since the merge would drop that item's folders from the tables"""
+
+    queue_file_path = str(tmp_path / "queue.db")
+    database_file_path = str(tmp_path / "queue_merge.db")
+    shards = [{'dataset': 'NEXRAD', 'bucket': 'noaa-nexrad-level2', 'satellite': 'NEXRAD', 'root': year + '/', 'depth': 3} for year in ('2022', '2023')]
+    seed_work_queue(queue_file_path, shards)
+    db_conn = connect_queue(queue_file_path)
+    item = lease_work(db_conn, 'worker')
+    assert complete_work(db_conn, item['id'], 'worker', [('noaa-nexrad-level2', 'NEXRAD', '2022', '01', '01', 'KABX')])
+    for attempt in range(MAX_ATTEMPTS):     #every lease of the other item expires
+        assert lease_work(db_conn, 'worker', lease_seconds=-1)['root'] == '2023/'
+    assert lease_work(db_conn, 'worker') is None
+    db_conn.close()
+    assert queue_progress(queue_file_path) == {'pending': 0, 'leased': 0, 'done': 1, 'failed': 1}
+
+    db_conn = connect_database(database_file_path, 'write')
+    prepare_table(db_conn, read_ddl_script('sql_script_nexrad.sql'), 'NEXRAD_METADATA')
+    merge_rows_into_table([{'id': 0, 'year': '2023', 'month': '01', 'day': '01', 'ground_station': 'KABX'}], db_conn, 'NEXRAD_METADATA',
+                          ['year', 'month', 'day', 'ground_station'])
+    db_conn.close()
+    try:
+        merge_work_results(queue_file_path, database_file_path, 'GOES_METADATA', 'NEXRAD_METADATA')
+        assert False, "a queue with failed items must not be merged"
+    except ValueError as error:
+        assert 'noaa-nexrad-level2/2023/' in str(error) and 'noaa-nexrad-level2/2022/' not in str(error)
+    db_conn = connect_database(database_file_path, 'read')
+    assert db_conn.execute("SELECT year, ground_station FROM NEXRAD_METADATA").fetchall() == [(2023, 'KABX')]     #the 2023 folders are kept
+    db_conn.close()
+
+    assert merge_work_results(queue_file_path, database_file_path, 'GOES_METADATA', 'NEXRAD_METADATA', allow_failed=True) == {'NEXRAD_METADATA': 1}
+    db_conn = connect_database(database_file_path, 'read')
+    assert db_conn.execute("SELECT year, ground_station FROM NEXRAD_METADATA").fetchall() == [(2022, 'KABX')]
+    db_conn.close()